@@ -0,0 +1,161 @@
+"""
+Scheduled journal backups with retention
+
+Backups are named after their journal, a short hash of its full path so
+journals sharing a file name in different directories keep apart, and the
+UTC time they were taken, e.g. ``journal-1a2b3c4d-20200620T120000Z.db``, so
+the newest one tells when the next is due even across restarts.
+"""
+
+from concurrent.futures import Executor, Future
+from datetime import datetime, timedelta, timezone
+import hashlib
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Set, Tuple
+
+from .core import Journal
+from .scheduler import Timer, utc_now
+
+
+TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+def _backup_prefix(db_path: Path) -> str:
+    key = hashlib.sha1(str(db_path.resolve()).encode()).hexdigest()[:8]
+    return f"{db_path.stem}-{key}-"
+
+
+def backup_path(directory: Path, db_path: Path, time: datetime) -> Path:
+    return (
+        directory
+        / f"{_backup_prefix(db_path)}{time.astimezone(timezone.utc).strftime(TIME_FORMAT)}.db"
+    )
+
+
+def list_backups(directory: Path, db_path: Path) -> List[Tuple[datetime, Path]]:
+    """ Find the backups of a journal, newest first """
+    backups = []
+    prefix = _backup_prefix(db_path)
+    for path in directory.glob(f"{prefix}*.db"):
+        try:
+            time = datetime.strptime(path.stem[len(prefix) :], TIME_FORMAT)
+        except ValueError:
+            continue
+        backups.append((time.replace(tzinfo=timezone.utc), path))
+    return sorted(backups, reverse=True)
+
+
+def prune_backups(
+    directory: Path, db_path: Path, keep_daily: int = 7, keep_weekly: int = 4
+) -> List[Path]:
+    """
+    Delete old backups of a journal, returning the ones deleted
+
+    The newest backup of each of the last keep_daily days with backups is
+    kept, and likewise for the last keep_weekly weeks.
+    """
+    days: Set[Tuple[int, int, int]] = set()
+    weeks: Set[Tuple[int, int]] = set()
+    deleted = []
+    for time, path in list_backups(directory, db_path):
+        day = (time.year, time.month, time.day)
+        week = time.isocalendar()[:2]
+        keep = False
+        if day not in days and len(days) < keep_daily:
+            days.add(day)
+            keep = True
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.add(week)
+            keep = True
+        if not keep:
+            path.unlink()
+            deleted.append(path)
+    return deleted
+
+
+class BackupScheduler:
+    """
+    Back up a journal every interval and prune the old backups
+
+    Backups run on the executor if one is given, e.g. a worker thread so
+    the main loop is never blocked, and otherwise right away.
+    """
+
+    # longest single wait, so far-off deadlines never overflow timer intervals
+    max_delay = 24 * 60 * 60
+
+    def __init__(
+        self,
+        journal: Journal,
+        directory: Path,
+        timer: Timer,
+        interval: timedelta = timedelta(days=1),
+        keep_daily: int = 7,
+        keep_weekly: int = 4,
+        executor: Optional[Executor] = None,
+        clock: Callable[[], datetime] = utc_now,
+    ):
+        if journal.path is None:
+            raise ValueError("Only journal files can be backed up on a schedule")
+        self._journal = journal
+        self._db_path = journal.path
+        self._directory = directory
+        self._timer = timer
+        self._interval = interval
+        self._keep_daily = keep_daily
+        self._keep_weekly = keep_weekly
+        self._executor = executor
+        self._clock = clock
+        self._running = False
+
+    @property
+    def next_deadline(self) -> datetime:
+        backups = list_backups(self._directory, self._db_path)
+        if not backups:
+            return self._clock()
+        return backups[0][0] + self._interval
+
+    def start(self) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._running = True
+        self._arm(self.next_deadline)
+
+    def stop(self) -> None:
+        if self._running:
+            self._timer.cancel()
+            self._running = False
+
+    def run_now(self) -> Optional[Future]:
+        """ Back up the journal, returning the pending backup if on an executor """
+        dest = backup_path(self._directory, self._db_path, self._clock())
+        if self._executor is None:
+            self._back_up(dest)
+            return None
+        future = self._executor.submit(self._back_up, dest)
+        future.add_done_callback(self._on_backup_done)
+        return future
+
+    def _back_up(self, dest: Path) -> None:
+        self._journal.backup(dest)
+        prune_backups(
+            self._directory, self._db_path, self._keep_daily, self._keep_weekly
+        )
+
+    def _on_backup_done(self, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Could not back up journal '{self._db_path}': {error}")
+
+    def _arm(self, deadline: datetime) -> None:
+        delay = (deadline - self._clock()).total_seconds()
+        self._timer.arm(min(max(delay, 0), self.max_delay), self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        now = self._clock()
+        deadline = self.next_deadline
+        if deadline <= now:
+            self.run_now()
+            deadline = now + self._interval
+        if self._running:
+            self._arm(deadline)
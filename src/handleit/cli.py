@@ -0,0 +1,333 @@
+"""
+Command line interface to journals, without the GUI
+
+    handleit-cli -j journal.db add "Buy flour" --priority 2 --tag baking
+    handleit-cli -j journal.db list --sort due
+    handleit-cli -j journal.db batch < commands.txt
+
+Tasks are printed one per line as tab-separated ID, an x if completed, and
+description, and imports as how many records of each type were added. The
+batch command reads one command per line from standard input, quoted like a
+shell would, and runs them all in one transaction, so either every command
+takes effect or none does. Nothing here imports PyGObject, and the file
+formats are only imported when used, to keep the startup fast enough for
+shell loops. Errors, including a journal another process keeps locked, are
+reported on standard error with a non-zero exit status.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import importlib
+import os
+from pathlib import Path
+import shlex
+import sqlite3
+import sys
+from typing import Iterable, List, Optional, TextIO, Union
+
+from .core import CoreTaskList, Journal, SortSpec, Task
+
+
+# file formats by the module under handleit.io reading them, with the file
+# suffixes they're recognized by
+FORMATS = {
+    "jsonl": (".jsonl", ".ndjson"),
+    "csv": (".csv",),
+    "ical": (".ics", ".ical"),
+    "todotxt": (".txt",),
+    "taskwarrior": (".json",),
+}
+
+# formats that can be written as well as read
+EXPORT_FORMATS = ("jsonl", "csv", "ical")
+
+_CORE_LISTS = {
+    "pending": CoreTaskList.PENDING,
+    "completed": CoreTaskList.COMPLETED,
+    "trash": CoreTaskList.TRASH,
+}
+
+
+class CommandError(Exception):
+    pass
+
+
+class _HelpFormatter(argparse.HelpFormatter):
+    """ Fit help to the terminal like argparse does, without importing shutil for every argument added """
+
+    def __init__(self, prog: str) -> None:
+        try:
+            width = os.get_terminal_size().columns
+        except OSError:
+            width = 80
+        super().__init__(prog, width=width - 2)
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """ Raise usage errors rather than exit, so one bad batch line doesn't end the process mid-transaction """
+
+    def __init__(self, **kwargs) -> None:
+        kwargs.setdefault("formatter_class", _HelpFormatter)
+        super().__init__(**kwargs)
+
+    def error(self, message: str):
+        raise CommandError(message)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = _ArgumentParser(
+        prog="handleit-cli", description="Manage a HandleIt journal"
+    )
+    parser.add_argument(
+        "-j",
+        "--journal",
+        default=os.environ.get("HANDLEIT_JOURNAL"),
+        help="journal file, $HANDLEIT_JOURNAL by default",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    list_parser = commands.add_parser("list", help="print the tasks of a list")
+    list_parser.add_argument(
+        "list",
+        nargs="?",
+        default="pending",
+        help="pending (default), completed, trash, or a list's name or ID",
+    )
+    list_parser.add_argument(
+        "--filter", help="print the tasks matching a filter instead"
+    )
+    list_parser.add_argument(
+        "--sort",
+        type=SortSpec.parse,
+        help="e.g. due, or --sort=-priority for highest first",
+    )
+    list_parser.add_argument("--limit", type=int)
+
+    add_parser = commands.add_parser("add", help="add a task and print its ID")
+    add_parser.add_argument("description")
+    add_parser.add_argument("--notes")
+    add_parser.add_argument("--priority", type=int, default=0)
+    add_parser.add_argument("--due", type=_parse_time, help="ISO date or time")
+    add_parser.add_argument("--start", type=_parse_time, help="ISO date or time")
+    add_parser.add_argument("--tag", action="append", dest="tags", default=[])
+    add_parser.add_argument(
+        "--list", action="append", dest="lists", default=[], help="list name or ID"
+    )
+
+    complete_parser = commands.add_parser("complete", help="mark tasks completed")
+    complete_parser.add_argument("task_ids", type=int, nargs="+", metavar="TASK_ID")
+
+    search_parser = commands.add_parser(
+        "search", help="print the tasks whose description or notes contain a text"
+    )
+    search_parser.add_argument("text")
+    search_parser.add_argument(
+        "--archived", action="store_true", help="search the archive too"
+    )
+
+    count_parser = commands.add_parser("count", help="print how many tasks a list has")
+    count_parser.add_argument("list", nargs="?", default="pending")
+
+    export_parser = commands.add_parser("export", help="write the whole journal")
+    export_parser.add_argument("file", nargs="?", help="standard output if not given")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS)
+
+    import_parser = commands.add_parser("import", help="add the tasks of a file")
+    import_parser.add_argument("file", nargs="?", help="standard input if not given")
+    import_parser.add_argument("--format", choices=tuple(FORMATS))
+
+    commands.add_parser(
+        "batch", help="run commands read from standard input in one transaction"
+    )
+    return parser
+
+
+def _parse_time(text: str) -> datetime:
+    """ Parse an ISO date or time, in local time unless it has an offset """
+    try:
+        time = datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{text}'") from None
+    return time.astimezone(timezone.utc)
+
+
+def _file_format(
+    path: Optional[str], given: Optional[str], choices: Iterable[str]
+) -> str:
+    if given is not None:
+        return given
+    if path is not None:
+        suffix = Path(path).suffix.lower()
+        for name in choices:
+            if suffix in FORMATS[name]:
+                return name
+    if path is None:
+        return "jsonl"
+    raise CommandError(f"Can't tell the format of '{path}', give one with --format")
+
+
+def _resolve_list(journal: Journal, name: str) -> Union[CoreTaskList, int]:
+    if name in _CORE_LISTS:
+        return _CORE_LISTS[name]
+    for task_list in journal.lists:
+        if task_list.name == name or str(task_list.list_id) == name:
+            return task_list.list_id
+    raise CommandError(f"No list '{name}'")
+
+
+def _user_list(journal: Journal, name: str) -> int:
+    list_id = _resolve_list(journal, name)
+    if isinstance(list_id, CoreTaskList):
+        raise CommandError(f"Tasks can't be added to the {name} list")
+    return list_id
+
+
+def _print_tasks(tasks: Iterable[Task], stdout: TextIO) -> None:
+    for task in tasks:
+        done = "x" if task.completion_time is not None else " "
+        stdout.write(f"{task.task_id}\t{done}\t{task.description}\n")
+
+
+def _add_task(journal: Journal, args: argparse.Namespace, list_ids: List[int]) -> int:
+    with journal.transaction():
+        task_id = journal.add_task(
+            args.description,
+            notes=args.notes,
+            priority=args.priority,
+            due_time=args.due,
+            start_time=args.start,
+        )
+        for tag in args.tags:
+            journal.add_task_tag(task_id, tag)
+        for list_id in list_ids:
+            journal.add_task_to_list(task_id, list_id)
+    return task_id
+
+
+def _complete_tasks(journal: Journal, task_ids: List[int]) -> None:
+    now = datetime.now(timezone.utc)
+    with journal.transaction():
+        for task_id in task_ids:
+            if journal.get_task(task_id) is None:
+                raise CommandError(f"No task {task_id}")
+            journal.update_task(task_id, new_completion_time=now)
+
+
+def run_command(
+    journal: Journal, args: argparse.Namespace, stdin: TextIO, stdout: TextIO
+) -> None:
+    """ Run one parsed command other than batch against an open journal """
+    if args.command == "list":
+        if args.filter is not None:
+            try:
+                tasks = journal.get_filter_tasks(
+                    args.filter, sort=args.sort, limit=args.limit
+                )
+            except ValueError as e:
+                raise CommandError(str(e)) from None
+        else:
+            tasks = journal.get_list_tasks(
+                _resolve_list(journal, args.list), args.sort, limit=args.limit
+            )
+        _print_tasks(tasks, stdout)
+    elif args.command == "add":
+        list_ids = [_user_list(journal, name) for name in args.lists]
+        task_id = journal.retrying(_add_task, journal, args, list_ids)
+        stdout.write(f"{task_id}\n")
+    elif args.command == "complete":
+        journal.retrying(_complete_tasks, journal, args.task_ids)
+    elif args.command == "search":
+        _print_tasks(
+            journal.search_tasks(args.text, include_archived=args.archived), stdout
+        )
+    elif args.command == "count":
+        stdout.write(f"{journal.get_list_count(_resolve_list(journal, args.list))}\n")
+    elif args.command == "export":
+        name = _file_format(args.file, args.format, EXPORT_FORMATS)
+        export = getattr(
+            importlib.import_module(f".io.{name}", __package__), f"export_{name}"
+        )
+        if args.file is None:
+            export(journal, stdout)
+        else:
+            with open(args.file, "w", encoding="utf-8", newline="") as fp:
+                export(journal, fp)
+    elif args.command == "import":
+        name = _file_format(args.file, args.format, FORMATS)
+        read = getattr(
+            importlib.import_module(f".io.{name}", __package__), f"import_{name}"
+        )
+        try:
+            if args.file is None:
+                counts = read(journal, stdin)
+            else:
+                with open(args.file, encoding="utf-8", newline="") as fp:
+                    counts = read(journal, fp)
+        except ValueError as e:
+            raise CommandError(str(e)) from None
+        for kind, count in counts.items():
+            stdout.write(f"{kind}\t{count}\n")
+    else:
+        raise CommandError(f"'{args.command}' can't be run here")
+
+
+def run_batch(
+    journal: Journal,
+    parser: argparse.ArgumentParser,
+    lines: Iterable[str],
+    stdout: TextIO,
+) -> int:
+    """ Run a command per line in one transaction, returning how many ran """
+    count = 0
+    with journal.transaction():
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command == "batch" or (
+                    args.command == "import" and args.file is None
+                ):
+                    raise CommandError("Standard input is already being read")
+                run_command(journal, args, sys.stdin, stdout)
+            except (CommandError, ValueError) as e:
+                raise CommandError(f"Line {line_number}: {e}") from None
+            count += 1
+    return count
+
+
+def main(
+    argv: Optional[List[str]] = None,
+    stdin: TextIO = sys.stdin,
+    stdout: TextIO = sys.stdout,
+) -> int:
+    parser = _parser()
+    try:
+        args = parser.parse_args(argv)
+        if args.journal is None:
+            raise CommandError(
+                "No journal given, use --journal or set HANDLEIT_JOURNAL"
+            )
+        if not Path(args.journal).is_file():
+            raise CommandError(f"No journal at '{args.journal}'")
+        journal = Journal(Path(args.journal))
+        try:
+            if args.command == "batch":
+                run_batch(journal, parser, stdin, stdout)
+            else:
+                run_command(journal, args, stdin, stdout)
+        finally:
+            journal.close()
+    except (CommandError, ValueError) as e:
+        print(f"handleit-cli: {e}", file=sys.stderr)
+        return 2
+    except sqlite3.OperationalError as e:
+        print(f"handleit-cli: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
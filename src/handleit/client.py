@@ -0,0 +1,181 @@
+"""
+Clients of a journal server (see handleit.server)
+
+JournalClient makes one call at a time and waits for its result. The load
+test opens many connections at once and measures how many requests per
+second the server answers:
+
+    python3 -m handleit.client /run/user/1000/handleit/journal.sock --clients 16
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+from pathlib import Path
+import random
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional, Union
+
+
+class RemoteError(Exception):
+    """ An error response from the server """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class JournalClient:
+    """ A blocking connection to a journal server """
+
+    def __init__(self, path: Union[str, Path]):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(path))
+        self._file = self._socket.makefile("rwb")
+        self._ids = itertools.count(1)
+
+    def call(self, method: str, **params) -> Any:
+        """ Call a method with parameters by name, returning its result """
+        request = {
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": method,
+            "params": params,
+        }
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RemoteError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> "JournalClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def _stats(path: Path) -> Dict[str, int]:
+    reader, writer = await asyncio.open_unix_connection(str(path))
+    try:
+        writer.write(b'{"jsonrpc": "2.0", "id": 0, "method": "stats"}\n')
+        return json.loads(await reader.readline())["result"]
+    finally:
+        writer.close()
+
+
+async def _run_client(
+    path: Path, n_requests: int, write_ratio: float, rng: random.Random
+) -> List[float]:
+    """ Send requests one after another on one connection, returning their latencies """
+    reader, writer = await asyncio.open_unix_connection(str(path))
+    latencies = []
+    try:
+        for request_id in range(n_requests):
+            if rng.random() < write_ratio:
+                method: str = "add_task"
+                params: Dict[str, Any] = {"description": f"Load test {rng.random()}"}
+            else:
+                method, params = rng.choice(
+                    [
+                        ("count", {"list": "pending"}),
+                        ("list_tasks", {"list": "pending", "limit": 20}),
+                        ("search", {"text": "Task 1"}),
+                    ]
+                )
+            request = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": method,
+                "params": params,
+            }
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b"\n")
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if "error" in response:
+                raise RemoteError(
+                    response["error"]["code"], response["error"]["message"]
+                )
+    finally:
+        writer.close()
+    return latencies
+
+
+async def load_test(
+    path: Path,
+    n_clients: int = 8,
+    n_requests: int = 500,
+    write_ratio: float = 0.2,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    Have clients send requests at once, a write_ratio of them adding tasks
+
+    Returns the requests answered per second, the median and 99th
+    percentile latency in seconds, and how many writes the server made per
+    commit over the test.
+    """
+    rng = random.Random(seed)
+    before = await _stats(path)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            _run_client(path, n_requests, write_ratio, random.Random(rng.random()))
+            for _ in range(n_clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    after = await _stats(path)
+
+    latencies = sorted(latency for result in results for latency in result)
+    commits = after["commits"] - before["commits"]
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "median_latency": latencies[len(latencies) // 2],
+        "p99_latency": latencies[int(len(latencies) * 0.99)],
+        "writes_per_commit": (after["writes"] - before["writes"]) / commits
+        if commits
+        else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m handleit.client",
+        description="Load test a journal server, adding tasks to its journal",
+    )
+    parser.add_argument("socket", type=Path)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="per client")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    try:
+        results = asyncio.run(
+            load_test(args.socket, args.clients, args.requests, args.write_ratio)
+        )
+    except (ConnectionError, FileNotFoundError, RemoteError) as e:
+        print(f"Load test failed: {e}", file=sys.stderr)
+        return 1
+    print(f"{results['requests_per_second']:.0f} requests/s")
+    print(
+        f"latency: median {results['median_latency'] * 1000:.2f} ms, "
+        f"99th percentile {results['p99_latency'] * 1000:.2f} ms"
+    )
+    print(f"{results['writes_per_commit']:.1f} writes per commit")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
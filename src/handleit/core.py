@@ -1,14 +1,53 @@
-import builtins
-from collections import defaultdict
-from datetime import datetime, timezone
+from collections import defaultdict, deque
+import contextlib
+from datetime import datetime, timedelta, timezone
 import enum
+import json
+import os
 from pathlib import Path
+import random
 import sqlite3
-from typing import Optional, List, Union, Dict, Any, Set, overload
-
+import threading
+import time
+from typing import (
+    Optional,
+    List,
+    Union,
+    Dict,
+    Any,
+    Set,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Tuple,
+    Deque,
+    TypeVar,
+    overload,
+)
+
+from .io.sqlite import (
+    ARCHIVE_TABLES,
+    ATTRIBUTE_VALUE_COLUMNS,
+    CASCADING_TABLES,
+    CHANGE_LOG_TABLES,
+    SQL_MAX_TASK_ID,
+    SQL_NEW_UID,
+    UID_TABLES,
+    attach_archive,
+    datetime_to_epoch,
+    epoch_to_datetime,
+    sql_change_key,
+    sql_insert_changes,
+    upgrade_database,
+)
+from .query import compile_filter
 
 TaskAttribute = Union[str, int, float, bool]
 
+_T = TypeVar("_T")
+
 
 @enum.unique
 class CoreTaskList(enum.Enum):
@@ -17,12 +56,121 @@ class CoreTaskList(enum.Enum):
     TRASH = -3
 
 
+def encode_list_id(list_id: Union[CoreTaskList, int]) -> int:
+    """ Flatten a list ID to an integer, where core lists are negative """
+    return list_id.value if isinstance(list_id, CoreTaskList) else list_id
+
+
+def decode_list_id(value: int) -> Union[CoreTaskList, int]:
+    """ Inverse of encode_list_id, falling back to Pending for unknown core lists """
+    if value >= 0:
+        return value
+    try:
+        return CoreTaskList(value)
+    except ValueError:
+        return CoreTaskList.PENDING
+
+
 @enum.unique
 class TaskRelationship(enum.Enum):
     PARENT = "parent_of"
     DEPENDENCY = "blocked_by"
 
 
+@enum.unique
+class TaskSort(enum.Enum):
+    POSITION = "position"
+    PRIORITY = "priority"
+    DUE = "due"
+    START = "start"
+    CREATED = "created"
+    COMPLETED = "completed"
+    DESCRIPTION = "description"
+
+
+class SortSpec(NamedTuple):
+    """
+    How to order the tasks of a list
+
+    Ties are broken by position. Tasks without the sorted-by time come last
+    in ascending order; descending order is the exact reverse.
+    """
+
+    key: TaskSort = TaskSort.POSITION
+    descending: bool = False
+
+    def __str__(self) -> str:
+        return ("-" if self.descending else "") + self.key.value
+
+    @staticmethod
+    def parse(value: str) -> "SortSpec":
+        """ Inverse of str(), e.g. "-priority" for highest priority first """
+        descending = value.startswith("-")
+        try:
+            return SortSpec(TaskSort(value.lstrip("-")), descending)
+        except ValueError:
+            raise ValueError(f"Invalid sort '{value}'") from None
+
+
+@enum.unique
+class ReminderKind(enum.Enum):
+    DUE = "due"
+    NOTIFICATION = "notification"
+
+
+Reminder = Tuple[datetime, int, ReminderKind]
+
+# a list, tag, view, task, or relation as exported by Journal.export_records
+Record = Dict[str, Any]
+
+
+@enum.unique
+class ChangeOperation(enum.Enum):
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class Change(NamedTuple):
+    """
+    A row inserted, updated, or deleted, as recorded in the change log
+
+    Rows are keyed by the uids of the tasks, lists, tags, and views they
+    belong to rather than their IDs, which differ between journals. data
+    holds the new values of the changed columns and old their values
+    before, with every column for inserts and deletes respectively.
+    """
+
+    seq: int
+    origin: str
+    # UTC microseconds since the epoch, always increasing within a journal
+    timestamp: int
+    table: str
+    key: Tuple[Any, ...]
+    operation: ChangeOperation
+    data: Optional[Dict[str, Any]] = None
+    old: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def from_sqlite_row(row: sqlite3.Row) -> "Change":
+        return Change(
+            row["seq"],
+            row["origin"],
+            row["changed_ts"],
+            row["table_name"],
+            tuple(json.loads(row["row_key"])),
+            ChangeOperation(row["operation"]),
+            json.loads(row["data"]) if row["data"] is not None else None,
+            json.loads(row["old_data"]) if row["old_data"] is not None else None,
+        )
+
+
+@enum.unique
+class AgendaField(enum.Enum):
+    DUE = "due"
+    START = "start"
+
+
 class Task:
     def __init__(
         self,
@@ -43,6 +191,7 @@ class Task:
         parent: Optional[int] = None,
         dependencies: Optional[List[int]] = None,
         dependents: Optional[List[int]] = None,
+        archived: bool = False,
     ) -> None:
         self.task_id = task_id
         self.position = position
@@ -63,6 +212,7 @@ class Task:
         self._parent = parent
         self._dependencies = dependencies if dependencies is not None else []
         self._dependents = dependents if dependents is not None else []
+        self.archived = archived
 
     @property
     def lists(self):
@@ -100,16 +250,34 @@ class Task:
             row["description"],
             row["notes"],
             int(row["priority"]),
-            datetime.fromisoformat(row["creation_dtm"]),
-            datetime.fromisoformat(row["completion_dtm"])
-            if row["completion_dtm"]
-            else None,
-            datetime.fromisoformat(row["due_dtm"]) if row["due_dtm"] else None,
-            datetime.fromisoformat(row["start_dtm"]) if row["start_dtm"] else None,
+            _row_time(row, "creation"),
+            _row_time(row, "completion"),
+            _row_time(row, "due"),
+            _row_time(row, "start"),
             bool(row["is_trashed"]),
+            archived="archived" in row.keys() and bool(row["archived"]),
         )
 
 
+def _row_time(row: sqlite3.Row, name: str) -> Optional[datetime]:
+    """
+    Read a task time from its UTC epoch column, or its ISO text if unparsed
+
+    Times stored without an offset, like date-only ones, stay naive, to be
+    taken as local time wherever they're shown.
+    """
+    text = row[f"{name}_dtm"]
+    epoch = row[f"{name}_ts"]
+    if epoch is not None and (text is None or _has_offset(text)):
+        return epoch_to_datetime(epoch)
+    return datetime.fromisoformat(text) if text else None
+
+
+def _has_offset(text: str) -> bool:
+    """ Whether an ISO time ends in a UTC offset, without parsing it """
+    return len(text) > 10 and (text[-1] == "Z" or text[-6] in "+-")
+
+
 class TaskTag:
     def __init__(self, tag_id: int, name: str, color: str):
         self.tag_id = tag_id
@@ -133,44 +301,342 @@ class TaskList:
         return TaskList(row["list_id"], row["name"], row["icon"], row["position"])
 
 
+class SavedView:
+    """ A named filter, shown like a list """
+
+    def __init__(
+        self, view_id: int, name: str, icon: Optional[str], query: str, position: int
+    ):
+        self.view_id = view_id
+        self.name = name
+        self.icon = icon
+        self.query = query
+        self.position = position
+
+    @staticmethod
+    def from_sqlite_row(row: sqlite3.Row) -> "SavedView":
+        return SavedView(
+            row["view_id"], row["name"], row["icon"], row["query"], row["position"]
+        )
+
+
+class JournalOverview:
+    """ Everything needed to draw the sidebar and one list's tasks """
+
+    def __init__(
+        self,
+        lists: List[TaskList],
+        counts: Dict[Union[CoreTaskList, int], int],
+        list_id: Union[CoreTaskList, int],
+        tasks: List[Task],
+    ):
+        self.lists = lists
+        self.counts = counts
+        self.list_id = list_id
+        self.tasks = tasks
+
+
+class AgendaBucket:
+    """
+    Pending tasks whose due (or start) time falls within [start, end)
+
+    The first bucket of an agenda has no start and holds every task from
+    before the agenda itself starts, i.e. overdue ones.
+    """
+
+    def __init__(
+        self,
+        start: Optional[datetime],
+        end: datetime,
+        count: int = 0,
+        tasks: Optional[List[Task]] = None,
+    ):
+        self.start = start
+        self.end = end
+        self.count = count
+        self.tasks = tasks if tasks is not None else []
+
+
 class Journal:
 
     _valid_attribute_types = {"str", "int", "float", "bool"}
 
-    def __init__(self, db_path: Union[Path, sqlite3.Connection]):
+    # spacing of the positions given to new tasks and lists
+    position_gap = 1 << 16
+
+    # how many changes back undo reaches
+    undo_limit = 100
+
+    # how many times retrying calls a mutation while the journal is locked,
+    # and the mean wait in seconds before the first retry, doubling after
+    busy_retries = 4
+    retry_delay = 0.05
+
+    def __init__(
+        self,
+        db_path: Union[Path, sqlite3.Connection],
+        busy_timeout: float = 5.0,
+        concurrent_reads: bool = False,
+    ):
+        """
+        Open a journal file, or use a connection as it is
+
+        busy_timeout is how many seconds to wait for another connection
+        holding the journal's lock before giving up on a query. Journals
+        are written from the thread opening them, but with concurrent_reads
+        set any other thread can read them too, through a read-only
+        connection of its own. The file is then put in WAL mode, so readers
+        don't wait on the writer or on each other; they see what was last
+        committed, while the journal's own thread also sees what it hasn't.
+        """
         if isinstance(db_path, sqlite3.Connection):
-            self._conn = db_path
+            self._writer = db_path
+            # the file behind the connection, or an empty string in memory
+            file_name = self._writer.execute("PRAGMA database_list").fetchone()[2]
+            self._path = Path(file_name) if file_name else None
         else:
-            self._conn = sqlite3.connect(db_path)
+            self._writer = sqlite3.connect(db_path, timeout=busy_timeout)
+            self._path = Path(db_path)
 
-        self._conn.row_factory = sqlite3.Row
+        self._writer.row_factory = sqlite3.Row
         self._closed = False
+        self._task_observers: List[Callable[[int], None]] = []
+        # spans of the change log, each (seq before, last seq), to undo and redo
+        self._undo_stack: Deque[Tuple[int, int]] = deque(maxlen=self.undo_limit)
+        self._redo_stack: List[Tuple[int, int]] = []
+        self._transaction_depth = 0
+
+        self._busy_timeout = busy_timeout
+        self._writer_thread = threading.get_ident()
+        # other threads' read connections, None unless reading concurrently
+        self._reader: Optional[threading.local] = None
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        # bumped when the archive is attached or detached, for readers to follow
+        self._reader_generation = 0
+        self._reader_archive: Optional[Path] = None
+
+        if concurrent_reads and self._path is None:
+            raise ValueError("In-memory journals can't be read concurrently")
+
+        upgrade_database(self._writer)
+        # off by default, and only settable outside transactions
+        self._writer.execute("PRAGMA foreign_keys = ON")
+        if concurrent_reads:
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            self._reader = threading.local()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """ The calling thread's connection, the writer unless reading from another thread """
+        if self._reader is None or threading.get_ident() == self._writer_thread:
+            return self._writer
+        reader = getattr(self._reader, "conn", None)
+        if reader is None or self._reader.generation != self._reader_generation:
+            reader = self._open_reader(reader)
+        return reader
+
+    def _open_reader(self, stale: Optional[sqlite3.Connection]) -> sqlite3.Connection:
+        """ Connect the calling thread read-only, replacing its stale connection """
+        if stale is not None:
+            with self._readers_lock:
+                self._readers.remove(stale)
+            stale.close()
+        generation = self._reader_generation
+        reader = sqlite3.connect(
+            self._path.resolve().as_uri() + "?mode=ro",
+            uri=True,
+            timeout=self._busy_timeout,
+            # only ever used by its thread, but closed by the journal's
+            check_same_thread=False,
+        )
+        reader.row_factory = sqlite3.Row
+        if self._reader_archive is not None:
+            reader.execute(
+                "ATTACH DATABASE ? AS archive",
+                (self._reader_archive.resolve().as_uri() + "?mode=ro",),
+            )
+        with self._readers_lock:
+            self._readers.append(reader)
+        self._reader.conn = reader
+        self._reader.generation = generation
+        return reader
 
     def close(self):
-        self._conn.close()
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+        self._writer.close()
         self._closed = True
 
-    def _get_task_lists(self, task_ids: Union[int, List[int]]) -> Dict[int, List[int]]:
+    @property
+    def path(self) -> Optional[Path]:
+        """ The journal's file, or None for in-memory journals """
+        return self._path
+
+    def backup(
+        self,
+        dest: Path,
+        pages_per_step: int = 256,
+        progress: Optional[Callable[[int, int], None]] = None,
+        sleep: float = 0.005,
+    ) -> None:
+        """
+        Copy the journal to dest a few pages at a time while it stays in use
+
+        Journal files are read through a private connection, so this can run
+        in a worker thread and the copy is always consistent. In WAL mode it
+        holds the journal as of the start of the backup without holding up
+        writers; otherwise SQLite starts over whenever another connection
+        writes between steps. Progress is reported after every step as
+        (pages copied, total pages), and raising from it cancels the backup.
+        dest only appears once the backup is complete.
+        """
+        partial = dest.with_name(dest.name + ".partial")
+        source = sqlite3.connect(self._path) if self._path is not None else self._conn
+
+        def on_step(status: int, remaining: int, total: int) -> None:
+            if progress is not None:
+                progress(total - remaining, total)
+
+        try:
+            target = sqlite3.connect(partial)
+            try:
+                if (
+                    source is not self._conn
+                    and source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+                ):
+                    # an open read transaction pins the snapshot being copied
+                    source.execute("BEGIN")
+                    source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                source.backup(
+                    target, pages=pages_per_step, progress=on_step, sleep=sleep
+                )
+            finally:
+                target.close()
+                if source is not self._conn:
+                    source.close()
+        except BaseException:
+            if partial.exists():
+                partial.unlink()
+            raise
+        os.replace(partial, dest)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """
+        Commit what's done within, or roll it back on error, as one change to undo
+
+        Transactions nested within another are part of it.
+        """
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._transaction_depth = 1
+        try:
+            with self._conn:
+                self._begin()
+                # read under the write lock, so no other connection's
+                # changes fall within the span
+                seq = self.change_seq
+                yield
+                last_seq = self.change_seq
+        except BaseException:
+            # a commit that failed on the lock leaves the transaction open
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            raise
+        finally:
+            self._transaction_depth = 0
+        if last_seq > seq:
+            self._undo_stack.append((seq, last_seq))
+            self._redo_stack.clear()
+
+    def transaction(self) -> ContextManager[None]:
+        """ Group changes into one transaction, undone in one step """
+        return self._transaction()
+
+    def _begin(self) -> None:
+        """
+        Start a write transaction unless one is open, taking the write lock now
+
+        A deferred transaction only asks for the lock at its first write,
+        when waiting for it can't help: another connection may have written
+        since this one started reading, so SQLite fails it at once.
+        """
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+
+    def retrying(self, mutation: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+        """
+        Call a mutation, calling it again while other processes keep the journal locked
+
+        A mutation failing on the lock has been rolled back whole, so calling
+        it again can't apply any of it twice. Waits between calls grow from
+        retry_delay, jittered so processes that collided don't collide again.
+        The error is raised after busy_retries calls, or at once within
+        another transaction, which has to be retried as a whole instead.
+        """
+        attempts = 0
+        while True:
+            try:
+                return mutation(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                attempts += 1
+                if (
+                    self._transaction_depth
+                    or not _is_busy(e)
+                    or attempts >= self.busy_retries
+                ):
+                    raise
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def observe_tasks(self, callback: Callable[[int], None]) -> None:
+        """ Call back with a task's ID whenever it or its notifications change """
+        self._task_observers.append(callback)
+
+    def unobserve_tasks(self, callback: Callable[[int], None]) -> None:
+        self._task_observers.remove(callback)
+
+    def _tasks_changed(self, task_ids: Iterable[int]) -> None:
+        for task_id in task_ids:
+            for callback in self._task_observers:
+                callback(task_id)
+
+    def _get_task_lists(
+        self, task_ids: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, List[int]]:
         if isinstance(task_ids, int):
             task_ids = [task_ids]
 
         # generate a parameterized query with a number of placeholders equal to the number of tasks for which lists are being searched for
-        query = f"SELECT task_id, list_id FROM task_lists WHERE task_id IN ( {','.join(['?'] * len(task_ids))} )"
+        query = f"SELECT task_id, list_id FROM {schema}.task_lists WHERE task_id IN ( {','.join(['?'] * len(task_ids))} )"
         task_lists = defaultdict(list)
         for row in self._conn.execute(query, task_ids):
             task_lists[row["task_id"]].append(row["list_id"])
         return task_lists
 
-    def _postprocess_list_tasks(self, tasks: List[Task]) -> List[Task]:
-        """ Assign subtasks, dependencies, tags, and attributes to Tasks """
+    def _postprocess_list_tasks(
+        self, tasks: List[Task], schema: str = "main"
+    ) -> List[Task]:
+        """ Assign subtasks, dependencies, tags, and attributes to Tasks of the journal or its archive """
+        if not tasks:
+            return tasks
         task_ids = [task.task_id for task in tasks]
-        lists = self._get_task_lists(task_ids)
-        tags = self._get_task_tags(task_ids)
-        attrs = self._get_task_attributes(task_ids)
-        subtasks = self._get_subtasks(task_ids)
-        parents = self._get_parent(task_ids)
-        dependencies = self._get_dependencies(task_ids)
-        dependents = self._get_dependents(task_ids)
+        lists = self._get_task_lists(task_ids, schema)
+        tags = self._get_task_tags(task_ids, schema)
+        attrs = self._get_task_attributes(task_ids, schema)
+        subtasks = self._get_subtasks(task_ids, schema)
+        parents = self._get_parent(task_ids, schema)
+        dependencies = self._get_dependencies(task_ids, schema)
+        dependents = self._get_dependents(task_ids, schema)
         for task in tasks:
             task._lists = lists[task.task_id]
             task._tags = tags[task.task_id]
@@ -181,60 +647,110 @@ class Journal:
             task._dependents = dependents[task.task_id]
         return tasks
 
-    def _get_pending_tasks(self) -> List[Task]:
-        return self._postprocess_list_tasks(
-            [
-                Task.from_sqlite_row(row)
-                for row in self._conn.execute(
-                    'SELECT tasks.* FROM tasks LEFT JOIN task_relations ON tasks.task_id = task_relations.task_to_id WHERE (task_relations.relationship IS NULL OR task_relations.relationship != "parent_of") AND completion_dtm IS NULL AND NOT is_trashed'
-                )
-            ]
+    # filters out subtasks without fanning out one row per task relationship
+    _top_level_filter = "NOT EXISTS (SELECT 1 FROM task_relations WHERE task_relations.task_to_id = tasks.task_id AND task_relations.relationship = 'parent_of')"
+
+    # ORDER BY terms of each sort before the position tie-breaker, matching
+    # the expressions of the sort indexes so no sorting happens outside them
+    _sort_terms = {
+        TaskSort.POSITION: [],
+        TaskSort.PRIORITY: ["priority"],
+        TaskSort.DUE: ["due_ts IS NULL", "due_ts"],
+        TaskSort.START: ["start_ts IS NULL", "start_ts"],
+        TaskSort.CREATED: ["creation_ts"],
+        TaskSort.COMPLETED: ["completion_ts IS NULL", "completion_ts"],
+        TaskSort.DESCRIPTION: ["description COLLATE NOCASE"],
+    }
+
+    def _order_by(self, sort: SortSpec) -> str:
+        direction = " DESC" if sort.descending else ""
+        return ", ".join(
+            term + direction for term in self._sort_terms[sort.key] + ["position"]
         )
 
-    def _get_completed_tasks(self) -> List[Task]:
-        return self._postprocess_list_tasks(
-            [
-                Task.from_sqlite_row(row)
-                for row in self._conn.execute(
-                    "SELECT * FROM tasks WHERE completion_dtm IS NOT NULL AND NOT is_trashed"
-                )
-            ]
+    def _get_sorted_tasks(
+        self,
+        query: str,
+        params: List[Any],
+        sort: SortSpec,
+        limit: Optional[int],
+        offset: int,
+    ) -> List[Task]:
+        tasks = [
+            Task.from_sqlite_row(row)
+            for row in self._conn.execute(
+                f"{query} ORDER BY {self._order_by(sort)} LIMIT ? OFFSET ?",
+                params + [limit if limit is not None else -1, offset],
+            )
+        ]
+        self._postprocess_list_tasks([task for task in tasks if not task.archived])
+        self._postprocess_list_tasks(
+            [task for task in tasks if task.archived], "archive"
         )
+        return tasks
 
-    def _get_trashed_tasks(self) -> List[Task]:
-        return self._postprocess_list_tasks(
-            [
-                Task.from_sqlite_row(row)
-                for row in self._conn.execute("SELECT * FROM tasks WHERE is_trashed")
-            ]
-        )
+    def get_list_tasks(
+        self,
+        list_id: Union[CoreTaskList, int],
+        sort: Optional[SortSpec] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include_archived: bool = False,
+    ) -> List[Task]:
+        """
+        Look up top-level tasks (no parents) of a given list
 
-    def get_list_tasks(self, list_id: Union[CoreTaskList, int]) -> List[Task]:
-        """ Look up top-level tasks (no parents) of a given list """
+        Tasks are ordered by position unless sorted otherwise, and a page of
+        them can be selected with limit and offset. Completed tasks include
+        those in the attached archive, if any, if include_archived is set.
+        """
+        if sort is None:
+            sort = SortSpec()
         if isinstance(list_id, CoreTaskList):
             if list_id == CoreTaskList.PENDING:
-                return self._get_pending_tasks()
+                query = f"SELECT * FROM tasks WHERE completion_dtm IS NULL AND NOT is_trashed AND {self._top_level_filter}"
             elif list_id == CoreTaskList.COMPLETED:
-                return self._get_completed_tasks()
+                query = self._tasks_query(
+                    "completion_dtm IS NOT NULL AND NOT is_trashed", include_archived
+                )
             elif list_id == CoreTaskList.TRASH:
-                return self._get_trashed_tasks()
+                query = "SELECT * FROM tasks WHERE is_trashed"
             else:
                 raise ValueError(f"Invalid CoreTaskList: '{list_id}'")
+            return self._get_sorted_tasks(query, [], sort, limit, offset)
         elif isinstance(list_id, int):
-            return self._postprocess_list_tasks(
-                [
-                    Task.from_sqlite_row(row)
-                    for row in self._conn.execute(
-                        'SELECT tasks.* FROM tasks LEFT JOIN task_relations ON tasks.task_id = task_relations.task_to_id LEFT JOIN task_lists ON tasks.task_id = task_lists.task_id WHERE (task_relations.relationship IS NULL OR task_relations.relationship != "parent_of") AND task_lists.list_id = ? AND completion_dtm IS NULL AND NOT is_trashed',
-                        (list_id,),
-                    )
-                ]
+            return self._get_sorted_tasks(
+                f"SELECT tasks.* FROM task_lists CROSS JOIN tasks ON tasks.task_id = task_lists.task_id WHERE task_lists.list_id = ? AND completion_dtm IS NULL AND NOT is_trashed AND {self._top_level_filter}",
+                [list_id],
+                sort,
+                limit,
+                offset,
             )
         else:
             raise TypeError(
                 "List IDs must be either integers or a built-in CoreTaskList"
             )
 
+    def get_list_sort(self, list_id: Union[CoreTaskList, int]) -> SortSpec:
+        """ Look up the remembered sort of a list, by position if there is none """
+        row = self._conn.execute(
+            "SELECT value FROM metadata WHERE property = ?",
+            (f"list_sort:{encode_list_id(list_id)}",),
+        ).fetchone()
+        if row is None:
+            return SortSpec()
+        try:
+            return SortSpec.parse(row["value"])
+        except ValueError:
+            return SortSpec()
+
+    def set_list_sort(self, list_id: Union[CoreTaskList, int], sort: SortSpec) -> None:
+        with self._transaction():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (property, value) VALUES (?, ?)",
+                (f"list_sort:{encode_list_id(list_id)}", str(sort)),
+            )
+
     def _get_pending_count(self) -> int:
         return int(
             self._conn.execute(
@@ -275,14 +791,14 @@ class Journal:
         elif isinstance(list_id, int):
             count = int(
                 self._conn.execute(
-                    "SELECT COUNT(*) FROM task_lists LEFT JOIN tasks ON task_lists.task_id = tasks.task_id WHERE task_lists.list_id = ? AND NOT tasks.is_trashed AND tasks.completion_dtm IS NULL",
+                    "SELECT COUNT(*) FROM task_lists JOIN tasks ON task_lists.task_id = tasks.task_id WHERE task_lists.list_id = ? AND NOT tasks.is_trashed AND tasks.completion_dtm IS NULL",
                     (list_id,),
                 ).fetchone()[0]
             )
         elif isinstance(list_id, list):
             if all([isinstance(e, int) for e in list_id]):
                 count = {l: 0 for l in list_id}
-                query = f"SELECT task_lists.list_id, COUNT(*) FROM task_lists LEFT JOIN tasks ON task_lists.task_id = tasks.task_id WHERE task_lists.list_id IN ( {', '.join((['?'] * len(list_id)))} ) AND NOT tasks.is_trashed AND tasks.completion_dtm IS NULL GROUP BY task_lists.list_id"
+                query = f"SELECT task_lists.list_id, COUNT(*) FROM task_lists JOIN tasks ON task_lists.task_id = tasks.task_id WHERE task_lists.list_id IN ( {', '.join((['?'] * len(list_id)))} ) AND NOT tasks.is_trashed AND tasks.completion_dtm IS NULL GROUP BY task_lists.list_id"
                 for row in self._conn.execute(query, list_id):
                     count[row["list_id"]] = row[1]
             else:
@@ -294,6 +810,18 @@ class Journal:
 
         return count
 
+    def get_overview(
+        self, list_id: Union[CoreTaskList, int] = CoreTaskList.PENDING
+    ) -> JournalOverview:
+        """ Look up the user lists, every list count, and the tasks of one list """
+        lists = self.lists
+        counts: Dict[Union[CoreTaskList, int], int] = {
+            core_list: self.get_list_count(core_list) for core_list in CoreTaskList
+        }
+        counts.update(self.get_list_count([l.list_id for l in lists]))
+        tasks = self.get_list_tasks(list_id, self.get_list_sort(list_id))
+        return JournalOverview(lists, counts, list_id, tasks)
+
     @property
     def lists(self) -> List[TaskList]:
         return [
@@ -317,15 +845,17 @@ class Journal:
 
     def add_list(self, name: str, icon: Optional[str] = None) -> int:
         """ Add a list to the end of user lists """
-        # get current highest position of lists
-        max_list_id = self._conn.execute("SELECT MAX(list_id) FROM lists").fetchone()[0]
-        if max_list_id is None:
-            max_list_id = 0
-
-        with self._conn:
+        with self._transaction():
+            # get current highest ID and position of lists, under the write lock
+            max_list_id, max_position = self._conn.execute(
+                "SELECT (SELECT MAX(list_id) FROM lists), (SELECT MAX(position) FROM lists)"
+            ).fetchone()
+            if max_list_id is None:
+                max_list_id = 0
+                max_position = 0
             self._conn.execute(
                 "INSERT INTO lists (list_id, name, icon, position) VALUES (?, ?, ?, ?)",
-                (max_list_id + 1, name, icon, max_list_id + 1),
+                (max_list_id + 1, name, icon, max_position + self.position_gap),
             )
 
         return max_list_id + 1
@@ -347,7 +877,7 @@ class Journal:
 
         if changes:
             query = "UPDATE lists SET {set_string} WHERE list_id = ?"
-            with self._conn:
+            with self._transaction():
                 query = query.format(
                     set_string=(
                         ", ".join(" = ".join([change[0], "?"]) for change in changes)
@@ -358,14 +888,14 @@ class Journal:
                 )
 
     def swap_list_positions(self, list1_id: int, list2_id: int) -> None:
-        list1 = self.get_list(list1_id)
-        list2 = self.get_list(list2_id)
-        max_position = self._conn.execute("SELECT MAX(position) FROM lists").fetchone()[
-            0
-        ]
+        with self._transaction():
+            list1 = self.get_list(list1_id)
+            list2 = self.get_list(list2_id)
+            max_position = self._conn.execute(
+                "SELECT MAX(position) FROM lists"
+            ).fetchone()[0]
 
-        if (list1 is not None) and (list2 is not None):
-            with self._conn:
+            if (list1 is not None) and (list2 is not None):
                 query = "UPDATE lists SET position = ? WHERE list_id = ?"
                 # set list1 position to end
                 self._conn.execute(query, (max_position + 1, list1_id))
@@ -374,12 +904,133 @@ class Journal:
                 # set list1 position to list2
                 self._conn.execute(query, (list2.position, list1_id))
 
+    def move_list(
+        self, list_id: int, before: Optional[int] = None, after: Optional[int] = None
+    ) -> None:
+        """ Move a list to just before or after another list """
+        self._move("lists", "list_id", list_id, before, after)
+
     def delete_list(self, list_id: int) -> None:
-        with self._conn:
-            # delete task-list relationships part of the to-be-deleted list
-            self._conn.execute("DELETE FROM task_lists WHERE list_id = ?", (list_id,))
-            # delete the list
+        with self._transaction():
+            # delete the list, its tasks' membership cascading, and its remembered sort
             self._conn.execute("DELETE FROM lists WHERE list_id = ?", (list_id,))
+            self._conn.execute(
+                "DELETE FROM metadata WHERE property = ?",
+                (f"list_sort:{encode_list_id(list_id)}",),
+            )
+
+    def get_filter_tasks(
+        self,
+        query: str,
+        now: Optional[datetime] = None,
+        sort: Optional[SortSpec] = None,
+        limit: Optional[int] = None,
+    ) -> List[Task]:
+        """
+        Look up the tasks matching a filter (see handleit.query)
+
+        Tasks are ordered by position unless sorted otherwise, like those of
+        a list.
+        """
+        condition, params = compile_filter(query, now)
+        return self._get_sorted_tasks(
+            f"SELECT tasks.* FROM tasks WHERE {condition}",
+            list(params),
+            sort if sort is not None else SortSpec(),
+            limit,
+            0,
+        )
+
+    def get_filter_count(
+        self, queries: List[str], now: Optional[datetime] = None
+    ) -> List[int]:
+        """ Count the tasks matching each of several filters in a single statement """
+        if not queries:
+            return []
+        counts = []
+        params: List[Any] = []
+        for query in queries:
+            condition, query_params = compile_filter(query, now)
+            counts.append(f"(SELECT COUNT(*) FROM tasks WHERE {condition})")
+            params.extend(query_params)
+        return list(
+            self._conn.execute(f"SELECT {', '.join(counts)}", params).fetchone()
+        )
+
+    @property
+    def views(self) -> List[SavedView]:
+        return [
+            SavedView.from_sqlite_row(row)
+            for row in self._conn.execute("SELECT * FROM views ORDER BY position")
+        ]
+
+    def get_view(self, view_id: int) -> Optional[SavedView]:
+        row = self._conn.execute(
+            "SELECT * FROM views WHERE view_id = ?", (view_id,)
+        ).fetchone()
+        if row is not None:
+            return SavedView.from_sqlite_row(row)
+        return None
+
+    def add_view(self, name: str, query: str, icon: Optional[str] = None) -> int:
+        """ Save a filter as a view after the existing ones, raising FilterError if invalid """
+        compile_filter(query)
+        with self._transaction():
+            max_view_id = self._conn.execute(
+                "SELECT MAX(view_id) FROM views"
+            ).fetchone()[0]
+            if max_view_id is None:
+                max_view_id = 0
+            self._conn.execute(
+                "INSERT INTO views (view_id, name, icon, query, position) VALUES (?, ?, ?, ?, ?)",
+                (max_view_id + 1, name, icon, query, max_view_id + 1),
+            )
+
+        return max_view_id + 1
+
+    def update_view(
+        self,
+        view_id: int,
+        new_name: Optional[str] = None,
+        new_query: Optional[str] = None,
+        new_icon: Optional[str] = None,
+    ) -> None:
+        changes = []
+        if new_name is not None:
+            changes.append(("name", new_name))
+        if new_query is not None:
+            compile_filter(new_query)
+            changes.append(("query", new_query))
+        if new_icon is not None:
+            changes.append(("icon", new_icon))
+
+        if changes:
+            set_string = ", ".join(f"{column} = ?" for column, _ in changes)
+            with self._transaction():
+                self._conn.execute(
+                    f"UPDATE views SET {set_string} WHERE view_id = ?",
+                    tuple(value for _, value in changes) + (view_id,),
+                )
+
+    def delete_view(self, view_id: int) -> None:
+        with self._transaction():
+            self._conn.execute("DELETE FROM views WHERE view_id = ?", (view_id,))
+
+    def get_view_tasks(
+        self, view_id: int, now: Optional[datetime] = None
+    ) -> List[Task]:
+        view = self.get_view(view_id)
+        if view is None:
+            return []
+        return self.get_filter_tasks(view.query, now)
+
+    def get_view_count(
+        self, view_ids: List[int], now: Optional[datetime] = None
+    ) -> Dict[int, int]:
+        """ Count the tasks of several views, leaving out views that don't exist """
+        views = [view for view in self.views if view.view_id in set(view_ids)]
+        counts = self.get_filter_count([view.query for view in views], now)
+        return {view.view_id: count for view, count in zip(views, counts)}
 
     def get_task(self, task_id: int) -> Optional[Task]:
         row = self._conn.execute(
@@ -419,29 +1070,35 @@ class Journal:
         if lists:
             raise NotImplementedError
 
-        # get current max task_id
-        max_task_id = self._conn.execute("SELECT MAX(task_id) FROM tasks").fetchone()[0]
-        if max_task_id is None:
-            max_task_id = 0
-
         # add the new task
+        creation_time = datetime.now(timezone.utc)
         task_dict = {
-            "task_id": max_task_id + 1,
-            "position": max_task_id + 1,
-            "creation_dtm": datetime.now(timezone.utc).isoformat(),
             "description": description,
             "notes": notes,
             "priority": priority,
-            "completion_dtm": completion_time,
-            "due_dtm": due_time,
-            "start_dtm": start_time,
             "is_trashed": is_trashed,
         }
-        with self._conn:
+        for name, time in (
+            ("creation", creation_time),
+            ("completion", completion_time),
+            ("due", due_time),
+            ("start", start_time),
+        ):
+            task_dict[f"{name}_dtm"] = time.isoformat() if time is not None else None
+            task_dict[f"{name}_ts"] = datetime_to_epoch(time)
+        with self._transaction():
+            # get current max task_id and position, under the write lock so
+            # no other process can take them first
+            max_task_id, max_position = self._conn.execute(
+                f"SELECT {SQL_MAX_TASK_ID}, (SELECT COALESCE(MAX(position), 0) FROM tasks)"
+            ).fetchone()
+            task_dict["task_id"] = max_task_id + 1
+            task_dict["position"] = max_position + self.position_gap
             self._conn.execute(
-                "INSERT INTO tasks (task_id, position, creation_dtm, description, notes, priority, completion_dtm, due_dtm, start_dtm, is_trashed) VALUES (:task_id, :position, :creation_dtm, :description, :notes, :priority, :completion_dtm, :due_dtm, :start_dtm, :is_trashed)",
+                "INSERT INTO tasks (task_id, position, creation_dtm, creation_ts, description, notes, priority, completion_dtm, completion_ts, due_dtm, due_ts, start_dtm, start_ts, is_trashed) VALUES (:task_id, :position, :creation_dtm, :creation_ts, :description, :notes, :priority, :completion_dtm, :completion_ts, :due_dtm, :due_ts, :start_dtm, :start_ts, :is_trashed)",
                 task_dict,
             )
+        self._tasks_changed([max_task_id + 1])
 
         return max_task_id + 1
 
@@ -471,33 +1128,26 @@ class Journal:
             changes.append(("priority", new_priority))
         if new_creation_time is not None:
             changes.append(("creation_dtm", new_creation_time.isoformat()))
+            changes.append(("creation_ts", datetime_to_epoch(new_creation_time)))
         if is_trashed is not None:
             changes.append(("is_trashed", int(is_trashed)))
 
         if "new_notes" in kwargs:
             changes.append(("notes", kwargs["new_notes"]))
-        if "new_completion_time" in kwargs:
-            if kwargs["new_completion_time"] is None:
-                new_completion_time = None
-            else:
-                new_completion_time = kwargs["new_completion_time"].isoformat()
-            changes.append(("completion_dtm", new_completion_time))
-        if "new_due_time" in kwargs:
-            if kwargs["new_due_time"] is None:
-                new_due_time = None
-            else:
-                new_due_time = kwargs["new_due_time"].isoformat()
-            changes.append(("due_dtm", new_due_time))
-        if "new_start_time" in kwargs:
-            if kwargs["new_start_time"] is None:
-                new_start_time = None
-            else:
-                new_start_time = kwargs["new_start_time"].isoformat()
-            changes.append(("start_dtm", new_start_time))
+        for name in ("completion", "due", "start"):
+            if f"new_{name}_time" in kwargs:
+                new_time = kwargs[f"new_{name}_time"]
+                changes.append(
+                    (
+                        f"{name}_dtm",
+                        new_time.isoformat() if new_time is not None else None,
+                    )
+                )
+                changes.append((f"{name}_ts", datetime_to_epoch(new_time)))
 
         if changes:
             query = "UPDATE tasks SET {set_string} WHERE task_id = ?"
-            with self._conn:
+            with self._transaction():
                 query = query.format(
                     set_string=(
                         ", ".join(" = ".join([change[0], "?"]) for change in changes)
@@ -506,71 +1156,211 @@ class Journal:
                 self._conn.execute(
                     query, tuple([change[1] for change in changes] + [task_id])
                 )
+            self._tasks_changed([task_id])
 
     def add_task_to_list(self, task_id: int, list_id: int) -> None:
         # TODO verify both task and list exist
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "INSERT INTO task_lists (list_id, task_id) VALUES (?, ?)",
                 (list_id, task_id),
             )
 
     def delete_task_from_list(self, task_id: int, list_id: int) -> None:
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "DELETE FROM task_lists WHERE list_id = ? AND task_id = ?",
                 (list_id, task_id),
             )
 
-    def _get_task_tags(self, task_ids: Union[int, List[int]]) -> Dict[int, Set[str]]:
+    def _get_task_tags(
+        self, task_ids: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, Set[str]]:
         if isinstance(task_ids, int):
             task_ids = [task_ids]
         # generate a parameterized query with a number of placeholders equal to the number of tasks for which tags are being searched for
-        query = f"SELECT task_tags.task_id, tags.name FROM tags JOIN task_tags ON tags.tag_id = task_tags.tag_id WHERE task_tags.task_id IN ( {','.join(['?'] * len(task_ids))} )"
+        query = f"SELECT task_tags.task_id, tags.name FROM {schema}.tags JOIN {schema}.task_tags ON tags.tag_id = task_tags.tag_id WHERE task_tags.task_id IN ( {','.join(['?'] * len(task_ids))} )"
         task_tags = defaultdict(set)
         for row in self._conn.execute(query, task_ids):
             task_tags[row["task_id"]].add(row["name"])
         return task_tags
 
     def delete_task(self, task_id: int) -> None:
-        with self._conn:
-            # delete list task relationship
-            self._conn.execute("DELETE FROM task_lists WHERE task_id = ?", (task_id,))
-            # delete tag task relationship
-            self._conn.execute("DELETE FROM task_tags WHERE task_id = ?", (task_id,))
-            # delete relationships between any other tasks
-            self._conn.execute(
-                "DELETE FROM task_relations WHERE task_from_id = ? OR task_to_id = ?",
-                (task_id, task_id),
+        self.delete_tasks([task_id])
+
+    def delete_tasks(self, task_ids: Iterable[int]) -> int:
+        """
+        Delete tasks for good, returning how many there were
+
+        Their lists, tags, attributes, relations, and notifications go with
+        them, all in one transaction that's undone in one step.
+        """
+        with self._transaction():
+            self._clear_delete_batch()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO delete_batch (task_id) VALUES (?)",
+                ((task_id,) for task_id in task_ids),
             )
-            # delete attribute task relationship
+            deleted = self._delete_batch()
+        self._tasks_changed(deleted)
+        return len(deleted)
+
+    def empty_trash(self) -> int:
+        """ Delete every trashed task for good, returning how many there were """
+        return self._delete_tasks_where("is_trashed")
+
+    def purge_trash(self, older_than: timedelta, now: Optional[datetime] = None) -> int:
+        """
+        Delete the tasks trashed more than older_than ago for good, returning how many there were
+
+        A task was trashed when the change log last has it trashed, so tasks
+        trashed before the journal had a change log count as trashed when it
+        was added.
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+        trashed_ts = (
+            "(SELECT MAX(changed_ts) FROM changes WHERE table_name = 'tasks' "
+            "AND row_key = json_array(tasks.uid) AND json_extract(data, '$.is_trashed'))"
+        )
+        return self._delete_tasks_where(
+            f"is_trashed AND {trashed_ts} < ?", (datetime_to_epoch(now - older_than),)
+        )
+
+    def _delete_tasks_where(self, where: str, parameters: Tuple = ()) -> int:
+        with self._transaction():
+            self._clear_delete_batch()
             self._conn.execute(
-                "DELETE FROM task_attributes WHERE task_id = ?", (task_id,)
+                f"INSERT INTO delete_batch (task_id) SELECT task_id FROM tasks WHERE {where}",
+                parameters,
             )
-            # delete the task
-            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            deleted = self._delete_batch()
+        self._tasks_changed(deleted)
+        return len(deleted)
+
+    def _clear_delete_batch(self) -> None:
+        self._conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS delete_batch (task_id INTEGER PRIMARY KEY)"
+        )
+        self._conn.execute("DELETE FROM delete_batch")
+
+    def _delete_batch(self) -> List[int]:
+        """ Delete the tasks in delete_batch with one statement per table, returning their IDs """
+        self._conn.execute(
+            "DELETE FROM delete_batch WHERE task_id NOT IN (SELECT task_id FROM tasks)"
+        )
+        # the cascades would delete the links one task at a time, and log
+        # them in between the tasks, where undoing them takes a statement
+        # each; deleting them first logs and undoes each table's at once
+        for table in CASCADING_TABLES:
+            if table == "task_relations":
+                where = "task_from_id IN delete_batch OR task_to_id IN delete_batch"
+            else:
+                where = "task_id IN delete_batch"
+            self._conn.execute(f"DELETE FROM {table} WHERE {where}")
+        self._conn.execute("DELETE FROM tasks WHERE task_id IN delete_batch")
+        return [
+            row[0] for row in self._conn.execute("SELECT task_id FROM delete_batch")
+        ]
 
     def add_task_tag(self, task_id: int, tag: str) -> None:
         """ Adds the tag to the task, creating a new tag if it doesn't exist """
-        tag_id = self.get_tag(tag)
-        if tag_id is None:
+        existing_tag = self.get_tag(tag)
+        if existing_tag is None:
             tag_id = self.add_tag(tag)
+        else:
+            tag_id = existing_tag.tag_id
 
         # add the tag to the task
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "INSERT INTO task_tags (task_id, tag_id) VALUES (?, ?)",
                 (task_id, tag_id),
             )
 
     def delete_task_tag(self, task_id: int, tag: str) -> None:
-        tag_id = self.get_tag(tag).tag_id
-        if tag_id is not None:
-            with self._conn:
+        existing_tag = self.get_tag(tag)
+        if existing_tag is not None:
+            with self._transaction():
                 self._conn.execute(
                     "DELETE FROM task_tags WHERE task_id = ? AND tag_id = ?",
-                    (task_id, tag_id),
+                    (task_id, existing_tag.tag_id),
+                )
+
+    def get_tasks_by_tags(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+        list_id: Optional[int] = None,
+    ) -> List[Task]:
+        """
+        Look up pending tasks by tag name, optionally only those in a user list
+
+        Tasks must have every tag of all_of, at least one of any_of (if any
+        are given), and none of none_of. Each tag's tasks are read off the
+        task_tags_tag index and combined in SQL.
+        """
+        all_of, any_of, none_of = set(all_of), set(any_of), set(none_of)
+        names = all_of | any_of | none_of
+        tag_ids = {
+            row["name"]: row["tag_id"]
+            for row in self._conn.execute(
+                f"SELECT tag_id, name FROM tags WHERE name IN ( {','.join(['?'] * len(names))} )",
+                list(names),
+            )
+        }
+        if not all_of <= tag_ids.keys():
+            return []
+        any_of_ids = [tag_ids[name] for name in any_of if name in tag_ids]
+        if any_of and not any_of_ids:
+            return []
+        none_of_ids = [tag_ids[name] for name in none_of if name in tag_ids]
+
+        conditions = ["completion_dtm IS NULL AND NOT is_trashed"]
+        params: List[Any] = []
+        if all_of:
+            postings = " INTERSECT ".join(
+                ["SELECT task_id FROM task_tags WHERE tag_id = ?"] * len(all_of)
+            )
+            conditions.append(f"task_id IN ({postings})")
+            params.extend(tag_ids[name] for name in all_of)
+        for operator, ids in (("IN", any_of_ids), ("NOT IN", none_of_ids)):
+            if ids:
+                conditions.append(
+                    f"task_id {operator} (SELECT task_id FROM task_tags WHERE tag_id IN ( {','.join(['?'] * len(ids))} ))"
                 )
+                params.extend(ids)
+        if list_id is not None:
+            conditions.append(
+                "task_id IN (SELECT task_id FROM task_lists WHERE list_id = ?)"
+            )
+            params.append(list_id)
+
+        return self._postprocess_list_tasks(
+            [
+                Task.from_sqlite_row(row)
+                for row in self._conn.execute(
+                    f"SELECT * FROM tasks WHERE {' AND '.join(conditions)} ORDER BY position",
+                    params,
+                )
+            ]
+        )
+
+    def get_tag_counts(self, list_id: Optional[int] = None) -> Dict[str, int]:
+        """ Count the pending tasks of every tag, optionally only those in a user list """
+        list_filter = ""
+        params: List[Any] = []
+        if list_id is not None:
+            list_filter = "AND tasks.task_id IN (SELECT task_id FROM task_lists WHERE list_id = ?)"
+            params.append(list_id)
+        return {
+            row[0]: row[1]
+            for row in self._conn.execute(
+                f"SELECT tags.name, COUNT(tasks.task_id) FROM tags LEFT JOIN task_tags ON task_tags.tag_id = tags.tag_id LEFT JOIN tasks ON tasks.task_id = task_tags.task_id AND tasks.completion_dtm IS NULL AND NOT tasks.is_trashed {list_filter} GROUP BY tags.tag_id",
+                params,
+            )
+        }
 
     def get_tag(self, tag: Union[int, str]) -> Optional[TaskTag]:
         if isinstance(tag, int):
@@ -590,11 +1380,12 @@ class Journal:
         return None
 
     def add_tag(self, name: str, color: Optional[str] = None) -> int:
-        max_tag_id = self._conn.execute("SELECT MAX(tag_id) FROM tags").fetchone()[0]
-        if max_tag_id is None:
-            max_tag_id = 0
-
-        with self._conn:
+        with self._transaction():
+            max_tag_id = self._conn.execute("SELECT MAX(tag_id) FROM tags").fetchone()[
+                0
+            ]
+            if max_tag_id is None:
+                max_tag_id = 0
             self._conn.execute(
                 "INSERT INTO tags (tag_id, name, color) VALUES (?, ?, ?)",
                 (max_tag_id + 1, name, color),
@@ -613,7 +1404,7 @@ class Journal:
 
         if changes:
             query = "UPDATE tags SET {set_string} WHERE tag_id = ?"
-            with self._conn:
+            with self._transaction():
                 query = query.format(
                     set_string=(
                         ", ".join(" = ".join([change[0], "?"]) for change in changes)
@@ -626,44 +1417,56 @@ class Journal:
     def delete_tag(self, tag: Union[str, int]) -> None:
         tag = self.get_tag(tag)
         if tag is not None:
-            with self._conn:
-                self._conn.execute(
-                    "DELETE FROM task_tags WHERE tag_id = ?", (tag.tag_id,)
-                )
+            with self._transaction():
+                # the tag's task_tags rows cascade
                 self._conn.execute("DELETE FROM tags WHERE tag_id = ?", (tag.tag_id,))
 
     def _get_task_attributes(
-        self, task_ids: Union[int, List[int]]
+        self, task_ids: Union[int, List[int]], schema: str = "main"
     ) -> Dict[int, Dict[str, TaskAttribute]]:
         if isinstance(task_ids, int):
             task_ids = [task_ids]
 
         task_attrs = defaultdict(dict)
-        query = f"SELECT * FROM task_attributes WHERE task_id IN ( {','.join(['?'] * len(task_ids))} )"
+        query = f"SELECT * FROM {schema}.task_attributes WHERE task_id IN ( {','.join(['?'] * len(task_ids))} )"
         for row in self._conn.execute(query, task_ids):
             if row["attr_type"] not in self._valid_attribute_types:
                 raise TypeError(
                     f"Task {row['task_id']} has invalid type '{row['attr_type']}'. (Valid types are str, int, float, and bool)"
                 )
-            task_attrs[row["task_id"]][row["attr_key"]] = getattr(
-                builtins, row["attr_type"]
-            )(row["attr_value"])
+            value = row[ATTRIBUTE_VALUE_COLUMNS[row["attr_type"]][0]]
+            task_attrs[row["task_id"]][row["attr_key"]] = (
+                bool(value) if row["attr_type"] == "bool" else value
+            )
         return task_attrs
 
-    def add_task_attribute(self, task_id: int, key: str, value: TaskAttribute) -> None:
+    def _attribute_values(self, value: TaskAttribute) -> Dict[str, Any]:
+        """ Split an attribute value into its type name, text copy, and typed columns """
         value_type = type(value).__name__
         if value_type not in self._valid_attribute_types:
             raise TypeError(
                 f"Task attribute values can only be str, int, float, or bool, not '{value_type}'"
             )
-        with self._conn:
+        values: Dict[str, Any] = {
+            "attr_type": value_type,
+            "attr_value": str(int(value)) if value_type == "bool" else str(value),
+            "integer_value": None,
+            "real_value": None,
+            "text_value": None,
+        }
+        values[ATTRIBUTE_VALUE_COLUMNS[value_type][0]] = value
+        return values
+
+    def add_task_attribute(self, task_id: int, key: str, value: TaskAttribute) -> None:
+        values = self._attribute_values(value)
+        with self._transaction():
             self._conn.execute(
-                "INSERT into task_attributes (task_id, attr_key, attr_type, attr_value) VALUES (?, ?, ?, ?)",
-                (task_id, key, value_type, value),
+                "INSERT into task_attributes (task_id, attr_key, attr_type, attr_value, integer_value, real_value, text_value) VALUES (:task_id, :attr_key, :attr_type, :attr_value, :integer_value, :real_value, :text_value)",
+                dict(values, task_id=task_id, attr_key=key),
             )
 
     def delete_task_attribute(self, task_id: int, key: str) -> None:
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "DELETE FROM task_attributes WHERE task_id = ? AND attr_key = ?",
                 (task_id, key),
@@ -672,26 +1475,62 @@ class Journal:
     def update_task_attribute(
         self, task_id: int, key: str, new_value: TaskAttribute
     ) -> None:
-        new_value_type = type(new_value).__name__
-        if new_value_type not in self._valid_attribute_types:
-            raise TypeError(
-                f"Task attribute values can only be str, int, float, or bool, not '{new_value_type}'"
-            )
-        with self._conn:
+        values = self._attribute_values(new_value)
+        with self._transaction():
             self._conn.execute(
-                "UPDATE task_attributes SET attr_value = ?, attr_type = ? WHERE task_id = ? AND attr_key = ?",
-                (new_value, new_value_type, task_id, key),
+                "UPDATE task_attributes SET attr_type = :attr_type, attr_value = :attr_value, integer_value = :integer_value, real_value = :real_value, text_value = :text_value WHERE task_id = :task_id AND attr_key = :attr_key",
+                dict(values, task_id=task_id, attr_key=key),
             )
 
+    _attribute_operators = {"=", "!=", "<", "<=", ">", ">="}
+
+    def find_tasks_by_attribute(
+        self, key: str, op: str, value: TaskAttribute
+    ) -> List[Task]:
+        """
+        Look up the tasks with an attribute comparing to a value, e.g. ("energy", ">=", 2)
+
+        Numbers compare with both integer and float attributes, booleans only
+        with boolean ones, and strings only with strings. Each comparison is a
+        range of one of the typed value indexes.
+        """
+        if op not in self._attribute_operators:
+            raise ValueError(
+                f"Invalid attribute comparison '{op}'. (Valid comparisons are {', '.join(sorted(self._attribute_operators))})"
+            )
+        value_type = self._attribute_values(value)["attr_type"]
+        if value_type == "bool":
+            matches = [
+                f"SELECT task_id FROM task_attributes WHERE attr_key = ? AND integer_value {op} ? AND attr_type = 'bool'"
+            ]
+        elif value_type == "str":
+            matches = [
+                f"SELECT task_id FROM task_attributes WHERE attr_key = ? AND text_value {op} ?"
+            ]
+        else:
+            matches = [
+                f"SELECT task_id FROM task_attributes WHERE attr_key = ? AND {column} {op} ? AND attr_type != 'bool'"
+                for column in ("integer_value", "real_value")
+            ]
+        return self._postprocess_list_tasks(
+            [
+                Task.from_sqlite_row(row)
+                for row in self._conn.execute(
+                    f"SELECT * FROM tasks WHERE task_id IN ({' UNION ALL '.join(matches)}) ORDER BY position",
+                    [key, value] * len(matches),
+                )
+            ]
+        )
+
     def swap_task_positions(self, task1_id: int, task2_id: int):
-        task1 = self.get_task(task1_id)
-        task2 = self.get_list(task2_id)
-        max_position = self._conn.execute("SELECT MAX(position) FROM tasks").fetchone()[
-            0
-        ]
+        with self._transaction():
+            task1 = self.get_task(task1_id)
+            task2 = self.get_task(task2_id)
+            max_position = self._conn.execute(
+                "SELECT MAX(position) FROM tasks"
+            ).fetchone()[0]
 
-        if (task1 is not None) and (task2 is not None):
-            with self._conn:
+            if (task1 is not None) and (task2 is not None):
                 query = "UPDATE tasks SET position = ? WHERE task_id = ?"
                 # set task1 position to end
                 self._conn.execute(query, (max_position + 1, task1_id))
@@ -700,6 +1539,103 @@ class Journal:
                 # set task1 position to task2
                 self._conn.execute(query, (task2.position, task1_id))
 
+    def move_task(
+        self, task_id: int, before: Optional[int] = None, after: Optional[int] = None
+    ) -> None:
+        """
+        Move a task to just before or after another task
+
+        Positions are shared by every list, so the task is also next to the
+        other one in any list they have in common.
+        """
+        self._move("tasks", "task_id", task_id, before, after)
+        self._tasks_changed([task_id])
+
+    def _move(
+        self,
+        table: str,
+        id_column: str,
+        item_id: int,
+        before: Optional[int],
+        after: Optional[int],
+    ) -> None:
+        """
+        Place a row between a neighbour and the next row over, in a single UPDATE
+
+        New rows are spaced position_gap apart and each move takes the middle
+        of a gap, so only when two neighbours end up adjacent is the whole
+        table renumbered.
+        """
+        if (before is None) == (after is None):
+            raise ValueError("Move either before or after another item")
+        anchor_id = before if before is not None else after
+        if anchor_id == item_id:
+            return
+
+        with self._transaction():
+            for _ in range(2):
+                anchor = self._conn.execute(
+                    f"SELECT position FROM {table} WHERE {id_column} = ?", (anchor_id,)
+                ).fetchone()
+                current = self._conn.execute(
+                    f"SELECT position FROM {table} WHERE {id_column} = ?", (item_id,)
+                ).fetchone()
+                if (anchor is None) or (current is None):
+                    return
+
+                if after is not None:
+                    low = anchor[0]
+                    high = self._conn.execute(
+                        f"SELECT MIN(position) FROM {table} WHERE position > ? AND {id_column} != ?",
+                        (low, item_id),
+                    ).fetchone()[0]
+                    if high is None:
+                        high = low + 2 * self.position_gap
+                else:
+                    high = anchor[0]
+                    low = self._conn.execute(
+                        f"SELECT MAX(position) FROM {table} WHERE position < ? AND {id_column} != ?",
+                        (high, item_id),
+                    ).fetchone()[0]
+                    if low is None:
+                        low = high - 2 * self.position_gap
+
+                if low < current[0] < high:
+                    # already between the two
+                    return
+                if high - low > 1:
+                    self._conn.execute(
+                        f"UPDATE {table} SET position = ? WHERE {id_column} = ?",
+                        (low + (high - low) // 2, item_id),
+                    )
+                    return
+                self._rebalance_positions(table, id_column)
+
+    def _rebalance_positions(self, table: str, id_column: str) -> None:
+        """ Spread every position of a table position_gap apart, keeping their order """
+        ids = [
+            row[0]
+            for row in self._conn.execute(
+                f"SELECT {id_column} FROM {table} ORDER BY position"
+            )
+        ]
+        min_position = self._conn.execute(
+            f"SELECT MIN(position) FROM {table}"
+        ).fetchone()[0]
+        # UNIQUE is checked row by row, so first move every position below
+        # all current ones (reversing their order) to free up the new ones
+        self._conn.execute(
+            f"UPDATE {table} SET position = ? - position",
+            (min_position + min(min_position, 0) - 1,),
+        )
+        self._conn.executemany(
+            f"UPDATE {table} SET position = ? WHERE {id_column} = ?",
+            [
+                ((rank + 1) * self.position_gap, row_id)
+                for rank, row_id in enumerate(ids)
+            ],
+        )
+
     def get_task_relationships(self, task_from_id, task_to_id) -> Set[TaskRelationship]:
         return set(
             [
@@ -714,7 +1650,7 @@ class Journal:
     def add_task_relationship(
         self, task_from_id: int, task_to_id: int, relationship: TaskRelationship
     ) -> None:
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "INSERT INTO task_relations (task_from_id, task_to_id, relationship) VALUES (?, ?, ?)",
                 (task_from_id, task_to_id, relationship.value),
@@ -723,7 +1659,7 @@ class Journal:
     def delete_task_relationship(
         self, task_from_id: int, task_to_id: int, relationship: TaskRelationship
     ) -> None:
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "DELETE FROM task_relations WHERE task_from_id = ? AND task_to_id = ? AND relationship = ?",
                 (task_from_id, task_to_id, relationship.value),
@@ -732,58 +1668,1390 @@ class Journal:
     def update_task_relationship(
         self, task_from_id: int, task_to_id: int, new_relationship: TaskRelationship
     ) -> None:
-        with self._conn:
+        with self._transaction():
             self._conn.execute(
                 "UPDATE task_relations SET relationship = ? WHERE task_from_id = ? AND task_to_id = ?",
                 (new_relationship.value, task_from_id, task_to_id),
             )
 
-    def _get_subtasks(self, task_id: Union[int, List[int]]) -> Dict[int, List[int]]:
+    def _get_subtasks(
+        self, task_id: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, List[int]]:
         if isinstance(task_id, int):
             task_id = [task_id]
 
         subtasks = defaultdict(list)
-        query = f"SELECT task_to_id, task_from_id FROM task_relations WHERE relationship = 'parent_of' AND task_from_id IN ( {','.join(['?'] * len(task_id))} )"
+        query = f"SELECT task_to_id, task_from_id FROM {schema}.task_relations WHERE relationship = 'parent_of' AND task_from_id IN ( {','.join(['?'] * len(task_id))} )"
         for row in self._conn.execute(query, task_id):
             subtasks[row["task_from_id"]].append(row["task_to_id"])
         return subtasks
 
-    def _get_parent(self, task_id: Union[int, List[int]]) -> Dict[int, Optional[int]]:
+    def _get_parent(
+        self, task_id: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, Optional[int]]:
         if isinstance(task_id, int):
             task_id = [task_id]
 
         parents = {t: None for t in task_id}
-        query = f"SELECT task_from_id, task_to_id FROM task_relations WHERE relationship = 'parent_of' AND task_to_id IN ( {','.join(['?'] * len(task_id))} )"
+        query = f"SELECT task_from_id, task_to_id FROM {schema}.task_relations WHERE relationship = 'parent_of' AND task_to_id IN ( {','.join(['?'] * len(task_id))} )"
         for row in self._conn.execute(query, task_id):
             parents[row["task_to_id"]] = row["task_from_id"]
         return parents
 
-    def _get_dependencies(self, task_id: Union[int, List[int]]) -> Dict[int, List[int]]:
+    def _get_dependencies(
+        self, task_id: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, List[int]]:
         if isinstance(task_id, int):
             task_id = [task_id]
 
         dependencies = defaultdict(list)
-        query = f"SELECT task_to_id, task_from_id FROM task_relations WHERE relationship = 'blocked_by' AND task_from_id IN ( {','.join(['?'] * len(task_id))} )"
+        query = f"SELECT task_to_id, task_from_id FROM {schema}.task_relations WHERE relationship = 'blocked_by' AND task_from_id IN ( {','.join(['?'] * len(task_id))} )"
         for row in self._conn.execute(query, task_id):
             dependencies[row["task_from_id"]].append(row["task_to_id"])
         return dependencies
 
-    def _get_dependents(self, task_id: Union[int, List[int]]) -> Dict[int, List[int]]:
+    def _get_dependents(
+        self, task_id: Union[int, List[int]], schema: str = "main"
+    ) -> Dict[int, List[int]]:
         """ Get tasks depending on this/these task(s) """
         if isinstance(task_id, int):
             task_id = [task_id]
 
         dependents = defaultdict(list)
-        query = f"SELECT task_from_id, task_to_id FROM task_relations WHERE relationship = 'blocked_by' AND task_to_id IN ( {','.join(['?'] * len(task_id))} )"
+        query = f"SELECT task_from_id, task_to_id FROM {schema}.task_relations WHERE relationship = 'blocked_by' AND task_to_id IN ( {','.join(['?'] * len(task_id))} )"
         for row in self._conn.execute(query, task_id):
             dependents[row["task_to_id"]].append(row["task_from_id"])
         return dependents
 
-    def search_tasks(self, query: str) -> List[Task]:
+    @overload
+    def get_notifications(self, task_id: List[int]) -> Dict[int, List[datetime]]:
+        pass
+
+    @overload
+    def get_notifications(self, task_id: int) -> List[datetime]:
+        pass
+
+    def get_notifications(self, task_id):
+        """ A task's notification times in order, or those of each of a list of tasks """
+        task_ids = task_id if isinstance(task_id, list) else [task_id]
+        notifications: Dict[int, List[datetime]] = {i: [] for i in task_ids}
+        for row in self._conn.execute(
+            f"SELECT task_id, dtm FROM notifications WHERE task_id IN ( {', '.join(['?'] * len(task_ids))} )",
+            task_ids,
+        ):
+            notifications[row["task_id"]].append(datetime.fromisoformat(row["dtm"]))
+        for times in notifications.values():
+            times.sort()
+        return notifications if isinstance(task_id, list) else notifications[task_id]
+
+    def add_notification(self, task_id: int, time: datetime) -> None:
+        with self._transaction():
+            self._conn.execute(
+                "INSERT INTO notifications (task_id, dtm) VALUES (?, ?)",
+                (task_id, time.isoformat()),
+            )
+        self._tasks_changed([task_id])
+
+    def delete_notification(self, task_id: int, time: datetime) -> None:
+        with self._transaction():
+            self._conn.execute(
+                "DELETE FROM notifications WHERE task_id = ? AND dtm = ?",
+                (task_id, time.isoformat()),
+            )
+        self._tasks_changed([task_id])
+
+    def get_reminders(
+        self, after: datetime, task_ids: Optional[List[int]] = None
+    ) -> List[Reminder]:
+        """
+        Look up the due times and notifications of pending tasks later than a time
+
+        Reminders are returned unordered, optionally only for the given tasks.
+        """
+        task_filter = ""
+        params: List[Any] = []
+        if task_ids is not None:
+            task_filter = f"AND tasks.task_id IN ( {','.join(['?'] * len(task_ids))} )"
+            params = list(task_ids)
+
+        reminders: List[Reminder] = [
+            (epoch_to_datetime(row["due_ts"]), row["task_id"], ReminderKind.DUE)
+            for row in self._conn.execute(
+                f"SELECT task_id, due_ts FROM tasks WHERE due_ts > ? AND completion_dtm IS NULL AND NOT is_trashed {task_filter}",
+                [datetime_to_epoch(after)] + params,
+            )
+        ]
+        # notification times are kept as ISO text, so compare them after parsing
+        for row in self._conn.execute(
+            f"SELECT notifications.task_id, notifications.dtm FROM notifications JOIN tasks ON notifications.task_id = tasks.task_id WHERE completion_dtm IS NULL AND NOT is_trashed {task_filter}",
+            params,
+        ):
+            time = datetime.fromisoformat(row["dtm"])
+            if time.tzinfo is None:
+                time = time.replace(tzinfo=timezone.utc)
+            if time > after:
+                reminders.append((time, row["task_id"], ReminderKind.NOTIFICATION))
+        return reminders
+
+    _agenda_bucket_widths = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+    def _agenda_query(
+        self, start: datetime, end: datetime, bucket: str, field: AgendaField
+    ) -> Tuple[List[AgendaBucket], str, str, Dict[str, int]]:
+        """ Lay out empty agenda buckets and the SQL to sort tasks into them """
+        if bucket not in self._agenda_bucket_widths:
+            raise ValueError(
+                f"Invalid agenda bucket '{bucket}'. (Valid buckets are {', '.join(self._agenda_bucket_widths)})"
+            )
+        if end <= start:
+            raise ValueError("An agenda must end after it starts")
+
+        width = self._agenda_bucket_widths[bucket]
+        buckets = [AgendaBucket(None, start)]
+        bucket_start = start
+        while bucket_start < end:
+            bucket_end = min(bucket_start + width, end)
+            buckets.append(AgendaBucket(bucket_start, bucket_end))
+            bucket_start = bucket_end
+
+        column = f"{field.value}_ts"
+        # index into buckets, where earlier times all land in the first one
+        bucket_index = f"CASE WHEN {column} < :start THEN 0 ELSE ({column} - :start) / :width + 1 END"
+        condition = f"{column} < :end AND completion_dtm IS NULL AND NOT is_trashed"
+        params = {
+            "start": datetime_to_epoch(start),
+            "end": datetime_to_epoch(end),
+            "width": width // timedelta(microseconds=1),
+        }
+        return buckets, bucket_index, condition, params
+
+    def get_agenda(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: str = "day",
+        field: AgendaField = AgendaField.DUE,
+    ) -> List[AgendaBucket]:
+        """
+        Group pending tasks by their due (or start) time
+
+        Returns an overdue bucket followed by one bucket per day or week from
+        start to end, each with its tasks ordered by time, then position.
+        Buckets are a fixed length, so pass a local midnight as start for
+        buckets aligned to local days. Subtasks are included alongside their
+        parents, since they are often due on their own.
+        """
+        buckets, bucket_index, condition, params = self._agenda_query(
+            start, end, bucket, field
+        )
+        tasks = []
+        for row in self._conn.execute(
+            f"SELECT {bucket_index} AS agenda_bucket, tasks.* FROM tasks WHERE {condition} ORDER BY {field.value}_ts, position",
+            params,
+        ):
+            task = Task.from_sqlite_row(row)
+            buckets[row["agenda_bucket"]].tasks.append(task)
+            tasks.append(task)
+        self._postprocess_list_tasks(tasks)
+
+        for agenda_bucket in buckets:
+            agenda_bucket.count = len(agenda_bucket.tasks)
+        return buckets
+
+    def get_agenda_counts(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: str = "day",
+        field: AgendaField = AgendaField.DUE,
+    ) -> List[AgendaBucket]:
+        """ Like get_agenda, but only count the tasks of each bucket """
+        buckets, bucket_index, condition, params = self._agenda_query(
+            start, end, bucket, field
+        )
+        for row in self._conn.execute(
+            f"SELECT {bucket_index} AS agenda_bucket, COUNT(*) FROM tasks WHERE {condition} GROUP BY agenda_bucket",
+            params,
+        ):
+            buckets[row["agenda_bucket"]].count = row[1]
+        return buckets
+
+    def _task_pages(self, chunk_size: int) -> Iterator[List[sqlite3.Row]]:
+        """ Page through every task by position rather than holding a cursor open """
+        last_position: Union[int, float] = float("-inf")
+        while True:
+            rows = self._conn.execute(
+                "SELECT * FROM tasks WHERE position > ? ORDER BY position LIMIT ?",
+                (last_position, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            last_position = rows[-1]["position"]
+            yield rows
+
+    def iter_tasks(self, chunk_size: int = 1000) -> Iterator[Task]:
+        """ Stream every task in position order, looking them up a chunk at a time """
+        for rows in self._task_pages(chunk_size):
+            yield from self._postprocess_list_tasks(
+                [Task.from_sqlite_row(row) for row in rows]
+            )
+
+    def export_records(self, chunk_size: int = 1000) -> Iterator[Record]:
+        """
+        Stream the journal as plain, JSON-compatible records
+
+        Lists, tags, and views come first, then tasks in position order and
+        finally the relations between them. Every record has a "type":
+
+        - list: id, name, icon
+        - tag: name, color
+        - view: name, icon, query
+        - task: id, description, notes, priority, created, completed, due,
+          start, trashed, lists (list IDs), tags (names), attributes, and
+          notifications, with times as ISO strings
+        - relation: from, to, relationship (a TaskRelationship value)
+
+        Tasks are read chunk_size at a time, so memory use doesn't grow with
+        the size of the journal.
+        """
+        for row in self._conn.execute("SELECT * FROM lists ORDER BY position"):
+            yield {
+                "type": "list",
+                "id": row["list_id"],
+                "name": row["name"],
+                "icon": row["icon"],
+            }
+        for row in self._conn.execute("SELECT * FROM tags ORDER BY tag_id"):
+            yield {"type": "tag", "name": row["name"], "color": row["color"]}
+        for row in self._conn.execute("SELECT * FROM views ORDER BY position"):
+            yield {
+                "type": "view",
+                "name": row["name"],
+                "icon": row["icon"],
+                "query": row["query"],
+            }
+
+        for rows in self._task_pages(chunk_size):
+            task_ids = [row["task_id"] for row in rows]
+            lists = self._get_task_lists(task_ids)
+            tags = self._get_task_tags(task_ids)
+            attrs = self._get_task_attributes(task_ids)
+            notifications = defaultdict(list)
+            for row in self._conn.execute(
+                f"SELECT task_id, dtm FROM notifications WHERE task_id IN ( {','.join(['?'] * len(task_ids))} ) ORDER BY task_id, dtm",
+                task_ids,
+            ):
+                notifications[row["task_id"]].append(row["dtm"])
+
+            for row in rows:
+                task_id = row["task_id"]
+                record: Record = {
+                    "type": "task",
+                    "id": task_id,
+                    "description": row["description"],
+                    "notes": row["notes"],
+                    "priority": row["priority"],
+                }
+                for key, name in (
+                    ("created", "creation"),
+                    ("completed", "completion"),
+                    ("due", "due"),
+                    ("start", "start"),
+                ):
+                    time = _row_time(row, name)
+                    record[key] = time.isoformat() if time is not None else None
+                record["trashed"] = bool(row["is_trashed"])
+                record["lists"] = lists[task_id]
+                record["tags"] = sorted(tags[task_id])
+                record["attributes"] = attrs[task_id]
+                record["notifications"] = notifications[task_id]
+                yield record
+
+        for row in self._conn.execute(
+            "SELECT * FROM task_relations ORDER BY task_from_id, task_to_id"
+        ):
+            yield {
+                "type": "relation",
+                "from": row["task_from_id"],
+                "to": row["task_to_id"],
+                "relationship": row["relationship"],
+            }
+
+    def import_records(
+        self, records: Iterable[Record], chunk_size: int = 10000
+    ) -> Dict[str, int]:
+        """
+        Add records in the form of export_records to the journal
+
+        Everything is imported in one transaction, inserting rows chunk_size
+        tasks at a time, and nothing is imported if a record is invalid.
+        Task IDs are shifted past the journal's own and tasks are appended
+        in the order they're read. Lists and tags are merged with existing
+        ones of the same name, and tasks may name tags that have no record.
+        Imports into a journal without tasks build its indexes afterwards,
+        which is much faster for big ones. Observers aren't told about
+        imported tasks.
+
+        Returns the number of records imported of each type.
+        """
+        with self._transaction():
+            # the importer may drop indexes, which mustn't outlive a failure
+            self._begin()
+            importer = _RecordImporter(self, chunk_size)
+            for record in records:
+                importer.add(record)
+            importer.finish()
+        return importer.counts
+
+    @property
+    def origin(self) -> str:
+        """ The ID this journal's own changes are logged under """
+        return self._conn.execute(
+            "SELECT value FROM metadata WHERE property = 'origin'"
+        ).fetchone()[0]
+
+    def reset_origin(self) -> None:
+        """
+        Log this journal's changes under a new origin from now on
+
+        Copies of a journal file share its origin, so one of them needs a
+        new one before they can be synced.
+        """
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE metadata SET value = lower(hex(randomblob(16))) WHERE property = 'origin'"
+            )
+
+    @property
+    def change_seq(self) -> int:
+        """ The sequence number of the latest change, or 0 if there are none """
+        return int(
+            self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[
+                0
+            ]
+        )
+
+    def changes_since(
+        self,
+        seq: int = 0,
+        until: Optional[int] = None,
+        exclude_origin: Optional[str] = None,
+        chunk_size: int = 1000,
+    ) -> Iterator[Change]:
+        """
+        Stream the logged changes after seq, up to and including until
+
+        Changes come in the order they were made, read chunk_size at a
+        time. Those made by exclude_origin are left out, e.g. when syncing
+        with the journal that made them.
+        """
+        if until is None:
+            until = self.change_seq
+        while True:
+            rows = self._conn.execute(
+                "SELECT * FROM changes WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+                (seq, until, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            seq = rows[-1]["seq"]
+            for row in rows:
+                if row["origin"] != exclude_origin:
+                    yield Change.from_sqlite_row(row)
+
+    def get_sync_cursor(self, origin: str) -> int:
+        """ The seq of the last change read from the journal with origin, see apply_changes """
+        row = self._conn.execute(
+            "SELECT value FROM metadata WHERE property = ?", (f"sync_cursor:{origin}",)
+        ).fetchone()
+        return int(row["value"]) if row is not None else 0
+
+    def apply_changes(
+        self, changes: Iterable[Change], cursor: Optional[Tuple[str, int]] = None
+    ) -> int:
+        """
+        Play back changes from another journal's log
+
+        Every change is applied in one transaction, column by column, and
+        wherever both journals changed a column the one changed last wins,
+        going by change time, then origin. Deleting a row wins over changes
+        to it made since it was inserted. Changes to rows this journal
+        doesn't have, e.g. ones it deleted, are skipped. Applied changes are
+        logged under their own origin and time, so passing them on to yet
+        another journal resolves the same way. Nothing before them can be
+        undone afterwards, as it may no longer be what they were made on.
+
+        cursor, the origin of the journal the changes were read from and
+        the seq read up to, is saved for get_sync_cursor along with them.
+
+        Returns the number of changes applied.
+        """
+        with self._conn:
+            self._begin()
+            applier = _ChangeApplier(self)
+            for change in changes:
+                applier.apply(change)
+            applier.finish()
+            if cursor is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO metadata (property, value) VALUES (?, ?)",
+                    (f"sync_cursor:{cursor[0]}", str(cursor[1])),
+                )
+        if applier.applied:
+            self._undo_stack.clear()
+            self._redo_stack.clear()
+        self._tasks_changed(applier.task_ids)
+        return applier.applied
+
+    def compact_changes(
+        self, older_than: timedelta, now: Optional[datetime] = None
+    ) -> int:
+        """
+        Drop the logged changes made more than older_than ago that later ones override, returning how many
+
+        That's every change to a row logged before it was last inserted or
+        deleted, and updates whose every column was changed again since. A
+        sync from the compacted log ends up with the same journal, and so
+        does one playing back changes into it, as the latest change to every
+        row and column is kept. Changes that can still be undone are kept,
+        and older_than leaves other connections time to undo theirs.
+        Compacting commits on its own, so it raises RuntimeError within a
+        transaction.
+        """
+        self._check_outside_transaction("The change log can't be compacted")
+        if now is None:
+            now = datetime.now(timezone.utc)
+        cutoff = datetime_to_epoch(now - older_than)
+        with self._conn:
+            self._begin()
+            floor = min(
+                [span[0] for span in [*self._undo_stack, *self._redo_stack]]
+                + [self.change_seq]
+            )
+            later = "FROM changes AS later WHERE later.table_name = changes.table_name AND later.row_key = changes.row_key AND later.seq > changes.seq"
+            old = "seq <= ? AND changed_ts < ?"
+            compacted = self._conn.execute(
+                f"DELETE FROM changes WHERE {old} AND EXISTS (SELECT 1 {later} AND later.operation != 'update')",
+                (floor, cutoff),
+            ).rowcount
+            compacted += self._conn.execute(
+                f"DELETE FROM changes WHERE {old} AND operation = 'update' AND NOT EXISTS ("
+                "SELECT 1 FROM json_each(changes.data) AS field WHERE NOT EXISTS "
+                f"(SELECT 1 {later} AND json_type(later.data, '$.' || field.key) IS NOT NULL))",
+                (floor, cutoff),
+            ).rowcount
+        return compacted
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo_stack)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo_stack)
+
+    def undo(self) -> bool:
+        """
+        Take back the latest change to the journal, returning whether there was one
+
+        A change is everything one call did, e.g. deleting a task along with
+        its tags or a whole import, and it's taken back in one transaction
+        by playing its part of the change log backwards. Deleted rows are
+        put back with their uids, but may get new IDs. Only spans of the log
+        are kept in memory, up to the last undo_limit changes. Undo commits
+        on its own, so it raises RuntimeError within a transaction.
+        """
+        self._check_outside_transaction("Changes can't be undone")
+        if not self._undo_stack:
+            return False
+        self._redo_stack.append(self._revert(self._undo_stack[-1]))
+        self._undo_stack.pop()
+        return True
+
+    def redo(self) -> bool:
+        """ Make the latest undone change again, returning whether there was one """
+        self._check_outside_transaction("Changes can't be redone")
+        if not self._redo_stack:
+            return False
+        self._undo_stack.append(self._revert(self._redo_stack[-1]))
+        self._redo_stack.pop()
+        return True
+
+    def _check_outside_transaction(self, what: str) -> None:
+        # for methods committing on their own, which would commit the
+        # transaction's changes so far along with them
+        if self._transaction_depth:
+            raise RuntimeError(f"{what} within a transaction")
+
+    def _revert(self, span: Tuple[int, int]) -> Tuple[int, int]:
+        """ Undo the changes logged in a span, returning the span logging that """
+        with self._conn:
+            self._begin()
+            first_seq = self.change_seq
+            reverter = _ChangeReverter(self)
+            reverter.revert(*span)
+            last_seq = self.change_seq
+        self._tasks_changed(reverter.task_ids)
+        return first_seq, last_seq
+
+    def search_tasks(self, query: str, include_archived: bool = False) -> List[Task]:
+        """ Find tasks whose description or notes contain query, in the attached archive too if include_archived is set """
+        pattern = "%" + query + "%"
+        sql = self._tasks_query("description LIKE ? OR notes LIKE ?", include_archived)
         return [
             Task.from_sqlite_row(row)
+            for row in self._conn.execute(sql, [pattern] * sql.count("?"))
+        ]
+
+    def _tasks_query(self, condition: str, include_archived: bool = False) -> str:
+        """
+        SQL selecting the tasks matching a condition, and archived ones if asked and attached
+
+        Archived tasks are marked by an archived column, see Task.archived.
+        """
+        if not (include_archived and self._has_archive()):
+            return f"SELECT * FROM tasks WHERE {condition}"
+        columns = ", ".join(
+            row["name"] for row in self._conn.execute("PRAGMA main.table_info(tasks)")
+        )
+        return (
+            f"SELECT * FROM (SELECT {columns}, 0 AS archived FROM main.tasks WHERE {condition} "
+            f"UNION ALL SELECT {columns}, 1 FROM archive.tasks WHERE {condition})"
+        )
+
+    def _has_archive(self) -> bool:
+        return any(
+            row["name"] == "archive"
+            for row in self._conn.execute("PRAGMA database_list")
+        )
+
+    @property
+    def archive_path(self) -> Optional[Path]:
+        """ The file of the attached archive, or None if there is none or it's in memory """
+        for row in self._conn.execute("PRAGMA database_list"):
+            if row["name"] == "archive":
+                return Path(row["file"]) if row["file"] else None
+        return None
+
+    def attach_archive(self, path: Optional[Path] = None) -> Path:
+        """
+        Attach the database archived tasks are moved to, creating it if need be
+
+        By default it's next to the journal, e.g. journal-archive.db for
+        journal.db. Any other archive is detached first.
+        """
+        if path is None:
+            if self._path is None:
+                raise ValueError("In-memory journals have no archive by default")
+            path = self._path.with_name(f"{self._path.stem}-archive{self._path.suffix}")
+        if self._has_archive():
+            self.detach_archive()
+        attach_archive(self._conn, path)
+        self._reader_archive = self.archive_path
+        self._reader_generation += 1
+        return path
+
+    def detach_archive(self) -> None:
+        self._conn.execute("DETACH DATABASE archive")
+        self._reader_archive = None
+        self._reader_generation += 1
+
+    def archive_tasks(
+        self,
+        older_than: timedelta,
+        batch_size: int = 500,
+        now: Optional[datetime] = None,
+    ) -> int:
+        """
+        Move tasks completed more than older_than ago to the archive, returning how many
+
+        Tasks move along with their lists, tags, attributes, relations, and
+        notifications, batch_size tasks per transaction so the journal is
+        never locked for long, and the archive next to the journal is
+        attached if none is. Archiving only frees up the journal: it isn't
+        logged as a change, so it's neither undone nor synced, and archived
+        tasks' IDs are never given to new tasks. Nothing done before it can
+        be undone afterwards, as archived tasks are out of undo's reach.
+        Trashed tasks aren't archived. Archiving commits on its own, so it
+        raises RuntimeError within a transaction.
+        """
+        self._check_outside_transaction("Tasks can't be archived")
+        if not self._has_archive():
+            self.attach_archive()
+        if now is None:
+            now = datetime.now(timezone.utc)
+        cutoff = datetime_to_epoch(now - older_than)
+        self._conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS archive_batch (task_id INTEGER PRIMARY KEY)"
+        )
+        archived = 0
+        while True:
+            with self._conn:
+                self._begin()
+                seq = self.change_seq
+                self._conn.execute("DELETE FROM archive_batch")
+                count = self._conn.execute(
+                    "INSERT INTO archive_batch SELECT task_id FROM main.tasks WHERE completion_ts < ? AND NOT is_trashed LIMIT ?",
+                    (cutoff, batch_size),
+                ).rowcount
+                if count == 0:
+                    break
+                self._archive_batch()
+                # the tasks are still the journal's, just stored elsewhere
+                self._conn.execute("DELETE FROM changes WHERE seq > ?", (seq,))
+            archived += count
+            self._tasks_changed(
+                [
+                    row[0]
+                    for row in self._conn.execute("SELECT task_id FROM archive_batch")
+                ]
+            )
+        if archived:
+            self._undo_stack.clear()
+            self._redo_stack.clear()
+        return archived
+
+    def _archive_batch(self) -> None:
+        """ Move the tasks in archive_batch to the archive, with everything they link to """
+        rows = {
+            "lists": "list_id IN (SELECT list_id FROM main.task_lists WHERE task_id IN archive_batch)",
+            "tags": "tag_id IN (SELECT tag_id FROM main.task_tags WHERE task_id IN archive_batch)",
+            "task_relations": "task_from_id IN archive_batch OR task_to_id IN archive_batch",
+        }
+        for table in ARCHIVE_TABLES:
+            columns = ", ".join(
+                row["name"]
+                for row in self._conn.execute(f"PRAGMA main.table_info({table})")
+            )
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO archive.{table} ({columns}) "
+                f"SELECT {columns} FROM main.{table} WHERE {rows.get(table, 'task_id IN archive_batch')}"
+            )
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO metadata (property, value) VALUES ('archived_task_id', {SQL_MAX_TASK_ID})"
+        )
+        # lists and tags stay, and links go before the tasks they link
+        for table in reversed(ARCHIVE_TABLES):
+            if table not in {"lists", "tags"}:
+                self._conn.execute(
+                    f"DELETE FROM main.{table} WHERE {rows.get(table, 'task_id IN archive_batch')}"
+                )
+
+
+class _RecordImporter:
+    """ Buffer imported records into chunked inserts, remapping their IDs """
+
+    _insert_statements = (
+        "INSERT INTO tasks (task_id, position, description, notes, priority, creation_dtm, creation_ts, completion_dtm, completion_ts, due_dtm, due_ts, start_dtm, start_ts, is_trashed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "INSERT OR IGNORE INTO task_lists (list_id, task_id) VALUES (?, ?)",
+        "INSERT OR IGNORE INTO task_tags (task_id, tag_id) VALUES (?, ?)",
+        "INSERT OR REPLACE INTO task_attributes (task_id, attr_key, attr_type, attr_value, integer_value, real_value, text_value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "INSERT OR IGNORE INTO notifications (task_id, dtm) VALUES (?, ?)",
+        "INSERT OR IGNORE INTO task_relations (task_from_id, task_to_id, relationship) VALUES (?, ?, ?)",
+    )
+    (
+        _insert_task,
+        _insert_task_list,
+        _insert_task_tag,
+        _insert_task_attribute,
+        _insert_notification,
+        _insert_relation,
+    ) = _insert_statements
+
+    # tables of task rows, with the column of the task each row belongs to
+    _indexed_tables = {
+        "tasks": "task_id",
+        "task_lists": "task_id",
+        "task_tags": "task_id",
+        "task_attributes": "task_id",
+        "notifications": "task_id",
+        "task_relations": "task_from_id",
+    }
+
+    # record keys of task times and their column prefixes
+    _task_times = (
+        ("created", "creation"),
+        ("completed", "completion"),
+        ("due", "due"),
+        ("start", "start"),
+    )
+
+    def __init__(self, journal: Journal, chunk_size: int):
+        self._journal = journal
+        self._conn = journal._conn
+        self._chunk_size = chunk_size
+        self._gap = journal.position_gap
+        self._rows: Dict[str, List[tuple]] = {
+            sql: [] for sql in self._insert_statements
+        }
+        self._buffered = 0
+        self.counts = {kind: 0 for kind in ("list", "tag", "view", "task", "relation")}
+
+        (
+            max_task_id,
+            max_task_position,
+            max_list_id,
+            max_list_position,
+            max_tag_id,
+            max_view_id,
+        ) = self._conn.execute(
+            f"SELECT {SQL_MAX_TASK_ID}, (SELECT MAX(position) FROM tasks), (SELECT MAX(list_id) FROM lists), (SELECT MAX(position) FROM lists), (SELECT MAX(tag_id) FROM tags), (SELECT MAX(view_id) FROM views)"
+        ).fetchone()
+        # shifting task IDs rather than mapping them keeps memory use constant
+        self.task_offset = max_task_id or 0
+        self._task_position = max_task_position or 0
+        self._list_id = max_list_id or 0
+        self._list_position = max_list_position or 0
+        self._tag_id = max_tag_id or 0
+        self._view_id = max_view_id or 0
+
+        # lists by their ID in the records, and existing lists and tags by name
+        self._list_ids: Dict[Any, int] = {}
+        self._lists_by_name = {
+            row["name"]: row["list_id"]
+            for row in self._conn.execute("SELECT list_id, name FROM lists")
+        }
+        self._tags_by_name = {
+            row["name"]: row["tag_id"]
+            for row in self._conn.execute("SELECT tag_id, name FROM tags")
+        }
+
+        # bulk loads sort each index once instead of inserting into them row
+        # by row, and log the new rows with a statement per table instead of
+        # a trigger per row
+        self._dropped: List[str] = []
+        # task IDs carry on past archived ones, so it's positions that tell
+        # whether the journal has any tasks
+        self._bulk = max_task_position is None
+        if self._bulk:
+            tables = list(self._indexed_tables)
             for row in self._conn.execute(
-                "SELECT * FROM tasks WHERE description LIKE ? OR notes LIKE ?",
-                ("%" + query + "%", "%" + query + "%"),
+                f"SELECT type, name, sql FROM sqlite_master WHERE (type = 'index' AND sql IS NOT NULL AND tbl_name IN ( {','.join(['?'] * len(tables))} )) OR (type = 'trigger' AND name IN ( {','.join(['?'] * len(tables))} ))",
+                tables + [f"{table}_log_insert" for table in tables],
+            ).fetchall():
+                self._conn.execute(f"DROP {row['type'].upper()} {row['name']}")
+                self._dropped.append(row["sql"])
+
+    def add(self, record: Record) -> None:
+        handlers = {
+            "list": self._add_list,
+            "tag": self._add_tag,
+            "view": self._add_view,
+            "task": self._add_task,
+            "relation": self._add_relation,
+        }
+        kind = record.get("type")
+        if kind not in handlers:
+            raise ValueError(
+                f"Invalid record type '{kind}'. (Valid types are {', '.join(handlers)})"
             )
-        ]
+        handlers[kind](record)
+        self.counts[kind] += 1
+        if self._buffered >= self._chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for sql, rows in self._rows.items():
+            if rows:
+                self._conn.executemany(sql, rows)
+                rows.clear()
+        self._buffered = 0
+
+    def finish(self) -> None:
+        self.flush()
+        if self._bulk:
+            # as the insert triggers would have, tasks before the rows linking to them
+            self._conn.execute(
+                f"UPDATE tasks SET uid = {SQL_NEW_UID} WHERE task_id > ? AND uid IS NULL",
+                (self.task_offset,),
+            )
+            for table, column in self._indexed_tables.items():
+                self._conn.execute(
+                    f"{sql_insert_changes(table, f'{table}.', 'insert')} WHERE {table}.{column} > ?",
+                    (self.task_offset,),
+                )
+        for sql in self._dropped:
+            self._conn.execute(sql)
+
+    def _add_list(self, record: Record) -> None:
+        name = record["name"]
+        if name not in self._lists_by_name:
+            self._list_id += 1
+            self._list_position += self._gap
+            self._conn.execute(
+                "INSERT INTO lists (list_id, name, icon, position) VALUES (?, ?, ?, ?)",
+                (self._list_id, name, record.get("icon"), self._list_position),
+            )
+            self._lists_by_name[name] = self._list_id
+        self._list_ids[record.get("id", name)] = self._lists_by_name[name]
+
+    def _add_tag(self, record: Record) -> None:
+        self._get_tag_id(record["name"], record.get("color"))
+
+    def _get_tag_id(self, name: str, color: Optional[str] = None) -> int:
+        if name not in self._tags_by_name:
+            self._tag_id += 1
+            self._conn.execute(
+                "INSERT INTO tags (tag_id, name, color) VALUES (?, ?, ?)",
+                (self._tag_id, name, color),
+            )
+            self._tags_by_name[name] = self._tag_id
+        return self._tags_by_name[name]
+
+    def _add_view(self, record: Record) -> None:
+        compile_filter(record["query"])
+        self._view_id += 1
+        self._conn.execute(
+            "INSERT INTO views (view_id, name, icon, query, position) VALUES (?, ?, ?, ?, ?)",
+            (
+                self._view_id,
+                record["name"],
+                record.get("icon"),
+                record["query"],
+                self._view_id,
+            ),
+        )
+
+    def _task_id(self, source_id: Any) -> int:
+        if (
+            not isinstance(source_id, int)
+            or isinstance(source_id, bool)
+            or source_id < 1
+        ):
+            raise ValueError(f"Task IDs must be positive integers, not '{source_id}'")
+        return self.task_offset + source_id
+
+    def _add_task(self, record: Record) -> None:
+        task_id = self._task_id(record.get("id"))
+        self._task_position += self._gap
+
+        times = []
+        for key, _ in self._task_times:
+            time = _record_time(record.get(key))
+            if time is None and key == "created":
+                time = datetime.now(timezone.utc)
+            times.extend(
+                (
+                    time.isoformat() if time is not None else None,
+                    datetime_to_epoch(time),
+                )
+            )
+        self._rows[self._insert_task].append(
+            (
+                task_id,
+                self._task_position,
+                record.get("description") or "",
+                record.get("notes"),
+                int(record.get("priority") or 0),
+                *times,
+                bool(record.get("trashed")),
+            )
+        )
+
+        rows = self._rows
+        for list_id in record.get("lists") or ():
+            if list_id not in self._list_ids:
+                raise ValueError(f"Task {record['id']} is in unknown list '{list_id}'")
+            rows[self._insert_task_list].append((self._list_ids[list_id], task_id))
+        for tag in record.get("tags") or ():
+            rows[self._insert_task_tag].append((task_id, self._get_tag_id(tag)))
+        for key, value in (record.get("attributes") or {}).items():
+            values = self._journal._attribute_values(value)
+            rows[self._insert_task_attribute].append(
+                (
+                    task_id,
+                    key,
+                    values["attr_type"],
+                    values["attr_value"],
+                    values["integer_value"],
+                    values["real_value"],
+                    values["text_value"],
+                )
+            )
+        for time in record.get("notifications") or ():
+            rows[self._insert_notification].append(
+                (task_id, _record_time(time).isoformat())
+            )
+        self._buffered += 1
+
+    def _add_relation(self, record: Record) -> None:
+        self._rows[self._insert_relation].append(
+            (
+                self._task_id(record.get("from")),
+                self._task_id(record.get("to")),
+                TaskRelationship(record.get("relationship")).value,
+            )
+        )
+        self._buffered += 1
+
+
+# a change's time and origin, which order conflicting changes
+_Stamp = Tuple[int, str]
+
+
+class _ChangeApplier:
+    """ Apply changes from another journal, keeping the latest value of every column """
+
+    # tables whose rows are ordered by a unique position
+    _positioned_tables = ("tasks", "lists", "views")
+
+    def __init__(self, journal: Journal):
+        self._conn = journal._conn
+        self._gap = journal.position_gap
+        self.applied = 0
+        self.task_ids: Set[int] = set()
+        # rows moved out of the way of another row's position, by table and
+        # rowid, with the position and stamp of the change that moved them
+        self._parked: Dict[Tuple[str, int], Tuple[int, Optional[_Stamp]]] = {}
+
+    def apply(self, change: Change) -> None:
+        if change.table not in CHANGE_LOG_TABLES:
+            raise ValueError(f"Invalid change table '{change.table}'")
+        key_columns, fields = CHANGE_LOG_TABLES[change.table]
+        if len(change.key) != len(key_columns):
+            raise ValueError(f"Invalid key {change.key} of a {change.table} change")
+        key = self._local_key(change)
+        if key is None:
+            # a task, list, or tag this journal doesn't have (anymore)
+            return
+
+        table = change.table
+        stamp = (change.timestamp, change.origin)
+        inserted, field_stamps = self._stamps(change)
+        row = self._get_row(table, key)
+        last_seq = self._last_seq()
+
+        if change.operation == ChangeOperation.DELETE:
+            if row is None or (inserted is not None and inserted >= stamp):
+                return
+            self._delete(table, row)
+        elif row is None:
+            if change.operation == ChangeOperation.UPDATE or (
+                inserted is not None and inserted >= stamp
+            ):
+                return
+            values = dict(key)
+            values.update((field, (change.data or {}).get(field)) for field in fields)
+            self._insert(table, values, stamp)
+        else:
+            values = {
+                field: value
+                for field, value in (change.data or {}).items()
+                if field in fields
+                and (field not in field_stamps or field_stamps[field] < stamp)
+            }
+            if not values:
+                return
+            self._update(table, row, values, stamp)
+
+        self._log_as(stamp, last_seq)
+        self.applied += 1
+
+    def finish(self) -> None:
+        """
+        Place the rows parked out of the way of another row's position
+
+        Where two rows still want the same position, the one with the
+        smaller uid gets it and the other goes right after it, so they end
+        up in the same order in either journal.
+        """
+        for (table, rowid), (position, stamp) in self._parked.items():
+            row = self._conn.execute(
+                f"SELECT uid FROM {table} WHERE rowid = ?", (rowid,)
+            ).fetchone()
+            if row is None:
+                continue
+            last_seq = self._last_seq()
+            occupant = self._conn.execute(
+                f"SELECT rowid AS rowid, uid FROM {table} WHERE position = ?",
+                (position,),
+            ).fetchone()
+            if occupant is not None:
+                following = self._following_position(table, position)
+                if occupant["uid"] < row["uid"]:
+                    position = following
+                else:
+                    self._conn.execute(
+                        f"UPDATE {table} SET position = ? WHERE rowid = ?",
+                        (following, occupant["rowid"]),
+                    )
+            self._conn.execute(
+                f"UPDATE {table} SET position = ? WHERE rowid = ?", (position, rowid)
+            )
+            if stamp is not None:
+                self._log_as(stamp, last_seq)
+        self._parked.clear()
+
+    def _get_row(self, table: str, key: Dict[str, Any]) -> Optional[sqlite3.Row]:
+        return self._conn.execute(
+            f"SELECT rowid AS rowid, * FROM {table} WHERE {' AND '.join(f'{column} = ?' for column in key)}",
+            list(key.values()),
+        ).fetchone()
+
+    def _last_seq(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM changes"
+        ).fetchone()[0]
+
+    def _log_as(self, stamp: _Stamp, last_seq: int) -> None:
+        """ Log what was just changed as the change it came from rather than one made here """
+        self._conn.execute(
+            "UPDATE changes SET changed_ts = ?, origin = ? WHERE seq > ?",
+            stamp + (last_seq,),
+        )
+
+    def _local_key(self, change: Change) -> Optional[Dict[str, Any]]:
+        """ The primary key of a change's row here, or None if a row it belongs to is missing """
+        key = {}
+        for (column, referenced), value in zip(
+            CHANGE_LOG_TABLES[change.table][0], change.key
+        ):
+            if referenced is not None:
+                row = self._conn.execute(
+                    f"SELECT {UID_TABLES[referenced]} FROM {referenced} WHERE uid = ?",
+                    (value,),
+                ).fetchone()
+                if row is None:
+                    return None
+                value = row[0]
+            key[column] = value
+        return key
+
+    def _stamps(self, change: Change) -> Tuple[Optional[_Stamp], Dict[str, _Stamp]]:
+        """ The latest insert or delete of a change's row here, and the latest change to each column """
+        row_key = self._conn.execute(
+            "SELECT json(?)", (json.dumps(list(change.key), ensure_ascii=False),)
+        ).fetchone()[0]
+        inserted: Optional[_Stamp] = None
+        field_stamps: Dict[str, _Stamp] = {}
+        for row in self._conn.execute(
+            "SELECT origin, changed_ts, operation, data FROM changes WHERE table_name = ? AND row_key = ?",
+            (change.table, row_key),
+        ):
+            stamp = (row["changed_ts"], row["origin"])
+            if row["operation"] != ChangeOperation.UPDATE.value:
+                inserted = max(inserted, stamp) if inserted is not None else stamp
+            for field in json.loads(row["data"]) if row["data"] is not None else ():
+                if field not in field_stamps or field_stamps[field] < stamp:
+                    field_stamps[field] = stamp
+        return inserted, field_stamps
+
+    def _insert(
+        self, table: str, values: Dict[str, Any], stamp: Optional[_Stamp]
+    ) -> None:
+        if table in UID_TABLES:
+            id_column = UID_TABLES[table]
+            values[id_column] = _max_id(self._conn, table) + 1
+            self._make_unique(table, values, values[id_column], stamp)
+        self._conn.execute(
+            f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join(['?'] * len(values))})",
+            list(values.values()),
+        )
+        self._changed(table, values)
+
+    def _update(
+        self,
+        table: str,
+        row: sqlite3.Row,
+        values: Dict[str, Any],
+        stamp: Optional[_Stamp],
+    ) -> None:
+        self._make_unique(table, values, row["rowid"], stamp)
+        self._conn.execute(
+            f"UPDATE {table} SET {', '.join(f'{field} = ?' for field in values)} WHERE rowid = ?",
+            list(values.values()) + [row["rowid"]],
+        )
+        self._changed(table, row)
+
+    def _delete(self, table: str, row: sqlite3.Row) -> None:
+        if table in UID_TABLES:
+            # along with rows linking to it that were added here meanwhile
+            for link_table, (key_columns, _) in CHANGE_LOG_TABLES.items():
+                for column, referenced in key_columns:
+                    if referenced == table:
+                        self._conn.execute(
+                            f"DELETE FROM {link_table} WHERE {column} = ?",
+                            (row[UID_TABLES[table]],),
+                        )
+        self._conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (row["rowid"],))
+        self._changed(table, row)
+
+    def _make_unique(
+        self, table: str, values: Dict[str, Any], rowid: int, stamp: Optional[_Stamp]
+    ) -> None:
+        """
+        Keep a row's new position and tag name from clashing with another row's
+
+        A taken position is often only taken midway through a batch of
+        changes, e.g. one renumbering every task, so the row is parked below
+        every other until finish(). Tag names clash when a tag was renamed
+        to one added to the other journal, and get a number instead.
+        """
+        if table in self._positioned_tables and "position" in values:
+            self._parked.pop((table, rowid), None)
+            if self._taken(table, "position", values["position"], rowid):
+                self._parked[(table, rowid)] = (values["position"], stamp)
+                values["position"] = (
+                    self._conn.execute(f"SELECT MIN(position) FROM {table}").fetchone()[
+                        0
+                    ]
+                    - self._gap
+                )
+        if table == "tags" and "name" in values:
+            name, number = values["name"], 2
+            while self._taken(table, "name", name, rowid):
+                name = f"{values['name']} ({number})"
+                number += 1
+            values["name"] = name
+
+    def _taken(self, table: str, column: str, value: Any, rowid: int) -> bool:
+        return (
+            self._conn.execute(
+                f"SELECT 1 FROM {table} WHERE {column} = ? AND rowid != ?",
+                (value, rowid),
+            ).fetchone()
+            is not None
+        )
+
+    def _following_position(self, table: str, position: int) -> int:
+        """ A free position right after another """
+        following = self._conn.execute(
+            f"SELECT MIN(position) FROM {table} WHERE position > ?", (position,)
+        ).fetchone()[0]
+        if following is None:
+            return position + self._gap
+        if following - position > 1:
+            return position + (following - position) // 2
+        return (
+            self._conn.execute(f"SELECT MAX(position) FROM {table}").fetchone()[0]
+            + self._gap
+        )
+
+    def _changed(self, table: str, row: Union[sqlite3.Row, Dict[str, Any]]) -> None:
+        """ Remember which task a changed row belongs to, to tell observers """
+        if table == "tasks":
+            self.task_ids.add(row["task_id"])
+        for column, referenced in CHANGE_LOG_TABLES[table][0]:
+            if referenced == "tasks":
+                self.task_ids.add(row[column])
+
+
+class _ChangeReverter(_ChangeApplier):
+    """
+    Undo changes made here, newest first, logging that as changes of its own
+
+    Bulk operations log runs of one kind of change to many rows of a table,
+    which are undone with a statement per run rather than per row.
+    """
+
+    # columns only one row of a table may have a value of
+    _unique_columns = {
+        "tasks": ("position",),
+        "lists": ("position",),
+        "views": ("position",),
+        "tags": ("name",),
+    }
+
+    def __init__(self, journal: Journal):
+        super().__init__(journal)
+        # deleted rows linking to rows that are yet to be put back
+        self._deferred: List[Change] = []
+
+    def revert(self, seq: int, last_seq: int, chunk_size: int = 1000) -> None:
+        """ Undo the changes logged after seq, up to and including last_seq """
+        for table, operation, first, last in self._runs(seq, last_seq, chunk_size):
+            if last > first and self._revert_run(table, operation, first, last):
+                continue
+            while last >= first:
+                rows = self._conn.execute(
+                    "SELECT * FROM changes WHERE seq >= ? AND seq <= ? ORDER BY seq DESC LIMIT ?",
+                    (first, last, chunk_size),
+                ).fetchall()
+                # seqs of deleted changes, e.g. archiving's, leave gaps
+                if not rows:
+                    break
+                for row in rows:
+                    self.apply(Change.from_sqlite_row(row))
+                last = rows[-1]["seq"] - 1
+        self.finish()
+
+    def _runs(
+        self, seq: int, last_seq: int, chunk_size: int
+    ) -> List[Tuple[str, ChangeOperation, int, int]]:
+        """ The runs of changes to one table by one operation in a span, newest first """
+        runs: List[Tuple[str, ChangeOperation, int, int]] = []
+        while last_seq > seq:
+            rows = self._conn.execute(
+                "SELECT seq, table_name, operation FROM changes WHERE seq > ? AND seq <= ? ORDER BY seq DESC LIMIT ?",
+                (seq, last_seq, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                table, operation = row["table_name"], ChangeOperation(row["operation"])
+                if runs and runs[-1][:2] == (table, operation):
+                    runs[-1] = (table, operation, row["seq"], runs[-1][3])
+                else:
+                    runs.append((table, operation, row["seq"], row["seq"]))
+            last_seq = rows[-1]["seq"] - 1
+        return runs
+
+    def _revert_run(
+        self, table: str, operation: ChangeOperation, first: int, last: int
+    ) -> bool:
+        """
+        Undo a run of changes in one statement, returning whether it could be
+
+        Runs changing a row more than once, or with rows they link to
+        missing, are left to be undone row by row, as are unique columns
+        that would clash with another row's.
+        """
+        key_columns, fields = CHANGE_LOG_TABLES[table]
+        # the run's changes, joined to the rows they link, and those to
+        # the rows changed
+        joins, key = [], []
+        for i, (column, referenced) in enumerate(key_columns):
+            value = f"json_extract(changes.row_key, '$[{i}]')"
+            if referenced is not None:
+                joins.append(f"JOIN {referenced} AS key{i} ON key{i}.uid = {value}")
+                value = f"key{i}.{UID_TABLES[referenced]}"
+            key.append((column, value))
+        matches = " AND ".join(f"{table}.{column} = {value}" for column, value in key)
+        in_run = "WHERE changes.seq >= ? AND changes.seq <= ?"
+        changes = f"FROM changes {' '.join(joins)} {in_run}"
+        changed = f"FROM changes {' '.join(joins)} JOIN {table} ON {matches} {in_run}"
+
+        counts = self._conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT changes.row_key) {changes}", (first, last)
+        ).fetchone()
+        if counts[0] != last - first + 1 or counts[1] != counts[0]:
+            return False
+        unique_columns = self._unique_columns.get(table, ())
+
+        if operation == ChangeOperation.INSERT:
+            rows = self._conn.execute(
+                f"SELECT {table}.* {changed}", (first, last)
+            ).fetchall()
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT {table}.rowid {changed})",
+                (first, last),
+            )
+        elif operation == ChangeOperation.DELETE:
+            for column in unique_columns:
+                if self._conn.execute(
+                    f"SELECT 1 FROM changes JOIN {table} ON {table}.{column} = json_extract(changes.old_data, '$.{column}') {in_run}",
+                    (first, last),
+                ).fetchone():
+                    return False
+            columns = [column for column, _ in key] + list(fields)
+            values = [value for _, value in key] + [
+                f"json_extract(changes.old_data, '$.{field}')" for field in fields
+            ]
+            params: List[Any] = []
+            if table in UID_TABLES:
+                # new IDs, in the order the rows were deleted
+                columns.insert(0, UID_TABLES[table])
+                values.insert(0, "? + changes.seq")
+                params.append(_max_id(self._conn, table) - first + 1)
+            self._conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(values)} {changes} "
+                f"AND NOT EXISTS (SELECT 1 FROM {table} WHERE {matches})",
+                params + [first, last],
+            )
+            rows = self._conn.execute(
+                f"SELECT {table}.* {changed}", (first, last)
+            ).fetchall()
+        else:
+            for column in unique_columns:
+                if self._conn.execute(
+                    f"SELECT 1 FROM changes {in_run} AND json_type(changes.old_data, '$.{column}') IS NOT NULL",
+                    (first, last),
+                ).fetchone():
+                    return False
+            # each row's old values, looked up by the key it's logged under
+            old_data = (
+                f"SELECT old_data FROM changes WHERE table_name = '{table}' "
+                f"AND row_key = {sql_change_key(table, f'{table}.')} AND seq >= ? AND seq <= ?"
+            )
+            assignments = [
+                f"{field} = (SELECT CASE WHEN json_type(old_data, '$.{field}') IS NULL THEN {table}.{field} "
+                f"ELSE json_extract(old_data, '$.{field}') END FROM ({old_data}))"
+                for field in fields
+            ]
+            self._conn.execute(
+                f"UPDATE {table} SET {', '.join(assignments)} "
+                f"WHERE rowid IN (SELECT {table}.rowid {changed})",
+                [first, last] * (len(fields) + 1),
+            )
+            rows = self._conn.execute(
+                f"SELECT {table}.* {changed}", (first, last)
+            ).fetchall()
+
+        for row in rows:
+            self._changed(table, row)
+        self.applied += last - first + 1
+        return True
+
+    def apply(self, change: Change) -> None:
+        key = self._local_key(change)
+        if key is None:
+            if change.operation == ChangeOperation.DELETE:
+                self._deferred.append(change)
+            return
+
+        table = change.table
+        row = self._get_row(table, key)
+        if change.operation == ChangeOperation.INSERT:
+            if row is None:
+                return
+            self._delete(table, row)
+        elif change.operation == ChangeOperation.DELETE:
+            if row is not None:
+                return
+            values = dict(key)
+            values.update(change.old or {})
+            self._insert(table, values, None)
+        else:
+            if row is None or not change.old:
+                return
+            self._update(table, row, dict(change.old), None)
+        self.applied += 1
+
+    def finish(self) -> None:
+        deferred, self._deferred = self._deferred, []
+        for change in deferred:
+            if self._local_key(change) is not None:
+                self.apply(change)
+        super().finish()
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """ Whether a query failed because another connection held the lock past the busy timeout """
+    return str(error).startswith("database is locked")
+
+
+def _max_id(conn: sqlite3.Connection, table: str) -> int:
+    """ The highest ID given to a row of a table in UID_TABLES, counting archived tasks """
+    if table == "tasks":
+        return conn.execute(f"SELECT {SQL_MAX_TASK_ID}").fetchone()[0]
+    return conn.execute(
+        f"SELECT COALESCE(MAX({UID_TABLES[table]}), 0) FROM {table}"
+    ).fetchone()[0]
+
+
+def _record_time(value: Union[datetime, str, None]) -> Optional[datetime]:
+    """ Read a record time, given as a datetime or ISO string """
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def prefetch_overview(
+    db_path: Path, list_id: Union[CoreTaskList, int] = CoreTaskList.PENDING
+) -> JournalOverview:
+    """ Read a journal overview on a private connection, e.g. from a worker thread """
+    journal = Journal(db_path)
+    try:
+        return journal.get_overview(list_id)
+    finally:
+        journal.close()
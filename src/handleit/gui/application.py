@@ -1,12 +1,18 @@
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from pathlib import Path
+from typing import List, Optional
 
 import gi
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Handy", "1")
 
-from gi.repository import Gtk, Gio, Gdk, Handy
+from gi.repository import GLib, Gtk, Gio, Gdk, Handy
 
+from .. import startup
+from ..core import decode_list_id, prefetch_overview
+from ..io.snapshot import read_snapshot
 from .window import HandleItWindow
 
 
@@ -34,11 +40,63 @@ class HandleIt(Gtk.Application):
         # super does not work here yet, see https://gitlab.gnome.org/GNOME/pygobject/-/issues/58
         Gtk.Application.do_startup(self)
         Handy.init()
+        self._settings = Gio.Settings.new(self.props.application_id)
+        self.set_accels_for_action("win.undo", ["<Primary>z"])
+        self.set_accels_for_action("win.redo", ["<Primary><Shift>z"])
+        startup.mark("application started")
 
     def do_activate(self):
         win = self.props.active_window
         if not win:
+            # read the last journal in the background while the window is built
+            last_journal = self._get_last_journal()
+            overview = None
+            if last_journal is not None:
+                overview = self._prefetch_overview(last_journal)
+
             win = HandleItWindow(application=self)
+            startup.mark("window built")
+
+            if overview is not None:
+                snapshot = read_snapshot(last_journal)
+                if snapshot is not None:
+                    # draw the snapshot now and swap in the journal once it's read
+                    win.show_snapshot(snapshot)
+                    overview.add_done_callback(
+                        lambda future: GLib.idle_add(
+                            self._restore_journal, win, last_journal, future
+                        )
+                    )
+                else:
+                    self._restore_journal(win, last_journal, overview)
+            GLib.idle_add(self._on_first_idle)
 
         win.show_all()
         win.present()
+
+    def _get_last_journal(self) -> Optional[Path]:
+        path = self._settings.get_string("last-journal")
+        if path and Path(path).is_file():
+            return Path(path)
+        return None
+
+    def _prefetch_overview(self, path: Path) -> Future:
+        list_id = decode_list_id(self._settings.get_int("last-list"))
+        executor = ThreadPoolExecutor(max_workers=1)
+        overview = executor.submit(prefetch_overview, path, list_id)
+        # let the worker thread exit on its own once the overview is read
+        executor.shutdown(wait=False)
+        return overview
+
+    def _restore_journal(
+        self, win: HandleItWindow, path: Path, overview: Future
+    ) -> bool:
+        try:
+            win.restore_journal(path, overview.result())
+        except Exception:
+            logging.exception(f"Could not reopen journal '{path}'")
+        return GLib.SOURCE_REMOVE
+
+    def _on_first_idle(self):
+        startup.mark("first frame idle")
+        return GLib.SOURCE_REMOVE
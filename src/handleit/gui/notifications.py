@@ -0,0 +1,41 @@
+from typing import Callable, Optional
+
+from gi.repository import GLib, Gio
+
+from ..core import ReminderKind, Task
+from ..scheduler import Timer
+
+
+class GLibTimer(Timer):
+    """ A scheduler timer backed by a single main loop timeout source """
+
+    _source_id: Optional[int] = None
+
+    def arm(self, delay: float, callback: Callable[[], None]) -> None:
+        self.cancel()
+
+        def on_timeout():
+            self._source_id = None
+            callback()
+            return GLib.SOURCE_REMOVE
+
+        if delay >= 1:
+            # whole-second timeouts let GLib batch wakeups with other sources
+            self._source_id = GLib.timeout_add_seconds(int(delay), on_timeout)
+        else:
+            self._source_id = GLib.timeout_add(int(delay * 1000), on_timeout)
+
+    def cancel(self) -> None:
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+
+def build_notification(task: Task, kind: ReminderKind) -> Gio.Notification:
+    notification = Gio.Notification.new(task.description)
+    if kind == ReminderKind.DUE:
+        notification.set_body("This task is due now")
+    else:
+        notification.set_body("Task reminder")
+    notification.set_priority(Gio.NotificationPriority.NORMAL)
+    return notification
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Union
 
 import gi
 
@@ -7,7 +7,7 @@ gi.require_version("Handy", "1")
 
 from gi.repository import GObject, Gtk, Gio, Handy
 
-from ...core import CoreTaskList, TaskList
+from ...core import CoreTaskList, SavedView, TaskList
 
 
 @Gtk.Template(resource_path="/org/wrightsman/HandleIt/ui/sidebar.ui")
@@ -30,6 +30,8 @@ class Sidebar(Gtk.Box):
 
     _count_labels: Dict[int, Gtk.Label]
     _lists: List[TaskList]
+    _view_count_labels: Dict[int, Gtk.Label]
+    _views: List[SavedView]
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -39,9 +41,12 @@ class Sidebar(Gtk.Box):
             row.list_id = row_id
             row.list_name = row.get_name()
             row.internal = True
+            row.view_id = None
         self._count_labels: Dict[int, Gtk.Label] = {}
         self._edit_entries: Dict[int, Gtk.Entry] = {}
         self._lists = []
+        self._view_count_labels = {}
+        self._views = []
 
     def _foreach(self, f: Callable[[Gtk.ListBoxRow], Any]):
         self.mode_view.foreach(lambda row: f(row) if not row.internal else None)
@@ -50,10 +55,21 @@ class Sidebar(Gtk.Box):
         self._count_labels = {}
         self._edit_entries = {}
         self._lists = []
+        self._view_count_labels = {}
         self._foreach(lambda row: row.destroy())
         self.mode_edit.foreach(lambda row: row.destroy())
 
-    def load_lists(self, tasklists: List[TaskList]):
+    def load_lists(
+        self,
+        tasklists: List[TaskList],
+        counts: Optional[Dict[Union[CoreTaskList, int], int]] = None,
+        views: Optional[List[SavedView]] = None,
+    ):
+        """
+        Rebuild the user list and saved view rows, using precomputed counts if given
+
+        The saved views shown so far are kept unless new ones are given.
+        """
         self.clear()
 
         # add lists from database
@@ -61,6 +77,11 @@ class Sidebar(Gtk.Box):
             self._count_labels[tasklist.list_id] = self._add_row(tasklist)
             self._edit_entries[tasklist.list_id] = self._add_edit_row(tasklist)
 
+        if views is not None:
+            self._views = views
+        for view in self._views:
+            self._view_count_labels[view.view_id] = self._add_view_row(view)
+
         row = Gtk.ListBoxRow()
         entry = Gtk.Entry(placeholder_text="Create new list...")
         entry.connect("activate", self._on_new_list_entry_activated)
@@ -68,27 +89,38 @@ class Sidebar(Gtk.Box):
         self.mode_edit.add(row)
 
         self._lists = tasklists
-        self.update_counts()
+        self.update_counts(counts)
         self._make_selectable()
         self.show_all()
 
-    def update_counts(self):
-        journal = self.get_toplevel().journal
-        self.label_pending_count.set_label(
-            str(journal.get_list_count(CoreTaskList.PENDING))
-        )
-        self.label_completed_count.set_label(
-            str(journal.get_list_count(CoreTaskList.COMPLETED))
-        )
-        self.label_trash_count.set_label(
-            str(journal.get_list_count(CoreTaskList.TRASH))
-        )
+    def update_counts(
+        self, counts: Optional[Dict[Union[CoreTaskList, int], int]] = None
+    ):
+        if counts is None:
+            journal = self.get_toplevel().journal
+            counts = {
+                core_list: journal.get_list_count(core_list)
+                for core_list in self.internal_rows
+            }
+            counts.update(journal.get_list_count([l.list_id for l in self._lists]))
+
+        self.label_pending_count.set_label(str(counts[CoreTaskList.PENDING]))
+        self.label_completed_count.set_label(str(counts[CoreTaskList.COMPLETED]))
+        self.label_trash_count.set_label(str(counts[CoreTaskList.TRASH]))
         # update other list counts
-        list_counts = journal.get_list_count([l.list_id for l in self._lists])
         for tasklist in self._lists:
             self._count_labels[tasklist.list_id].set_label(
-                str(list_counts[tasklist.list_id])
+                str(counts.get(tasklist.list_id, 0))
             )
+        # saved views are counted by the filter engine, never snapshotted
+        if self._views:
+            view_counts = self.get_toplevel().journal.get_view_count(
+                [view.view_id for view in self._views]
+            )
+            for view in self._views:
+                self._view_count_labels[view.view_id].set_label(
+                    str(view_counts.get(view.view_id, 0))
+                )
 
     def get_entry_texts(self) -> Dict[int, str]:
         return {
@@ -99,6 +131,7 @@ class Sidebar(Gtk.Box):
         row = Gtk.ListBoxRow()
         row.list_id = tasklist.list_id
         row.list_name = tasklist.name
+        row.view_id = None
         box = Gtk.Box(orientation="horizontal")
         icon = Gio.ThemedIcon.new_with_default_fallbacks("emblem-default-symbolic")
         box.pack_start(Gtk.Image(gicon=icon), expand=False, fill=False, padding=0)
@@ -113,6 +146,25 @@ class Sidebar(Gtk.Box):
 
         return label_count
 
+    def _add_view_row(self, view: SavedView) -> Gtk.Label:
+        row = Gtk.ListBoxRow()
+        row.list_id = None
+        row.list_name = view.name
+        row.view_id = view.view_id
+        box = Gtk.Box(orientation="horizontal")
+        icon = Gio.ThemedIcon.new_with_default_fallbacks(
+            view.icon if view.icon is not None else "edit-find-symbolic"
+        )
+        box.pack_start(Gtk.Image(gicon=icon), expand=False, fill=False, padding=0)
+        box.pack_start(Gtk.Label(label=view.name), expand=False, fill=False, padding=0)
+        label_count = Gtk.Label(label="0")
+        box.pack_end(label_count, expand=False, fill=False, padding=0)
+        row.add(box)
+        row.internal = False
+        self.mode_view.add(row)
+
+        return label_count
+
     def _add_edit_row(self, tasklist: TaskList) -> Gtk.Entry:
         row = Gtk.ListBoxRow(selectable=False)
         box = Gtk.Box(orientation="horizontal")
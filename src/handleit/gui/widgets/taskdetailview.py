@@ -123,28 +123,32 @@ class TaskDetailView(Gtk.Box):
 
         ## set up creation time row
         self._add_single_row_view(
-            "created", self.task.creation_time.isoformat(), last_row_num + 1
+            "created",
+            self.task.creation_time.astimezone().isoformat(),
+            last_row_num + 1,
         )
         last_row_num += 1
 
         ## set up completion time row
         if self.task.completion_time is not None:
             self._add_single_row_view(
-                "completed", self.task.completion_time.isoformat(), last_row_num + 1
+                "completed",
+                self.task.completion_time.astimezone().isoformat(),
+                last_row_num + 1,
             )
             last_row_num += 1
 
         ## set up start time row
         if self.task.start_time is not None:
             self._add_single_row_view(
-                "start", self.task.start_time.isoformat(), last_row_num + 1
+                "start", self.task.start_time.astimezone().isoformat(), last_row_num + 1
             )
             last_row_num += 1
 
         ## set up due time row
         if self.task.due_time is not None:
             self._add_single_row_view(
-                "due", self.task.due_time.isoformat(), last_row_num + 1
+                "due", self.task.due_time.astimezone().isoformat(), last_row_num + 1
             )
             last_row_num += 1
 
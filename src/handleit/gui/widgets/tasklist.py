@@ -39,7 +39,9 @@ class TaskRow(Gtk.ListBoxRow):
             self.label_attributes.set_markup(
                 label
                 + (" | " if label else "")
-                + "Starts on <b>{t:%b} {t.day}</b>".format(t=task.start_time)
+                + "Starts on <b>{t:%b} {t.day}</b>".format(
+                    t=task.start_time.astimezone()
+                )
             )
             show_attributes = True
 
@@ -48,7 +50,7 @@ class TaskRow(Gtk.ListBoxRow):
             self.label_attributes.set_markup(
                 label
                 + (" | " if label else "")
-                + "Due on <b>{t:%b} {t.day}</b>".format(t=task.due_time)
+                + "Due on <b>{t:%b} {t.day}</b>".format(t=task.due_time.astimezone())
             )
             show_attributes = True
 
@@ -1,18 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import enum
 import logging
 from pathlib import Path
+import sqlite3
 from typing import Optional, List, Union
 
 import gi
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Handy", "1")
-from gi.repository import Gtk, Gio, Handy
-
-from ..core import Journal, CoreTaskList, TaskRelationship
+from gi.repository import Gtk, Gio, GLib, Handy
+
+from .. import startup
+from ..backup import BackupScheduler
+from ..core import (
+    Journal,
+    JournalOverview,
+    CoreTaskList,
+    ReminderKind,
+    SortSpec,
+    Task,
+    TaskRelationship,
+    encode_list_id,
+)
+from ..io.snapshot import write_snapshot
 from ..io.sqlite import create_new_database
+from ..scheduler import NotificationScheduler
+from .notifications import GLibTimer, build_notification
 from .widgets import TaskRow, TaskDetailView, TaskList
 
 
@@ -21,6 +37,7 @@ class View(enum.Enum):
     LIST = 1
     SUBTASKS = 2
     DETAIL = 3
+    SAVED_VIEW = 4
 
 
 @dataclass
@@ -35,7 +52,12 @@ class HandleItWindow(Handy.ApplicationWindow):
     __gtype_name__ = "HandleItWindow"
 
     _journal: Optional[Journal] = None
+    _journal_path: Optional[Path] = None
+    _scheduler: Optional[NotificationScheduler] = None
+    _backup_scheduler: Optional[BackupScheduler] = None
+    _backup_executor: Optional[ThreadPoolExecutor] = None
     _view_history: List[ViewState]
+    _view_task: Optional[TaskDetailView] = None
 
     leaflet_main = Gtk.Template.Child()
 
@@ -46,7 +68,6 @@ class HandleItWindow(Handy.ApplicationWindow):
     headerbar_leaf_tasks = Gtk.Template.Child()
     stack_views = Gtk.Template.Child()
     view_list = Gtk.Template.Child()
-    view_task = Gtk.Template.Child()
 
     button_sidebar_edit = Gtk.Template.Child()
     button_back = Gtk.Template.Child()
@@ -60,6 +81,7 @@ class HandleItWindow(Handy.ApplicationWindow):
         super().__init__(**kwargs)
 
         self._view_history = []
+        self._settings = Gio.Settings.new("org.wrightsman.HandleIt")
 
         action_new_file = Gio.SimpleAction.new("file.new", None)
         action_new_file.connect("activate", self._on_new_file)
@@ -69,6 +91,24 @@ class HandleItWindow(Handy.ApplicationWindow):
         action_open_file.connect("activate", self._on_open_file)
         self.add_action(action_open_file)
 
+        action_empty_trash = Gio.SimpleAction.new("trash.empty", None)
+        action_empty_trash.connect("activate", self._on_empty_trash)
+        self.add_action(action_empty_trash)
+
+        action_undo = Gio.SimpleAction.new("undo", None)
+        action_undo.connect("activate", self._on_undo)
+        self.add_action(action_undo)
+
+        action_redo = Gio.SimpleAction.new("redo", None)
+        action_redo.connect("activate", self._on_redo)
+        self.add_action(action_redo)
+
+        self._action_sort = Gio.SimpleAction.new_stateful(
+            "sort", GLib.VariantType.new("s"), GLib.Variant.new_string(str(SortSpec()))
+        )
+        self._action_sort.connect("change-state", self._on_sort_changed)
+        self.add_action(self._action_sort)
+
         self.sidebar.connect("list_deleted", self._on_sidebar_list_deleted)
         self.sidebar.stack_mode.connect(
             "notify::visible_child_name", self._on_sidebar_mode_switch
@@ -83,12 +123,6 @@ class HandleItWindow(Handy.ApplicationWindow):
         self.tasklist.connect("new_task_created", self._on_new_task)
         self.tasklist.connect("task_modified", self._on_task_row_modified)
 
-        self.view_task.connect("task_deleted", self._on_task_deleted)
-        self.view_task.connect("task_modified", self._on_task_modified)
-        self.view_task.stack_mode.connect(
-            "notify::visible-child-name", self._on_view_task_mode_switch
-        )
-
         self.search_bar.connect(
             "notify::search-mode-enabled", self._on_search_mode_toggled
         )
@@ -98,21 +132,47 @@ class HandleItWindow(Handy.ApplicationWindow):
 
     def do_destroy(self):
         """ Close the Journal database connection, if it exists, on window destruction """
-        if self._journal:
-            self._journal.close()
+        self._close_journal()
         Handy.ApplicationWindow.do_destroy(self)
 
     @property
     def journal(self):
         return self._journal
 
-    def _load_list_view(self, list_id: Union[CoreTaskList, int], list_name: str):
+    @property
+    def view_task(self) -> TaskDetailView:
+        """ The task detail view, built the first time a task is opened """
+        if self._view_task is None:
+            self._view_task = TaskDetailView(visible=True)
+            self._view_task.connect("task_deleted", self._on_task_deleted)
+            self._view_task.connect("task_modified", self._on_task_modified)
+            self._view_task.stack_mode.connect(
+                "notify::visible-child-name", self._on_view_task_mode_switch
+            )
+            scrolled_window = Gtk.ScrolledWindow(
+                hscrollbar_policy=Gtk.PolicyType.NEVER, visible=True
+            )
+            scrolled_window.add(self._view_task)
+            scrolled_window.show_all()
+            self.stack_views.add_named(scrolled_window, "view_task")
+        return self._view_task
+
+    def _load_list_view(
+        self,
+        list_id: Union[CoreTaskList, int],
+        list_name: str,
+        tasks: Optional[List[Task]] = None,
+    ):
         # stop search
         if self.button_search.get_active():
             self.button_search.set_active(False)
-        # load the tasks into the list box
+        # load the tasks into the list box, in the list's remembered order
+        sort = self._journal.get_list_sort(list_id)
+        self._action_sort.set_state(GLib.Variant.new_string(str(sort)))
+        if tasks is None:
+            tasks = self._journal.get_list_tasks(list_id, sort)
         self.tasklist.load_tasks(
-            self._journal.get_list_tasks(list_id),
+            tasks,
             show_new_task_row=(
                 list_id not in {CoreTaskList.COMPLETED, CoreTaskList.TRASH}
             ),
@@ -124,6 +184,17 @@ class HandleItWindow(Handy.ApplicationWindow):
         # reset history
         self._view_history = [ViewState(View.LIST, list_id, list_name)]
         self._set_button_visibility()
+        self._settings.set_int("last-list", encode_list_id(list_id))
+
+    def _load_saved_view(self, view_id: int, view_name: str):
+        # stop search
+        if self.button_search.get_active():
+            self.button_search.set_active(False)
+        self.tasklist.load_tasks(self._journal.get_view_tasks(view_id))
+        self.stack_views.set_visible_child_name("view_list")
+        self.headerbar_leaf_tasks.set_title(view_name)
+        self._view_history = [ViewState(View.SAVED_VIEW, view_id, view_name)]
+        self._set_button_visibility()
 
     def _load_subtasks_view(self, task_id: int, reload=False, history=True):
         # stop search
@@ -161,7 +232,10 @@ class HandleItWindow(Handy.ApplicationWindow):
         self.leaflet_main.set_visible_child_name("tasks")
 
     def _on_sidebar_row_selected(self, list_box, row):
-        self._load_list_view(row.list_id, row.list_name)
+        if row.view_id is not None:
+            self._load_saved_view(row.view_id, row.list_name)
+        else:
+            self._load_list_view(row.list_id, row.list_name)
 
     def _on_sidebar_list_deleted(self, sidebar: Gtk.Box, list_id: int):
         if list_id in [
@@ -274,7 +348,7 @@ class HandleItWindow(Handy.ApplicationWindow):
             if current_view.view == View.DETAIL:
                 self.button_search.set_visible(False)
                 self.button_taskedit.set_visible(True)
-                # self.button_sort.set_visible(False)
+                self.button_sort.set_visible(False)
             else:
                 if (
                     current_view.view == View.LIST
@@ -285,7 +359,40 @@ class HandleItWindow(Handy.ApplicationWindow):
                 else:
                     self.button_search.set_visible(False)
                 self.button_taskedit.set_visible(False)
-                # self.button_sort.set_visible(True)
+                # saved views and subtasks keep their own order
+                self.button_sort.set_visible(current_view.view == View.LIST)
+
+    def _on_sort_changed(self, action: Gio.SimpleAction, value: GLib.Variant):
+        action.set_state(value)
+        current_view = self._view_history[-1] if self._view_history else None
+        if (current_view is not None) and (current_view.view == View.LIST):
+            self._journal.set_list_sort(
+                current_view.disp_id, SortSpec.parse(value.get_string())
+            )
+            self._reload_view()
+
+    def _on_empty_trash(self, action, param):
+        if self._journal is not None and self._journal.empty_trash():
+            self.sidebar.update_counts()
+            self._reload_view()
+
+    def _on_undo(self, action, param):
+        if self._journal is not None and self._journal.undo():
+            self._on_journal_reverted()
+
+    def _on_redo(self, action, param):
+        if self._journal is not None and self._journal.redo():
+            self._on_journal_reverted()
+
+    def _on_journal_reverted(self) -> None:
+        """ Redraw the sidebar and current list after an undo or redo """
+        self.sidebar.load_lists(self._journal.lists, views=self._journal.views)
+        self.sidebar.show_all()
+        current_view = self._view_history[0] if self._view_history else None
+        if (current_view is not None) and (current_view.view == View.LIST):
+            self._select_list(current_view.disp_id)
+        else:
+            self._select_list(CoreTaskList.PENDING)
 
     def _on_leaflet_fold(self, obj, pspec):
         self._set_button_visibility()
@@ -294,14 +401,23 @@ class HandleItWindow(Handy.ApplicationWindow):
         self.button_taskedit.set_active(stack.get_visible_child_name() == "edit")
 
     def _on_view_stack_mode_switch(self, stack, visible_child_name):
-        if stack.get_visible_child_name() != "view_task":
+        if (stack.get_visible_child_name() != "view_task") and (
+            self._view_task is not None
+        ):
             # make sure task view returns to view mode after leaving it
             self.view_task.stack_mode.set_visible_child_name("view")
 
     def _reload_view(self):
         current_view = self._view_history[-1]
         if current_view.view == View.LIST:
-            self.tasklist.load_tasks(self._journal.get_list_tasks(current_view.disp_id))
+            self.tasklist.load_tasks(
+                self._journal.get_list_tasks(
+                    current_view.disp_id,
+                    self._journal.get_list_sort(current_view.disp_id),
+                )
+            )
+        elif current_view.view == View.SAVED_VIEW:
+            self.tasklist.load_tasks(self._journal.get_view_tasks(current_view.disp_id))
         elif current_view.view == View.SUBTASKS:
             self._load_subtasks_view(current_view.disp_id, reload=True)
         elif current_view.view == View.DETAIL:
@@ -310,13 +426,15 @@ class HandleItWindow(Handy.ApplicationWindow):
     def _load_previous_view(self):
         current_view = self._view_history[-1]
 
-        if current_view.view == View.LIST:
+        if current_view.view in {View.LIST, View.SAVED_VIEW}:
             self.leaflet_main.set_visible_child_name("sidebar")
 
         elif current_view.view == View.SUBTASKS:
             previous_view = self._view_history[-2]
             if previous_view.view == View.LIST:
                 self._load_list_view(previous_view.disp_id, previous_view.name)
+            elif previous_view.view == View.SAVED_VIEW:
+                self._load_saved_view(previous_view.disp_id, previous_view.name)
             elif previous_view.view == View.SUBTASKS:
                 self._load_subtasks_view(previous_view.disp_id, history=False)
                 self._view_history.pop()
@@ -325,6 +443,8 @@ class HandleItWindow(Handy.ApplicationWindow):
             previous_view = self._view_history[-2]
             if previous_view.view == View.LIST:
                 self._load_list_view(previous_view.disp_id, previous_view.name)
+            elif previous_view.view == View.SAVED_VIEW:
+                self._load_saved_view(previous_view.disp_id, previous_view.name)
             elif previous_view.view == View.SUBTASKS:
                 self._load_subtasks_view(previous_view.disp_id, history=False)
                 self._view_history.pop()
@@ -383,28 +503,170 @@ class HandleItWindow(Handy.ApplicationWindow):
 
         file_dialog.destroy()
 
-    def _load_journal(self, path):
+    def _load_journal(self, path: Path, overview: Optional[JournalOverview] = None):
+        """ Open a journal, drawing the sidebar and first list from an overview if given """
         logging.info(f"Opening file '{path}'")
+        self._close_journal()
         self._journal = Journal(path)
-
-        self.sidebar.load_lists(self._journal.lists)
-
-        if (self.sidebar.mode_view.get_selected_row() is not None) and (
-            self.sidebar.mode_view.get_selected_row().list_id == CoreTaskList.PENDING
-        ):
-            # just reload if already on pending
-            self._reload_view()
+        self._journal_path = path
+        self._settings.set_string("last-journal", str(path.resolve()))
+        self._scheduler = NotificationScheduler(
+            self._journal, GLibTimer(), self._on_reminder
+        )
+        self._scheduler.start()
+        self._start_backups()
+        GLib.idle_add(self._archive_tasks)
+        GLib.idle_add(self._purge_trash)
+        GLib.idle_add(self._compact_changes)
+
+        if overview is None:
+            self.sidebar.load_lists(self._journal.lists, views=self._journal.views)
+            self._select_list(CoreTaskList.PENDING)
         else:
-            # select the pending row
-            self.sidebar.mode_view.select_row(
-                self.sidebar.mode_view.get_row_at_index(0)
+            self.sidebar.load_lists(
+                overview.lists, overview.counts, views=self._journal.views
             )
+            self._select_list(overview.list_id, overview.tasks)
 
         self.sidebar.show_all()
 
+        self.sidebar.set_sensitive(True)
+        self.tasklist.set_sensitive(True)
         self.button_sidebar_edit.set_sensitive(True)
         self.button_search.set_sensitive(True)
 
+        startup.mark("journal loaded")
+
+    def _start_backups(self) -> None:
+        hours = self._settings.get_uint("backup-interval")
+        if hours == 0:
+            return
+        if self._backup_executor is None:
+            # backups copy a few pages at a time off the main loop
+            self._backup_executor = ThreadPoolExecutor(max_workers=1)
+        self._backup_scheduler = BackupScheduler(
+            self._journal,
+            Path(GLib.get_user_data_dir()) / "handleit" / "backups",
+            GLibTimer(),
+            interval=timedelta(hours=hours),
+            executor=self._backup_executor,
+        )
+        self._backup_scheduler.start()
+
+    def _archive_tasks(self) -> bool:
+        days = self._settings.get_uint("archive-after-days")
+        if days > 0 and self._journal is not None:
+            try:
+                if self._journal.archive_tasks(timedelta(days=days)):
+                    self.sidebar.update_counts()
+                    self._reload_view()
+            except sqlite3.Error as error:
+                logging.error(f"Could not archive tasks: {error}")
+        return GLib.SOURCE_REMOVE
+
+    def _purge_trash(self) -> bool:
+        days = self._settings.get_uint("purge-trash-after-days")
+        if days > 0 and self._journal is not None:
+            try:
+                if self._journal.purge_trash(timedelta(days=days)):
+                    self.sidebar.update_counts()
+                    self._reload_view()
+            except sqlite3.Error as error:
+                logging.error(f"Could not purge the trash: {error}")
+        return GLib.SOURCE_REMOVE
+
+    def _compact_changes(self) -> bool:
+        if self._journal is not None:
+            try:
+                # other processes may still undo the last day's changes
+                self._journal.compact_changes(timedelta(days=1))
+            except sqlite3.Error as error:
+                logging.error(f"Could not compact the change log: {error}")
+        return GLib.SOURCE_REMOVE
+
+    def _close_journal(self) -> None:
+        if self._journal is None:
+            return
+        self._scheduler.stop()
+        self._scheduler = None
+        if self._backup_scheduler is not None:
+            self._backup_scheduler.stop()
+            self._backup_scheduler = None
+        if self._backup_executor is not None:
+            # let a backup in progress finish before its journal closes
+            self._backup_executor.shutdown(wait=True)
+            self._backup_executor = None
+        self._save_snapshot()
+        self._journal.close()
+        self._journal = None
+
+    def _on_reminder(self, task_id: int, kind: ReminderKind) -> None:
+        task = self._journal.get_task(task_id)
+        if task is not None:
+            self.get_application().send_notification(
+                f"task-{task_id}-{kind.value}", build_notification(task, kind)
+            )
+
+    def restore_journal(self, path: Path, overview: JournalOverview) -> None:
+        """ Reopen the journal from the last session using prefetched data """
+        self._load_journal(path, overview)
+
+    def show_snapshot(self, snapshot: JournalOverview) -> None:
+        """
+        Draw a journal snapshot read-only until the journal itself is loaded
+
+        The view is replaced wholesale by _load_journal, which reconciles
+        anything that changed since the snapshot was taken.
+        """
+        self.sidebar.load_lists(snapshot.lists, snapshot.counts)
+        for row in self.sidebar.mode_view.get_children():
+            if getattr(row, "list_id", None) == snapshot.list_id:
+                self.sidebar.mode_view.handler_block_by_func(
+                    self._on_sidebar_row_selected
+                )
+                self.sidebar.mode_view.select_row(row)
+                self.sidebar.mode_view.handler_unblock_by_func(
+                    self._on_sidebar_row_selected
+                )
+                self.headerbar_leaf_tasks.set_title(row.list_name)
+                break
+        self.tasklist.load_tasks(snapshot.tasks, show_new_task_row=False)
+        self.stack_views.set_visible_child_name("view_list")
+        # nothing can be changed until there is a journal to change
+        self.sidebar.set_sensitive(False)
+        self.tasklist.set_sensitive(False)
+        startup.mark("snapshot shown")
+
+    def _save_snapshot(self) -> None:
+        # snapshots hold lists only, so fall back to Pending for saved views
+        list_id = (
+            self._view_history[0].disp_id
+            if self._view_history and self._view_history[0].view == View.LIST
+            else CoreTaskList.PENDING
+        )
+        try:
+            write_snapshot(self._journal_path, self._journal.get_overview(list_id))
+        except OSError:
+            logging.warning(f"Could not save a snapshot of '{self._journal_path}'")
+
+    def _select_list(
+        self, list_id: Union[CoreTaskList, int], tasks: Optional[List[Task]] = None
+    ) -> None:
+        """ Select a list in the sidebar and load it, falling back to Pending """
+        selected_row = self.sidebar.mode_view.get_row_at_index(0)
+        for row in self.sidebar.mode_view.get_children():
+            if getattr(row, "list_id", None) == list_id:
+                selected_row = row
+                break
+        if selected_row.list_id != list_id:
+            tasks = None
+
+        # load the view directly so already-fetched tasks aren't queried again
+        self.sidebar.mode_view.handler_block_by_func(self._on_sidebar_row_selected)
+        self.sidebar.mode_view.select_row(selected_row)
+        self.sidebar.mode_view.handler_unblock_by_func(self._on_sidebar_row_selected)
+        self._load_list_view(selected_row.list_id, selected_row.list_name, tasks)
+
     def _on_open_file(self, action, param):
         dialog = Gtk.FileChooserDialog(
             "Please choose a task database",
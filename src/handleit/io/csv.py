@@ -0,0 +1,101 @@
+"""
+Export and import journals as CSV
+
+Every row holds one record of Journal.export_records under a shared header
+with a column for each record field. Cells of fields a record doesn't have
+are left empty, as are None values, so empty notes are read back as None.
+The lists, tags, attributes, and notifications of tasks are stored as JSON
+in their cells.
+
+Like JSON Lines, rows are written and read one at a time.
+"""
+
+import csv
+import json
+from typing import Any, Dict, Iterator, TextIO
+
+from ..core import Journal, Record
+
+
+FIELDS = (
+    "type",
+    "id",
+    "name",
+    "icon",
+    "color",
+    "query",
+    "description",
+    "notes",
+    "priority",
+    "created",
+    "completed",
+    "due",
+    "start",
+    "trashed",
+    "lists",
+    "tags",
+    "attributes",
+    "notifications",
+    "from",
+    "to",
+    "relationship",
+)
+
+_INTEGER_FIELDS = {"id", "priority", "from", "to"}
+_JSON_FIELDS = {"lists", "tags", "attributes", "notifications"}
+
+
+def _encode(field: str, value: Any) -> str:
+    if value is None:
+        return ""
+    if field in _JSON_FIELDS:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _decode(field: str, text: str) -> Any:
+    if field in _INTEGER_FIELDS:
+        return int(text)
+    if field in _JSON_FIELDS:
+        return json.loads(text)
+    if field == "trashed":
+        return text == "true"
+    return text
+
+
+def export_csv(journal: Journal, fp: TextIO) -> int:
+    """
+    Write every record of a journal to a text file, returning how many
+
+    Open the file with newline="" as the csv module expects.
+    """
+    writer = csv.writer(fp)
+    writer.writerow(FIELDS)
+    count = 0
+    for record in journal.export_records():
+        writer.writerow([_encode(field, record.get(field)) for field in FIELDS])
+        count += 1
+    return count
+
+
+def read_csv(fp: TextIO) -> Iterator[Record]:
+    """ Parse records from a text file, leaving out empty cells """
+    reader = csv.DictReader(fp)
+    if reader.fieldnames is None or "type" not in reader.fieldnames:
+        raise ValueError("CSV files of records need a 'type' column")
+    for row in reader:
+        try:
+            yield {
+                field: _decode(field, text)
+                for field, text in row.items()
+                if field is not None and text
+            }
+        except ValueError as e:
+            raise ValueError(f"Line {reader.line_num}: {e}") from None
+
+
+def import_csv(journal: Journal, fp: TextIO, chunk_size: int = 10000) -> Dict[str, int]:
+    """ Add the records of a text file to a journal, see Journal.import_records """
+    return journal.import_records(read_csv(fp), chunk_size)
@@ -0,0 +1,405 @@
+"""
+Export and import tasks as iCalendar (RFC 5545) to-dos
+
+Each task is a VTODO:
+
+- SUMMARY and DESCRIPTION hold the description and notes
+- CREATED, DTSTART, DUE, and COMPLETED hold its times, in UTC, or as
+  floating times if they're local
+- STATUS is COMPLETED for completed tasks and CANCELLED for trashed ones
+- PRIORITY runs from 1 (highest) to 9 (lowest), where a priority p maps
+  to 6 - p, and priority 0 is left out as undefined
+- CATEGORIES holds its tags and X-HANDLEIT-LIST the names of its lists
+- RELATED-TO points at its parent (RELTYPE=PARENT, the default) and at
+  the tasks blocking it (RELTYPE=DEPENDS-ON, from RFC 9253)
+- a VALARM with an absolute trigger holds each notification
+
+UIDs of imported to-dos are kept in the "ical_uid" attribute and exported
+again, so calendars can be round-tripped through a journal. Dates and
+floating times are read as local times, as are times in time zones (TZID)
+Python doesn't know, e.g. before Python 3.9. VTODOs overriding a recurrence
+are skipped.
+
+Both directions stream: tasks are written a chunk at a time and read one
+VTODO at a time, apart from the UIDs seen so far and any relations to
+to-dos further down the file.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import re
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from ..core import Journal, Record, Task, TaskRelationship
+from .records import RecordBuilder
+from .sqlite import datetime_to_epoch
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+
+UID_ATTRIBUTE = "ical_uid"
+
+_NAME = re.compile(r"[A-Za-z0-9-]+")
+_PARAM = re.compile(r';([A-Za-z0-9-]+)=("[^"]*"|[^";:]*)')
+_DURATION = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+# a name, its parameters, and its raw value
+ContentLine = Tuple[str, Dict[str, str], str]
+
+
+def export_ical(journal: Journal, fp: TextIO, chunk_size: int = 1000) -> int:
+    """
+    Write every task of a journal as a calendar, returning how many
+
+    Open the file with newline="" to keep the CRLF line endings iCalendar
+    requires.
+    """
+    list_names = {task_list.list_id: task_list.name for task_list in journal.lists}
+    stamp = _format_time(datetime.now(timezone.utc))
+    for line in ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//HandleIt//HandleIt//EN"):
+        _write(fp, line)
+
+    count = 0
+    tasks = journal.iter_tasks(chunk_size)
+    while True:
+        chunk = list(islice(tasks, chunk_size))
+        if not chunk:
+            break
+        uids = _task_uids(journal, chunk)
+        notifications = journal.get_notifications([task.task_id for task in chunk])
+        for task in chunk:
+            _write_vtodo(fp, task, notifications[task.task_id], uids, list_names, stamp)
+        count += len(chunk)
+
+    _write(fp, "END:VCALENDAR")
+    return count
+
+
+def read_ical(fp: TextIO) -> Iterator[Record]:
+    """ Parse the VTODOs of a calendar into records for Journal.import_records """
+    return _ICalReader().read(fp)
+
+
+def import_ical(
+    journal: Journal, fp: TextIO, chunk_size: int = 10000
+) -> Dict[str, int]:
+    """ Add the to-dos of a calendar to a journal, see Journal.import_records """
+    return journal.import_records(read_ical(fp), chunk_size)
+
+
+def _task_uid(task: Task) -> str:
+    uid = task.attributes.get(UID_ATTRIBUTE)
+    if isinstance(uid, str):
+        return uid
+    # the creation time keeps UIDs unique across journals
+    return f"{task.task_id}-{datetime_to_epoch(task.creation_time)}@handleit"
+
+
+def _task_uids(journal: Journal, tasks: List[Task]) -> Dict[int, str]:
+    """ Look up the UIDs of a chunk of tasks and the tasks they refer to """
+    uids = {task.task_id: _task_uid(task) for task in tasks}
+    referenced: Set[int] = set()
+    for task in tasks:
+        if task.parent is not None:
+            referenced.add(task.parent)
+        referenced.update(task.dependencies)
+    referenced.difference_update(uids)
+    if referenced:
+        for task in journal.get_tasks(list(referenced)):
+            uids[task.task_id] = _task_uid(task)
+    return uids
+
+
+def _write_vtodo(
+    fp: TextIO,
+    task: Task,
+    notifications: List[datetime],
+    uids: Dict[int, str],
+    list_names: Dict[int, str],
+    stamp: str,
+) -> None:
+    _write(fp, "BEGIN:VTODO")
+    _write(fp, f"UID:{_escape(uids[task.task_id])}")
+    _write(fp, f"DTSTAMP:{stamp}")
+    _write(fp, f"CREATED:{_format_time(task.creation_time)}")
+    _write(fp, f"SUMMARY:{_escape(task.description)}")
+    if task.notes:
+        _write(fp, f"DESCRIPTION:{_escape(task.notes)}")
+    if task.priority != 0:
+        _write(fp, f"PRIORITY:{min(max(6 - task.priority, 1), 9)}")
+    for name, time in (
+        ("DTSTART", task.start_time),
+        ("DUE", task.due_time),
+        ("COMPLETED", task.completion_time),
+    ):
+        if time is not None:
+            _write(fp, f"{name}:{_format_time(time)}")
+    if task.is_trashed:
+        status = "CANCELLED"
+    elif task.completion_time is not None:
+        status = "COMPLETED"
+    else:
+        status = "NEEDS-ACTION"
+    _write(fp, f"STATUS:{status}")
+    if task.tags:
+        _write(fp, f"CATEGORIES:{','.join(_escape(tag) for tag in sorted(task.tags))}")
+    for list_id in task.lists:
+        if list_id in list_names:
+            _write(fp, f"X-HANDLEIT-LIST:{_escape(list_names[list_id])}")
+    if task.parent is not None:
+        _write(fp, f"RELATED-TO;RELTYPE=PARENT:{_escape(uids[task.parent])}")
+    for dependency in task.dependencies:
+        _write(fp, f"RELATED-TO;RELTYPE=DEPENDS-ON:{_escape(uids[dependency])}")
+    for time in notifications:
+        _write(fp, "BEGIN:VALARM")
+        _write(fp, "ACTION:DISPLAY")
+        _write(fp, f"DESCRIPTION:{_escape(task.description)}")
+        _write(fp, f"TRIGGER;VALUE=DATE-TIME:{_format_time(time)}")
+        _write(fp, "END:VALARM")
+    _write(fp, "END:VTODO")
+
+
+def _write(fp: TextIO, line: str) -> None:
+    """ Write a content line, folded to 75 octets without splitting characters """
+    encoded = line.encode("utf-8")
+    start, limit = 0, 75
+    while len(encoded) - start > limit:
+        end = start + limit
+        while encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        fp.write(encoded[start:end].decode("utf-8") + "\r\n ")
+        # continuation lines start with a space
+        start, limit = end, 74
+    fp.write(encoded[start:].decode("utf-8") + "\r\n")
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+
+def _split_text_list(text: str) -> List[str]:
+    """ Split a comma-separated list of text values, unescaping each """
+    values = [""]
+    escaped = False
+    for char in text:
+        if escaped:
+            values[-1] += "\n" if char in "nN" else char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ",":
+            values.append("")
+        else:
+            values[-1] += char
+    return [value for value in values if value]
+
+
+def _format_time(time: datetime) -> str:
+    # naive times are local, so they're written as floating times
+    if time.tzinfo is None:
+        return time.strftime("%Y%m%dT%H%M%S")
+    return time.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _parse_time(value: str, params: Dict[str, str]) -> datetime:
+    """ Read a time, leaving dates and floating times naive, i.e. local """
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.strptime(value, "%Y%m%d")
+        if value.endswith("Z"):
+            return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(
+                tzinfo=timezone.utc
+            )
+        time = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ValueError(f"Invalid iCalendar time '{value}'") from None
+    if "TZID" in params and ZoneInfo is not None:
+        try:
+            return time.replace(tzinfo=ZoneInfo(params["TZID"]))
+        except (KeyError, ValueError):
+            # custom zones, defined by VTIMEZONEs, aren't read
+            pass
+    return time
+
+
+def _parse_duration(value: str) -> timedelta:
+    match = _DURATION.match(value)
+    if match is None:
+        raise ValueError(f"Invalid iCalendar duration '{value}'")
+    duration = timedelta(
+        **{
+            unit: int(match.group(unit) or 0)
+            for unit in ("weeks", "days", "hours", "minutes", "seconds")
+        }
+    )
+    return -duration if match.group("sign") == "-" else duration
+
+
+def _content_lines(fp: TextIO) -> Iterator[ContentLine]:
+    """ Unfold and parse the content lines of a calendar """
+    line_number = 0
+    unfolded: Optional[str] = None
+    for line_number, line in enumerate(fp, start=1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and unfolded is not None:
+            unfolded += line[1:]
+            continue
+        if unfolded:
+            yield _parse_content_line(unfolded, line_number - 1)
+        unfolded = line
+    if unfolded:
+        yield _parse_content_line(unfolded, line_number)
+
+
+def _parse_content_line(line: str, line_number: int) -> ContentLine:
+    name = _NAME.match(line)
+    if name is None:
+        raise ValueError(f"Line {line_number}: invalid content line '{line}'")
+    params = {}
+    position = name.end()
+    while line.startswith(";", position):
+        param = _PARAM.match(line, position)
+        if param is None:
+            raise ValueError(f"Line {line_number}: invalid parameter in '{line}'")
+        params[param.group(1).upper()] = param.group(2).strip('"')
+        position = param.end()
+    if not line.startswith(":", position):
+        raise ValueError(f"Line {line_number}: missing value in '{line}'")
+    return name.group().upper(), params, line[position + 1 :]
+
+
+class _ICalReader:
+    """ Turn VTODOs into records, numbering tasks by UID """
+
+    def __init__(self):
+        self._builder = RecordBuilder()
+
+    def read(self, fp: TextIO) -> Iterator[Record]:
+        todo: Optional[List[ContentLine]] = None
+        alarm: Optional[List[ContentLine]] = None
+        alarms: List[List[ContentLine]] = []
+        for name, params, value in _content_lines(fp):
+            if name == "BEGIN" and value.upper() == "VTODO":
+                todo, alarms = [], []
+            elif todo is None:
+                continue
+            elif name == "BEGIN" and value.upper() == "VALARM":
+                alarm = []
+            elif name == "END" and value.upper() == "VALARM":
+                if alarm is not None:
+                    alarms.append(alarm)
+                alarm = None
+            elif name == "END" and value.upper() == "VTODO":
+                yield from self._todo_records(todo, alarms)
+                todo = None
+            elif alarm is not None:
+                alarm.append((name, params, value))
+            else:
+                todo.append((name, params, value))
+
+        yield from self._builder.deferred_relations()
+
+    def _todo_records(
+        self, todo: List[ContentLine], alarms: List[List[ContentLine]]
+    ) -> Iterator[Record]:
+        values: Dict[str, Tuple[Dict[str, str], str]] = {}
+        tags: List[str] = []
+        lists: List[str] = []
+        related: List[Tuple[str, str]] = []
+        for name, params, value in todo:
+            if name == "CATEGORIES":
+                tags.extend(_split_text_list(value))
+            elif name == "X-HANDLEIT-LIST":
+                lists.append(_unescape(value))
+            elif name == "RELATED-TO":
+                related.append((params.get("RELTYPE", "PARENT").upper(), value))
+            else:
+                values.setdefault(name, (params, value))
+        if "RECURRENCE-ID" in values:
+            return
+
+        uid = _unescape(values["UID"][1]) if "UID" in values else None
+        task_id = self._builder.define_task(uid)
+
+        def time(name: str) -> Optional[datetime]:
+            return (
+                _parse_time(values[name][1], values[name][0])
+                if name in values
+                else None
+            )
+
+        status = values.get("STATUS", ({}, ""))[1].upper()
+        completed = time("COMPLETED")
+        if completed is None and status == "COMPLETED":
+            completed = time("LAST-MODIFIED") or time("DTSTAMP")
+        priority = int(values.get("PRIORITY", ({}, "0"))[1])
+
+        yield from self._builder.list_records(lists)
+        notifications = []
+        for alarm in alarms:
+            notification = _alarm_time(alarm, time("DTSTART"), time("DUE"))
+            if notification is not None:
+                notifications.append(notification)
+
+        yield {
+            "type": "task",
+            "id": task_id,
+            "description": _unescape(values["SUMMARY"][1])
+            if "SUMMARY" in values
+            else "",
+            "notes": _unescape(values["DESCRIPTION"][1])
+            if "DESCRIPTION" in values
+            else None,
+            "priority": 6 - priority if priority else 0,
+            "created": time("CREATED"),
+            "completed": completed,
+            "due": time("DUE"),
+            "start": time("DTSTART"),
+            "trashed": status == "CANCELLED",
+            "lists": lists,
+            "tags": tags,
+            "attributes": {UID_ATTRIBUTE: uid} if uid is not None else {},
+            "notifications": notifications,
+        }
+
+        for reltype, other_uid in related:
+            other_id = self._builder.task_id(_unescape(other_uid))
+            if reltype == "PARENT":
+                relation = (other_id, task_id, TaskRelationship.PARENT)
+            elif reltype == "CHILD":
+                relation = (task_id, other_id, TaskRelationship.PARENT)
+            elif reltype == "DEPENDS-ON":
+                relation = (task_id, other_id, TaskRelationship.DEPENDENCY)
+            else:
+                continue
+            yield from self._builder.relation_records(*relation)
+
+
+def _alarm_time(
+    alarm: List[ContentLine], start: Optional[datetime], due: Optional[datetime]
+) -> Optional[datetime]:
+    """ When an alarm goes off, if it can be worked out """
+    for name, params, value in alarm:
+        if name != "TRIGGER":
+            continue
+        if params.get("VALUE") == "DATE-TIME":
+            return _parse_time(value, params)
+        base = due if params.get("RELATED") == "END" else start
+        if base is None:
+            return None
+        return base + _parse_duration(value)
+    return None
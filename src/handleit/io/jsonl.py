@@ -0,0 +1,49 @@
+"""
+Export and import journals as JSON Lines
+
+Each line holds one record of Journal.export_records as a JSON object, e.g.
+
+    {"type":"list","id":1,"name":"Groceries","icon":null}
+    {"type":"task","id":3,"description":"Buy flour","lists":[1],...}
+
+Records are written and read one line at a time, so neither direction holds
+more than a chunk of tasks in memory.
+"""
+
+import json
+from typing import Dict, Iterator, TextIO
+
+from ..core import Journal, Record
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def export_jsonl(journal: Journal, fp: TextIO) -> int:
+    """ Write every record of a journal to a text file, returning how many """
+    count = 0
+    for record in journal.export_records():
+        fp.write(_encoder.encode(record) + "\n")
+        count += 1
+    return count
+
+
+def read_jsonl(fp: TextIO) -> Iterator[Record]:
+    """ Parse records from a text file, skipping blank lines """
+    for line_number, line in enumerate(fp, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON ({e})") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number}: records must be JSON objects")
+        yield record
+
+
+def import_jsonl(
+    journal: Journal, fp: TextIO, chunk_size: int = 10000
+) -> Dict[str, int]:
+    """ Add the records of a text file to a journal, see Journal.import_records """
+    return journal.import_records(read_jsonl(fp), chunk_size)
@@ -0,0 +1,77 @@
+"""
+Shared bookkeeping for readers turning other formats into records
+
+See Journal.export_records for the records themselves.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ..core import Record, TaskRelationship
+
+
+class RecordBuilder:
+    """
+    Number tasks by their IDs in another format, and hold back records
+    until the things they refer to have been read
+
+    Lists are introduced the first time a task names one. Relations are
+    yielded once both of their tasks have been read, and the rest are kept
+    until deferred_relations(), which drops those to tasks that never
+    appeared.
+    """
+
+    def __init__(self):
+        self._task_ids: Dict[str, int] = {}
+        self._next_task_id = 1
+        self._defined: Set[int] = set()
+        self._lists: Set[str] = set()
+        self._deferred: List[Tuple[int, int, TaskRelationship]] = []
+
+    def task_id(self, uid: Optional[str]) -> int:
+        """ Number a task, giving tasks without an ID a fresh number """
+        if uid is not None and uid in self._task_ids:
+            return self._task_ids[uid]
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        if uid is not None:
+            self._task_ids[uid] = task_id
+        return task_id
+
+    def define_task(self, uid: Optional[str]) -> int:
+        """ Number a task that has been read, raising ValueError for duplicates """
+        task_id = self.task_id(uid)
+        if task_id in self._defined:
+            raise ValueError(f"Duplicate task ID '{uid}'")
+        self._defined.add(task_id)
+        return task_id
+
+    def list_records(self, names: Iterable[str]) -> Iterator[Record]:
+        for name in names:
+            if name not in self._lists:
+                self._lists.add(name)
+                yield {"type": "list", "name": name}
+
+    def relation_records(
+        self, task_from_id: int, task_to_id: int, relationship: TaskRelationship
+    ) -> Iterator[Record]:
+        if task_from_id in self._defined and task_to_id in self._defined:
+            yield _relation_record(task_from_id, task_to_id, relationship)
+        else:
+            self._deferred.append((task_from_id, task_to_id, relationship))
+
+    def deferred_relations(self) -> Iterator[Record]:
+        for task_from_id, task_to_id, relationship in self._deferred:
+            if task_from_id in self._defined and task_to_id in self._defined:
+                yield _relation_record(task_from_id, task_to_id, relationship)
+        self._deferred.clear()
+
+
+def _relation_record(
+    task_from_id: int, task_to_id: int, relationship: TaskRelationship
+) -> Record:
+    return {
+        "type": "relation",
+        "from": task_from_id,
+        "to": task_to_id,
+        "relationship": relationship.value,
+    }
@@ -0,0 +1,229 @@
+"""
+Instant-start snapshots of a journal's overview
+
+A snapshot sits next to its journal (``journal.db.snapshot``) and holds the
+user lists, every list count, and the first page of one list's tasks, so the
+window can draw real data before the journal itself has been opened. It is
+a flat little-endian binary file read in place through ``mmap``:
+
+- a fixed header with the journal stamp and the number of each record
+- ``(list id, count)`` pairs, core lists encoded as negative IDs
+- list records, then task records, with length-prefixed UTF-8 strings and
+  times as UTC microseconds since the epoch, or local ones for times
+  without an offset, which are flagged
+
+The stamp is the modification time and size of the journal and its WAL
+file. ``PRAGMA data_version`` can't be used for this as it only changes
+between reads on the same connection, not across processes or restarts.
+"""
+
+from datetime import datetime, timezone
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import List, Optional, Tuple
+
+from ..core import JournalOverview, Task, TaskList, decode_list_id, encode_list_id
+from .sqlite import datetime_to_epoch, epoch_to_datetime
+
+
+MAGIC = b"HISN"
+FORMAT_VERSION = 3
+
+# number of tasks of the snapshotted list to store
+PAGE_SIZE = 50
+
+# magic, version, journal mtime (ns), journal size, WAL mtime (ns), WAL size,
+# list ID, number of counts, lists, and tasks
+_HEADER = struct.Struct("<4sHxxqqqqqIII")
+_COUNT = struct.Struct("<qq")
+_LIST = struct.Struct("<qq")
+_TASK = struct.Struct("<qqqB")
+_LENGTH = struct.Struct("<I")
+_ID = struct.Struct("<q")
+# microseconds since the epoch, and whether they're local, i.e. naive
+_TIME = struct.Struct("<q?")
+
+# string length and epoch time marking a None value
+_NULL = 0xFFFFFFFF
+_NULL_TIME = -(2 ** 63)
+
+Stamp = Tuple[int, int, int, int]
+
+
+def snapshot_path(db_path: Path) -> Path:
+    return db_path.with_name(db_path.name + ".snapshot")
+
+
+def journal_stamp(db_path: Path) -> Stamp:
+    """ Identify the current on-disk state of a journal """
+    db_stat = db_path.stat()
+    wal_path = db_path.with_name(db_path.name + "-wal")
+    if wal_path.exists():
+        wal_stat = wal_path.stat()
+        wal_stamp = (wal_stat.st_mtime_ns, wal_stat.st_size)
+    else:
+        wal_stamp = (0, 0)
+    return (db_stat.st_mtime_ns, db_stat.st_size) + wal_stamp
+
+
+class _Writer:
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def pack(self, fmt: struct.Struct, *values) -> None:
+        self._chunks.append(fmt.pack(*values))
+
+    def string(self, value: Optional[str]) -> None:
+        if value is None:
+            self.pack(_LENGTH, _NULL)
+        else:
+            encoded = value.encode("utf-8")
+            self.pack(_LENGTH, len(encoded))
+            self._chunks.append(encoded)
+
+    def time(self, value: Optional[datetime]) -> None:
+        if value is None:
+            self.pack(_TIME, _NULL_TIME, False)
+        elif value.tzinfo is None:
+            self.pack(
+                _TIME, datetime_to_epoch(value.replace(tzinfo=timezone.utc)), True
+            )
+        else:
+            self.pack(_TIME, datetime_to_epoch(value), False)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+class _Reader:
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._offset = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self._buffer, self._offset)
+        self._offset += fmt.size
+        return values
+
+    def string(self) -> Optional[str]:
+        (length,) = self.unpack(_LENGTH)
+        if length == _NULL:
+            return None
+        start = self._offset
+        self._offset += length
+        return bytes(self._buffer[start : self._offset]).decode("utf-8")
+
+    def time(self) -> Optional[datetime]:
+        value, local = self.unpack(_TIME)
+        if value == _NULL_TIME:
+            return None
+        time = epoch_to_datetime(value)
+        return time.replace(tzinfo=None) if local else time
+
+
+def write_snapshot(db_path: Path, overview: JournalOverview) -> None:
+    """
+    Save an overview of a journal next to it
+
+    Must be called once nothing else will write to the journal, since the
+    snapshot is only valid for the journal's state at this point.
+    """
+    tasks = overview.tasks[:PAGE_SIZE]
+    writer = _Writer()
+    writer.pack(
+        _HEADER,
+        MAGIC,
+        FORMAT_VERSION,
+        *journal_stamp(db_path),
+        encode_list_id(overview.list_id),
+        len(overview.counts),
+        len(overview.lists),
+        len(tasks),
+    )
+    for list_id, count in overview.counts.items():
+        writer.pack(_COUNT, encode_list_id(list_id), count)
+    for tasklist in overview.lists:
+        writer.pack(_LIST, tasklist.list_id, tasklist.position)
+        writer.string(tasklist.name)
+        writer.string(tasklist.icon)
+    for task in tasks:
+        writer.pack(
+            _TASK, task.task_id, task.position, task.priority, int(task.is_trashed)
+        )
+        writer.string(task.description)
+        writer.string(task.notes)
+        writer.time(task.creation_time)
+        writer.time(task.completion_time)
+        writer.time(task.due_time)
+        writer.time(task.start_time)
+        writer.pack(_LENGTH, len(task.tags))
+        for tag in task.tags:
+            writer.string(tag)
+        writer.pack(_LENGTH, len(task.lists))
+        for list_id in task.lists:
+            writer.pack(_ID, list_id)
+
+    # write to the side and swap in, so readers never see half a snapshot
+    path = snapshot_path(db_path)
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(writer.getvalue())
+    os.replace(temp_path, path)
+
+
+def read_snapshot(db_path: Path) -> Optional[JournalOverview]:
+    """ Load the snapshot of a journal, if there is one matching its current state """
+    try:
+        with open(snapshot_path(db_path), "rb") as snapshot_file:
+            with mmap.mmap(
+                snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as buffer:
+                return _decode(buffer, journal_stamp(db_path))
+    except (OSError, ValueError, struct.error):
+        # missing, empty, truncated, or corrupt snapshots are all just misses
+        return None
+
+
+def _decode(buffer, stamp: Stamp) -> Optional[JournalOverview]:
+    reader = _Reader(buffer)
+    (magic, version, *file_stamp, list_id, n_counts, n_lists, n_tasks) = reader.unpack(
+        _HEADER
+    )
+    if (magic != MAGIC) or (version != FORMAT_VERSION) or (tuple(file_stamp) != stamp):
+        return None
+
+    counts = {}
+    for _ in range(n_counts):
+        count_list_id, count = reader.unpack(_COUNT)
+        counts[decode_list_id(count_list_id)] = count
+
+    lists = []
+    for _ in range(n_lists):
+        tasklist_id, position = reader.unpack(_LIST)
+        name = reader.string()
+        icon = reader.string()
+        lists.append(TaskList(tasklist_id, name, icon, position))
+
+    tasks = []
+    for _ in range(n_tasks):
+        task_id, position, priority, is_trashed = reader.unpack(_TASK)
+        task = Task(
+            task_id,
+            position,
+            description=reader.string(),
+            notes=reader.string(),
+            priority=priority,
+            creation_time=reader.time(),
+            completion_time=reader.time(),
+            due_time=reader.time(),
+            start_time=reader.time(),
+            is_trashed=bool(is_trashed),
+        )
+        (n_tags,) = reader.unpack(_LENGTH)
+        task._tags = {reader.string() for _ in range(n_tags)}
+        (n_task_lists,) = reader.unpack(_LENGTH)
+        task._lists = [reader.unpack(_ID)[0] for _ in range(n_task_lists)]
+        tasks.append(task)
+
+    return JournalOverview(lists, counts, decode_list_id(list_id), tasks)
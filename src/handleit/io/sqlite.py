@@ -1,7 +1,48 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import re
 import sqlite3
-from typing import Union
+from typing import Callable, Dict, Optional, Tuple, Union
 
-from ..core import Journal
+
+Migration = Callable[[sqlite3.Connection], None]
+
+# schema migrations, keyed by the user_version they upgrade the database to
+_migrations: Dict[int, Migration] = {}
+
+
+def migration(version: int) -> Callable[[Migration], Migration]:
+    def register(f: Migration) -> Migration:
+        _migrations[version] = f
+        return f
+
+    return register
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def latest_schema_version() -> int:
+    """ The schema version upgrade_database brings databases to """
+    return max(_migrations)
+
+
+def upgrade_database(conn: sqlite3.Connection) -> None:
+    """ Apply every migration newer than the database's schema version """
+    version = get_schema_version(conn)
+    for new_version in sorted(_migrations):
+        if new_version <= version:
+            continue
+        # run each migration and its version bump in a single transaction
+        with conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            # another process may have upgraded it while this one waited
+            if get_schema_version(conn) >= new_version:
+                continue
+            _migrations[new_version](conn)
+            conn.execute(f"PRAGMA user_version = {new_version}")
 
 
 def create_new_database(path: Union[str, sqlite3.Connection]) -> None:
@@ -98,5 +139,567 @@ def create_new_database(path: Union[str, sqlite3.Connection]) -> None:
         """
         )
 
+    upgrade_database(conn)
+
     if not isinstance(path, sqlite3.Connection):
         conn.close()
+
+
+@migration(2)
+def _add_query_indexes(conn: sqlite3.Connection) -> None:
+    """ Index the columns the Journal list, count, and relationship queries filter on """
+    # partial indexes over the core lists, ordered by position
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS tasks_pending ON tasks (position) WHERE completion_dtm IS NULL AND NOT is_trashed"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (position) WHERE completion_dtm IS NOT NULL AND NOT is_trashed"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS tasks_trashed ON tasks (position) WHERE is_trashed"
+    )
+    # reverse lookups not covered by the composite primary keys
+    conn.execute("CREATE INDEX IF NOT EXISTS task_lists_task ON task_lists (task_id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS task_relations_to ON task_relations (task_to_id, relationship)"
+    )
+
+
+# (ISO text column, epoch column) pairs for every task datetime
+TASK_TIME_COLUMNS = (
+    ("creation_dtm", "creation_ts"),
+    ("completion_dtm", "completion_ts"),
+    ("due_dtm", "due_ts"),
+    ("start_dtm", "start_ts"),
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def datetime_to_epoch(dt: Optional[datetime]) -> Optional[int]:
+    """ Convert a datetime to UTC microseconds since the epoch, taking naive times as local """
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def epoch_to_datetime(epoch: Optional[int]) -> Optional[datetime]:
+    if epoch is None:
+        return None
+    return _EPOCH + timedelta(microseconds=epoch)
+
+
+def _sql_iso_to_epoch(column: str) -> str:
+    """
+    SQL expression converting an ISO datetime to UTC microseconds since the epoch
+
+    SQLite only keeps millisecond precision, so Journal writes exact values
+    itself and this only catches rows written by anything else. Like
+    datetime_to_epoch, times without an offset are taken to be local; the
+    utc modifier leaves times with one as they are.
+    """
+    return f"(CAST(strftime('%s', {column}, 'utc') AS INTEGER) * 1000000 + CAST(ROUND(strftime('%f', {column}, 'utc') * 1000) AS INTEGER) % 1000 * 1000)"
+
+
+@migration(3)
+def _add_epoch_columns(conn: sqlite3.Connection) -> None:
+    """ Mirror the ISO text datetimes of tasks as indexable UTC epoch integers """
+    for _, epoch_column in TASK_TIME_COLUMNS:
+        conn.execute(f"ALTER TABLE tasks ADD COLUMN {epoch_column} INTEGER")
+
+    # backfill existing rows with full precision
+    text_columns = ", ".join(text for text, _ in TASK_TIME_COLUMNS)
+    set_epochs = ", ".join(f"{epoch} = ?" for _, epoch in TASK_TIME_COLUMNS)
+    conn.executemany(
+        f"UPDATE tasks SET {set_epochs} WHERE task_id = ?",
+        [
+            tuple(
+                datetime_to_epoch(datetime.fromisoformat(value)) if value else None
+                for value in row[1:]
+            )
+            + (row[0],)
+            for row in conn.execute(f"SELECT task_id, {text_columns} FROM tasks")
+        ],
+    )
+
+    for epoch_column in ("completion_ts", "due_ts", "start_ts"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS tasks_{epoch_column} ON tasks ({epoch_column}) WHERE {epoch_column} IS NOT NULL"
+        )
+
+    # keep the epoch columns in sync for writers that only set the text ones
+    insert_missing = " OR ".join(
+        f"(NEW.{epoch} IS NULL AND NEW.{text} IS NOT NULL)"
+        for text, epoch in TASK_TIME_COLUMNS
+    )
+    insert_set = ", ".join(
+        f"{epoch} = COALESCE(NEW.{epoch}, {_sql_iso_to_epoch('NEW.' + text)})"
+        for text, epoch in TASK_TIME_COLUMNS
+    )
+    conn.execute(
+        f"CREATE TRIGGER tasks_epoch_insert AFTER INSERT ON tasks WHEN {insert_missing} "
+        f"BEGIN UPDATE tasks SET {insert_set} WHERE task_id = NEW.task_id; END"
+    )
+
+    # text changed without its epoch changing alongside it
+    stale_conditions = {
+        epoch: f"(NEW.{text} IS NOT OLD.{text} AND NEW.{epoch} IS OLD.{epoch})"
+        for text, epoch in TASK_TIME_COLUMNS
+    }
+    update_set = ", ".join(
+        f"{epoch} = CASE WHEN {stale_conditions[epoch]} THEN {_sql_iso_to_epoch('NEW.' + text)} ELSE NEW.{epoch} END"
+        for text, epoch in TASK_TIME_COLUMNS
+    )
+    conn.execute(
+        f"CREATE TRIGGER tasks_epoch_update AFTER UPDATE OF {text_columns} ON tasks "
+        f"WHEN {' OR '.join(stale_conditions.values())} "
+        f"BEGIN UPDATE tasks SET {update_set} WHERE task_id = NEW.task_id; END"
+    )
+
+
+@migration(4)
+def _add_agenda_indexes(conn: sqlite3.Connection) -> None:
+    """ Index the due and start times of pending tasks for agenda range queries """
+    for epoch_column in ("due_ts", "start_ts"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS tasks_pending_{epoch_column} ON tasks ({epoch_column}) WHERE completion_dtm IS NULL AND NOT is_trashed"
+        )
+
+
+@migration(5)
+def _add_views_table(conn: sqlite3.Connection) -> None:
+    """ Store saved filters, shown as smart views alongside the user lists """
+    conn.execute(
+        """
+        CREATE TABLE views (
+            view_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            icon TEXT,
+            query TEXT NOT NULL,
+            position INTEGER NOT NULL UNIQUE
+        )
+        """
+    )
+
+
+@migration(6)
+def _add_sort_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Index every sort of the Pending list, and Completed by completion time
+
+    Index expressions match Journal's ORDER BY terms, so sorted pages are
+    read straight off an index in either direction.
+    """
+    pending_sorts = {
+        "priority": "priority",
+        "due": "due_ts IS NULL, due_ts",
+        "start": "start_ts IS NULL, start_ts",
+        "created": "creation_ts",
+        "description": "description COLLATE NOCASE",
+    }
+    for name, terms in pending_sorts.items():
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS tasks_pending_by_{name} ON tasks ({terms}, position) WHERE completion_dtm IS NULL AND NOT is_trashed"
+        )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS tasks_completed_by_completed ON tasks (completion_ts IS NULL, completion_ts, position) WHERE completion_dtm IS NOT NULL AND NOT is_trashed"
+    )
+
+
+@migration(7)
+def _add_tag_postings_index(conn: sqlite3.Connection) -> None:
+    """ Index the tasks of each tag, as the primary key only covers each task's tags """
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS task_tags_tag ON task_tags (tag_id, task_id)"
+    )
+
+
+# typed value column of each attribute type, with the SQL parsing its text value
+ATTRIBUTE_VALUE_COLUMNS = {
+    "int": ("integer_value", "CAST({text} AS INTEGER)"),
+    "bool": ("integer_value", "({text} IN ('1', 'True', 'true'))"),
+    "float": ("real_value", "CAST({text} AS REAL)"),
+    "str": ("text_value", "{text}"),
+}
+
+
+def _sql_typed_attribute_values(row: str) -> str:
+    """ SQL SET clause parsing the text value of a task_attributes row into its typed column """
+    columns = {}
+    for attr_type, (column, parse) in ATTRIBUTE_VALUE_COLUMNS.items():
+        columns.setdefault(column, []).append(
+            f"WHEN '{attr_type}' THEN {parse.format(text=row + 'attr_value')}"
+        )
+    return ", ".join(
+        f"{column} = CASE {row}attr_type {' '.join(cases)} END"
+        for column, cases in columns.items()
+    )
+
+
+@migration(8)
+def _add_typed_attribute_values(conn: sqlite3.Connection) -> None:
+    """
+    Store task attribute values in typed, indexed columns
+
+    attr_value stays as a text copy for older readers. Booleans used to be
+    read back with bool(text), so every stored value came back True. They are
+    parsed properly here.
+    """
+    for column, column_type in (
+        ("integer_value", "INTEGER"),
+        ("real_value", "REAL"),
+        ("text_value", "TEXT"),
+    ):
+        conn.execute(f"ALTER TABLE task_attributes ADD COLUMN {column} {column_type}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS task_attributes_{column} ON task_attributes (attr_key, {column}) WHERE {column} IS NOT NULL"
+        )
+    conn.execute(f"UPDATE task_attributes SET {_sql_typed_attribute_values('')}")
+
+    # keep the typed columns in sync for writers that only set the text one
+    untyped = "NEW.integer_value IS NULL AND NEW.real_value IS NULL AND NEW.text_value IS NULL"
+    conn.execute(
+        f"CREATE TRIGGER task_attributes_typed_insert AFTER INSERT ON task_attributes WHEN {untyped} "
+        f"BEGIN UPDATE task_attributes SET {_sql_typed_attribute_values('NEW.')} WHERE task_id = NEW.task_id AND attr_key = NEW.attr_key; END"
+    )
+    stale = (
+        "(NEW.attr_value IS NOT OLD.attr_value OR NEW.attr_type IS NOT OLD.attr_type) "
+        "AND NEW.integer_value IS OLD.integer_value AND NEW.real_value IS OLD.real_value AND NEW.text_value IS OLD.text_value"
+    )
+    conn.execute(
+        f"CREATE TRIGGER task_attributes_typed_update AFTER UPDATE OF attr_type, attr_value ON task_attributes WHEN {stale} "
+        f"BEGIN UPDATE task_attributes SET {_sql_typed_attribute_values('NEW.')} WHERE task_id = NEW.task_id AND attr_key = NEW.attr_key; END"
+    )
+
+
+# rows of these tables are identified across journals by a uid, besides
+# their ID in one journal
+UID_TABLES = {
+    "tasks": "task_id",
+    "lists": "list_id",
+    "tags": "tag_id",
+    "views": "view_id",
+}
+
+# every table in the change log, with the columns its rows are keyed by and
+# the rest of the columns changes are recorded for. Key columns referring
+# to a row of a table in UID_TABLES are logged as that row's uid.
+CHANGE_LOG_TABLES: Dict[
+    str, Tuple[Tuple[Tuple[str, Optional[str]], ...], Tuple[str, ...]]
+] = {
+    "tasks": (
+        (("uid", None),),
+        (
+            "position",
+            "description",
+            "notes",
+            "priority",
+            "creation_dtm",
+            "creation_ts",
+            "completion_dtm",
+            "completion_ts",
+            "due_dtm",
+            "due_ts",
+            "start_dtm",
+            "start_ts",
+            "is_trashed",
+        ),
+    ),
+    "lists": ((("uid", None),), ("name", "icon", "position")),
+    "tags": ((("uid", None),), ("name", "color")),
+    "views": ((("uid", None),), ("name", "icon", "query", "position")),
+    "task_lists": ((("list_id", "lists"), ("task_id", "tasks")), ()),
+    "task_tags": ((("task_id", "tasks"), ("tag_id", "tags")), ()),
+    "task_attributes": (
+        (("task_id", "tasks"), ("attr_key", None)),
+        ("attr_type", "attr_value", "integer_value", "real_value", "text_value"),
+    ),
+    "task_relations": (
+        (("task_from_id", "tasks"), ("task_to_id", "tasks"), ("relationship", None)),
+        (),
+    ),
+    "notifications": ((("task_id", "tasks"), ("dtm", None)), ()),
+}
+
+# new uids, where tags are named after their name so that the same tag
+# added to two journals is the same tag
+SQL_NEW_UID = "lower(hex(randomblob(16)))"
+_SQL_NEW_TAG_UID = f"CASE WHEN EXISTS (SELECT 1 FROM tags WHERE uid = 'tag:' || NEW.name) THEN {SQL_NEW_UID} ELSE 'tag:' || NEW.name END"
+
+_SQL_ORIGIN = "(SELECT value FROM metadata WHERE property = 'origin')"
+
+# now in UTC microseconds, but always after every logged change so that
+# local changes win over the ones before them even across skewed clocks
+_SQL_CHANGE_TIME = "MAX(CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER) * 1000, COALESCE((SELECT MAX(changed_ts) FROM changes) + 1, 0))"
+
+
+def sql_change_key(table: str, row: str, deleted: bool = False) -> str:
+    """
+    SQL expression of the JSON array a row is logged under
+
+    A deleted row may have been deleted along with a row it links to, whose
+    uid is then looked up in deleted_uids instead.
+    """
+    terms = []
+    for column, referenced in CHANGE_LOG_TABLES[table][0]:
+        if referenced is None:
+            terms.append(row + column)
+            continue
+        uid = f"(SELECT uid FROM {referenced} WHERE {UID_TABLES[referenced]} = {row}{column})"
+        if deleted:
+            uid = (
+                f"COALESCE({uid}, (SELECT uid FROM deleted_uids "
+                f"WHERE table_name = '{referenced}' AND row_id = {row}{column}))"
+            )
+        terms.append(uid)
+    return f"json_array({', '.join(terms)})"
+
+
+def _sql_change_data(table: str, row: str) -> str:
+    """ SQL expression of a JSON object of every logged column of a row """
+    pairs = (f"'{field}', {row}{field}" for field in CHANGE_LOG_TABLES[table][1])
+    return f"json_object({', '.join(pairs)})"
+
+
+def sql_insert_changes(table: str, row: str, operation: str) -> str:
+    """ SQL logging every row of a table selected as row as inserted """
+    return (
+        "INSERT INTO changes (origin, changed_ts, table_name, row_key, operation, data) "
+        f"SELECT {_SQL_ORIGIN}, {_SQL_CHANGE_TIME}, '{table}', {sql_change_key(table, row)}, '{operation}', {_sql_change_data(table, row)} FROM {table}"
+    )
+
+
+def _sql_delete_change(table: str) -> str:
+    return (
+        "INSERT INTO changes (origin, changed_ts, table_name, row_key, operation, old_data) "
+        f"VALUES ({_SQL_ORIGIN}, {_SQL_CHANGE_TIME}, '{table}', {sql_change_key(table, 'OLD.', deleted=True)}, 'delete', {_sql_change_data(table, 'OLD.')})"
+    )
+
+
+def _create_change_triggers(conn: sqlite3.Connection, table: str) -> None:
+    """ Log every insert, update, and delete of a table's rows in changes """
+    key_columns, fields = CHANGE_LOG_TABLES[table]
+    row = f"{table}."
+
+    insert = sql_insert_changes(table, row, "insert") + " WHERE rowid = NEW.rowid;"
+    if table in UID_TABLES:
+        new_uid = _SQL_NEW_TAG_UID if table == "tags" else SQL_NEW_UID
+        # rows added by anything but a sync get a new uid
+        insert = (
+            f"UPDATE {table} SET uid = {new_uid} WHERE rowid = NEW.rowid AND NEW.uid IS NULL; "
+            + insert
+        )
+    conn.execute(
+        f"CREATE TRIGGER {table}_log_insert AFTER INSERT ON {table} BEGIN {insert} END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER {table}_log_delete AFTER DELETE ON {table} BEGIN {_sql_delete_change(table)}; END"
+    )
+
+    old_key = sql_change_key(table, "OLD.")
+    new_key = sql_change_key(table, "NEW.")
+    if fields:
+        # only the columns that changed, skipping updates that changed nothing
+        changed = " UNION ALL ".join(
+            f"SELECT '{field}' AS field, NEW.{field} AS new_value, OLD.{field} AS old_value WHERE NEW.{field} IS NOT OLD.{field}"
+            for field in fields
+        )
+        conn.execute(
+            f"CREATE TRIGGER {table}_log_update AFTER UPDATE OF {', '.join(fields)} ON {table} WHEN {new_key} IS {old_key} "
+            "BEGIN INSERT INTO changes (origin, changed_ts, table_name, row_key, operation, data, old_data) "
+            f"SELECT {_SQL_ORIGIN}, {_SQL_CHANGE_TIME}, '{table}', {new_key}, 'update', json_group_object(field, new_value), json_group_object(field, old_value) "
+            f"FROM ({changed}) HAVING COUNT(*) > 0; END"
+        )
+    if table not in UID_TABLES:
+        # a link row with a new key is another row
+        conn.execute(
+            f"CREATE TRIGGER {table}_log_rekey AFTER UPDATE OF {', '.join(column for column, _ in key_columns)} ON {table} WHEN {new_key} IS NOT {old_key} "
+            f"BEGIN {_sql_delete_change(table)}; "
+            f"{sql_insert_changes(table, row, 'insert')} WHERE rowid = NEW.rowid; END"
+        )
+
+
+@migration(9)
+def _add_change_log(conn: sqlite3.Connection) -> None:
+    """
+    Log every change to tasks and their lists, tags, and views
+
+    Changes are numbered in the order they're made and stamped with a
+    time and the journal that made them, its origin, so they can be played
+    back into another journal. Tasks, lists, tags, and views get uids to
+    identify them across journals, and every existing row is logged as
+    inserted so a new journal can catch up from the start of the log.
+    """
+    conn.execute(
+        """
+        CREATE TABLE changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            changed_ts INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            data TEXT,
+            old_data TEXT
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS changes_row ON changes (table_name, row_key)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS changes_changed_ts ON changes (changed_ts)"
+    )
+    conn.execute(
+        f"INSERT OR REPLACE INTO metadata (property, value) VALUES ('origin', {SQL_NEW_UID})"
+    )
+
+    for table in UID_TABLES:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN uid TEXT")
+        new_uid = "'tag:' || name" if table == "tags" else SQL_NEW_UID
+        conn.execute(f"UPDATE {table} SET uid = {new_uid}")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_uid ON {table} (uid)")
+    for table in CHANGE_LOG_TABLES:
+        conn.execute(sql_insert_changes(table, f"{table}.", "insert"))
+        _create_change_triggers(conn, table)
+
+
+# tables whose rows link to tasks, lists, or tags, and go when they do
+CASCADING_TABLES = (
+    "task_lists",
+    "task_tags",
+    "task_attributes",
+    "task_relations",
+    "notifications",
+)
+
+
+@migration(10)
+def _add_delete_cascades(conn: sqlite3.Connection) -> None:
+    """
+    Delete the rows linking to tasks, lists, and tags along with them
+
+    SQLite can't change a table's foreign keys, so every table linking to
+    them is rebuilt with ON DELETE CASCADE ones, leaving out rows that
+    already link to nothing, and gets its indexes and triggers back. Rows
+    deleted by a cascade are logged once the row they link to is gone, so
+    its uid is kept in deleted_uids until its own delete is done.
+    """
+    conn.execute(
+        """
+        CREATE TABLE deleted_uids (
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            uid TEXT,
+            PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID
+        """
+    )
+    for table in ("tasks", "lists", "tags"):
+        id_column = UID_TABLES[table]
+        conn.execute(
+            f"CREATE TRIGGER {table}_keep_uid BEFORE DELETE ON {table} "
+            f"BEGIN INSERT OR REPLACE INTO deleted_uids (table_name, row_id, uid) VALUES ('{table}', OLD.{id_column}, OLD.uid); END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER {table}_forget_uid AFTER DELETE ON {table} "
+            f"BEGIN DELETE FROM deleted_uids WHERE table_name = '{table}' AND row_id = OLD.{id_column}; END"
+        )
+
+    for table in CASCADING_TABLES:
+        table_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        table_sql = re.sub(
+            r"REFERENCES (\w+) \((\w+)\)",
+            r"REFERENCES \1 (\2) ON DELETE CASCADE",
+            table_sql.replace(table, f"{table}_cascading", 1),
+        )
+        # the change triggers are created anew, the rest as they were
+        dependents = [
+            row[1]
+            for row in conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL",
+                (table,),
+            )
+            if not row[0].startswith(f"{table}_log_")
+        ]
+        linked = " AND ".join(
+            f"{column} IN (SELECT {UID_TABLES[referenced]} FROM {referenced})"
+            for column, referenced in CHANGE_LOG_TABLES[table][0]
+            if referenced is not None
+        )
+
+        conn.execute(table_sql)
+        conn.execute(
+            f"INSERT INTO {table}_cascading SELECT * FROM {table} WHERE {linked}"
+        )
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_cascading RENAME TO {table}")
+        for sql in dependents:
+            conn.execute(sql)
+        _create_change_triggers(conn, table)
+
+
+# tables archived tasks are moved to, along with what they link to
+ARCHIVE_TABLES = (
+    "tasks",
+    "lists",
+    "tags",
+    "task_lists",
+    "task_tags",
+    "task_attributes",
+    "task_relations",
+    "notifications",
+)
+
+_ARCHIVE_INDEXES = {
+    "tasks_position": "tasks (position)",
+    "tasks_completion_ts": "tasks (completion_ts)",
+    "task_lists_task": "task_lists (task_id)",
+    "task_relations_to": "task_relations (task_to_id, relationship)",
+}
+
+# the highest task ID ever given out, counting tasks moved to an archive
+SQL_MAX_TASK_ID = (
+    "MAX(COALESCE((SELECT MAX(task_id) FROM tasks), 0), "
+    "COALESCE((SELECT CAST(value AS INTEGER) FROM metadata WHERE property = 'archived_task_id'), 0))"
+)
+
+
+def attach_archive(
+    conn: sqlite3.Connection, path: Union[str, Path], schema: str = "archive"
+) -> None:
+    """
+    Attach an archive database, creating or adding to its tables to match the journal's
+
+    Archive tables only keep the journal tables' columns and primary keys,
+    since positions and tag names only have to be unique among the rows
+    still in the journal. They have no triggers, so nothing archived is
+    logged as changed.
+    """
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+    with conn:
+        for table in ARCHIVE_TABLES:
+            columns = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+            existing = {
+                row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")
+            }
+            if not existing:
+                key = [
+                    row[1] for row in sorted(columns, key=lambda row: row[5]) if row[5]
+                ]
+                definitions = [f"{row[1]} {row[2]}" for row in columns]
+                conn.execute(
+                    f"CREATE TABLE {schema}.{table} ({', '.join(definitions)}, PRIMARY KEY ({', '.join(key)}))"
+                )
+            for row in columns:
+                if existing and row[1] not in existing:
+                    conn.execute(
+                        f"ALTER TABLE {schema}.{table} ADD COLUMN {row[1]} {row[2]}"
+                    )
+        for name, columns in _ARCHIVE_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{name} ON {columns}")
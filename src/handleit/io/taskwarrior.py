@@ -0,0 +1,169 @@
+"""
+Import tasks from Taskwarrior's JSON export
+
+Reads the output of ``task export``, either a JSON array or one object per
+line as older versions of Taskwarrior write it:
+
+- description, with the descriptions of annotations as notes
+- completed tasks keep their end time as completion time, deleted tasks
+  are trashed, and recurring templates are skipped as their instances
+  are exported too
+- entry, due, and scheduled (or else wait) are the creation, due, and
+  start times
+- priorities H, M, and L become 3, 2, and 1
+- project puts it in the list of that name, and tags are kept as tags
+- depends adds blocked_by relations
+- uuid is kept as the "taskwarrior_uuid" attribute, and other plain
+  values, like user defined attributes, as attributes of their own
+
+The export is decoded a task at a time and every task is added in one
+transaction.
+"""
+
+from datetime import datetime, timezone
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+from ..core import Journal, Record, TaskRelationship
+from .records import RecordBuilder
+
+
+UUID_ATTRIBUTE = "taskwarrior_uuid"
+
+_PRIORITIES = {"H": 3, "M": 2, "L": 1}
+
+# fields that are mapped, or only mean something to Taskwarrior itself
+_KNOWN_FIELDS = {
+    "annotations",
+    "depends",
+    "description",
+    "due",
+    "end",
+    "entry",
+    "id",
+    "imask",
+    "mask",
+    "modified",
+    "parent",
+    "priority",
+    "project",
+    "recur",
+    "scheduled",
+    "start",
+    "status",
+    "tags",
+    "until",
+    "urgency",
+    "uuid",
+    "wait",
+}
+
+# whatever can come between tasks in either form of export
+_SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+
+def read_taskwarrior(fp: TextIO, buffer_size: int = 1 << 16) -> Iterator[Record]:
+    """ Parse a Taskwarrior export into records for Journal.import_records """
+    builder = RecordBuilder()
+    for task in _json_objects(fp, buffer_size):
+        if task.get("status") == "recurring":
+            continue
+        task_id = builder.define_task(task.get("uuid"))
+        record = _task_record(task, task_id)
+        yield from builder.list_records(record["lists"])
+        yield record
+
+        depends = task.get("depends") or []
+        # older versions join dependencies with commas
+        if isinstance(depends, str):
+            depends = depends.split(",")
+        for uuid in depends:
+            yield from builder.relation_records(
+                task_id, builder.task_id(uuid), TaskRelationship.DEPENDENCY
+            )
+    yield from builder.deferred_relations()
+
+
+def import_taskwarrior(
+    journal: Journal, fp: TextIO, chunk_size: int = 10000
+) -> Dict[str, int]:
+    """ Add the tasks of a Taskwarrior export to a journal, see Journal.import_records """
+    return journal.import_records(read_taskwarrior(fp), chunk_size)
+
+
+def _json_objects(fp: TextIO, buffer_size: int) -> Iterator[Dict[str, Any]]:
+    """ Decode a stream of JSON objects, reading buffer_size characters at a time """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                # the object may just be cut off by the end of the buffer
+                if eof:
+                    raise ValueError(f"Invalid Taskwarrior export: {e}") from None
+            else:
+                if not isinstance(value, dict):
+                    raise ValueError(
+                        "Invalid Taskwarrior export: tasks must be objects"
+                    )
+                yield value
+                continue
+        elif eof:
+            return
+
+        chunk = fp.read(buffer_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _time(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid Taskwarrior time '{value}'") from None
+
+
+def _task_record(task: Dict[str, Any], task_id: int) -> Record:
+    status = task.get("status", "pending")
+    annotations = [
+        annotation["description"]
+        for annotation in task.get("annotations") or []
+        if annotation.get("description")
+    ]
+    attributes = {
+        key: value
+        for key, value in task.items()
+        if key not in _KNOWN_FIELDS and isinstance(value, (str, int, float, bool))
+    }
+    if "uuid" in task:
+        attributes[UUID_ATTRIBUTE] = task["uuid"]
+    completed = None
+    if status == "completed":
+        completed = _time(task.get("end") or task.get("modified")) or datetime.now(
+            timezone.utc
+        )
+
+    return {
+        "type": "task",
+        "id": task_id,
+        "description": task.get("description", ""),
+        "notes": "\n".join(annotations) if annotations else None,
+        "priority": _PRIORITIES.get(task.get("priority"), 0),
+        "created": _time(task.get("entry")),
+        "completed": completed,
+        "due": _time(task.get("due")),
+        "start": _time(task.get("scheduled") or task.get("wait")),
+        "trashed": status == "deleted",
+        "lists": [task["project"]] if task.get("project") else [],
+        "tags": list(task.get("tags") or []),
+        "attributes": attributes,
+    }
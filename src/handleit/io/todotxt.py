@@ -0,0 +1,123 @@
+"""
+Import tasks from todo.txt files
+
+Each line is a task, in the format of https://github.com/todotxt/todo.txt:
+
+- a leading ``x`` marks it completed, followed by its completion date
+- a priority ``(A)`` to ``(Z)``, or a ``pri:A`` tag on completed tasks,
+  maps A, B, C, and D to priorities 3, 2, 1, and 0, and the rest to -1
+- its creation date comes next
+- ``+project`` puts it in the list of that name, and ``@context`` gives it
+  the tag ``@context``
+- ``due:`` and ``t:`` (threshold) dates set its due and start times, and
+  any other ``key:value`` becomes a text attribute
+
+Projects, contexts, and tags are taken out of the description. Dates are
+local, so they're kept without a UTC offset. Files are read a line at a
+time, and every task is added in one transaction.
+"""
+
+from datetime import datetime
+import re
+from typing import Dict, Iterator, Optional, TextIO
+
+from ..core import Journal, Record
+from .records import RecordBuilder
+
+
+_COMPLETED = re.compile(r"^x (?:(?P<completed>\d{4}-\d{2}-\d{2}) )?")
+_PRIORITY = re.compile(r"^\((?P<priority>[A-Z])\) ")
+_CREATED = re.compile(r"^(?P<created>\d{4}-\d{2}-\d{2}) ")
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TAG = re.compile(r"^(?P<key>[^\s:]+):(?P<value>[^\s:]+)$")
+
+
+def read_todotxt(fp: TextIO) -> Iterator[Record]:
+    """ Parse the tasks of a todo.txt file into records for Journal.import_records """
+    builder = RecordBuilder()
+    task_id = 0
+    for line_number, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        task_id += 1
+        try:
+            record = _task_record(line, task_id)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: {e}") from None
+        yield from builder.list_records(record["lists"])
+        yield record
+
+
+def import_todotxt(
+    journal: Journal, fp: TextIO, chunk_size: int = 10000
+) -> Dict[str, int]:
+    """ Add the tasks of a todo.txt file to a journal, see Journal.import_records """
+    return journal.import_records(read_todotxt(fp), chunk_size)
+
+
+def _priority(letter: str) -> int:
+    return max(3 - (ord(letter) - ord("A")), -1)
+
+
+def _date(text: str) -> datetime:
+    if not _DATE.match(text):
+        raise ValueError(f"invalid date '{text}'")
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"invalid date '{text}'") from None
+
+
+def _task_record(line: str, task_id: int) -> Record:
+    record: Record = {
+        "type": "task",
+        "id": task_id,
+        "priority": 0,
+        "lists": [],
+        "tags": [],
+        "attributes": {},
+    }
+    completed: Optional[datetime] = None
+
+    match = _COMPLETED.match(line)
+    if match is not None:
+        completed = (
+            _date(match.group("completed"))
+            if match.group("completed")
+            # completed tasks may leave out when, but still need a time
+            else datetime.now()
+        )
+        line = line[match.end() :]
+    record["completed"] = completed
+    match = _PRIORITY.match(line)
+    if match is not None:
+        record["priority"] = _priority(match.group("priority"))
+        line = line[match.end() :]
+    match = _CREATED.match(line)
+    if match is not None:
+        record["created"] = _date(match.group("created"))
+        line = line[match.end() :]
+
+    words = []
+    for word in line.split():
+        tag = _TAG.match(word)
+        if len(word) > 1 and word[0] == "+":
+            record["lists"].append(word[1:])
+        elif len(word) > 1 and word[0] == "@":
+            record["tags"].append(word)
+        # URLs look like tags, but their values start with //
+        elif tag is not None and not tag.group("value").startswith("//"):
+            key, value = tag.group("key", "value")
+            if key == "due":
+                record["due"] = _date(value)
+            elif key == "t":
+                record["start"] = _date(value)
+            elif key == "pri" and re.match(r"^[A-Z]$", value):
+                record["priority"] = _priority(value)
+            else:
+                record["attributes"][key] = value
+        else:
+            words.append(word)
+    record["description"] = " ".join(words)
+    return record
@@ -0,0 +1,190 @@
+"""
+A small filter language for tasks, compiled to a SQL condition
+
+A filter is a list of terms separated by whitespace, all of which a task
+must match. Any term can be negated with a leading ``-``.
+
+- ``tag:NAME`` and ``list:NAME`` match tasks with a tag or in a list
+- ``due``, ``start``, ``created``, and ``completed`` compare a time with
+  ``<``, ``<=``, ``>``, or ``>=`` against an ISO date or time, ``now``,
+  ``today``, ``tomorrow``, or an offset from now like ``7d``, ``-2w``, or
+  ``12h``
+- ``priority`` compares with the same operators or ``=`` against an integer
+- ``blocked`` matches tasks waiting on an unfinished task and ``subtask``
+  tasks that have a parent
+- ``is:pending``, ``is:completed``, and ``is:trashed`` choose which tasks to
+  filter, pending by default
+- ``text:WORD`` or any other word is matched against descriptions and notes
+
+Terms with spaces can be quoted, e.g. ``tag:"home remodel 2020"``. Times
+without a UTC offset are taken to be in the time zone of ``now``.
+"""
+
+from datetime import datetime, timedelta
+import re
+import shlex
+from typing import Any, List, Optional, Tuple
+
+from .io.sqlite import datetime_to_epoch
+
+
+class FilterError(ValueError):
+    pass
+
+
+# conditions selecting each core list, matching its partial index
+_STATUS_CONDITIONS = {
+    "pending": "tasks.completion_dtm IS NULL AND NOT tasks.is_trashed",
+    "completed": "tasks.completion_dtm IS NOT NULL AND NOT tasks.is_trashed",
+    "trashed": "tasks.is_trashed",
+}
+
+_TIME_COLUMNS = {
+    "due": "tasks.due_ts",
+    "start": "tasks.start_ts",
+    "created": "tasks.creation_ts",
+    "completed": "tasks.completion_ts",
+}
+
+_KEYWORDS = {
+    "blocked": "EXISTS (SELECT 1 FROM task_relations JOIN tasks AS blockers ON blockers.task_id = task_relations.task_to_id WHERE task_relations.task_from_id = tasks.task_id AND task_relations.relationship = 'blocked_by' AND blockers.completion_dtm IS NULL AND NOT blockers.is_trashed)",
+    "subtask": "EXISTS (SELECT 1 FROM task_relations WHERE task_relations.task_to_id = tasks.task_id AND task_relations.relationship = 'parent_of')",
+}
+
+# comparisons that hold exactly when the keyed one doesn't, for non-NULL values
+_INVERSE_OPERATORS = {"<": ">=", "<=": ">", ">": "<=", ">=": "<", "=": "!="}
+
+_TERM = re.compile(r"^(?P<field>[a-z]+)(?P<operator><=|>=|<|>|=|:)(?P<value>.*)$")
+_OFFSET = re.compile(r"^(?P<amount>[+-]?\d+)(?P<unit>[hdw])$")
+_OFFSET_UNITS = {"h": "hours", "d": "days", "w": "weeks"}
+
+
+def compile_filter(text: str, now: Optional[datetime] = None) -> Tuple[str, List[Any]]:
+    """
+    Compile a filter to a SQL condition on the tasks table and its parameters
+
+    Times are relative to now, the current local time by default, so days
+    start at local midnight. Raises a FilterError describing the first
+    invalid term.
+    """
+    if now is None:
+        now = datetime.now().astimezone()
+    try:
+        terms = shlex.split(text)
+    except ValueError as e:
+        raise FilterError(f"Invalid filter: {e}") from e
+
+    status = "pending"
+    conditions: List[str] = []
+    params: List[Any] = []
+    for term in terms:
+        negated = term.startswith("-") and len(term) > 1
+        if negated:
+            term = term[1:]
+
+        match = _TERM.match(term)
+        if term in _KEYWORDS:
+            condition, term_params = _KEYWORDS[term], []
+        elif match is None or match.group("field") == "text":
+            word = match.group("value") if match is not None else term
+            condition, term_params = _text_condition(word)
+        elif match.group("field") == "is":
+            if negated or (match.group("value") not in _STATUS_CONDITIONS):
+                raise FilterError(
+                    f"Invalid term '{term}'. (Use one of is:{', is:'.join(_STATUS_CONDITIONS)})"
+                )
+            status = match.group("value")
+            continue
+        else:
+            condition, term_params = _field_condition(
+                match.group("field"),
+                match.group("operator"),
+                match.group("value"),
+                negated,
+                now,
+            )
+            # comparisons negate themselves, so tasks without a value still match
+            negated = False
+
+        conditions.append(f"NOT {condition}" if negated else condition)
+        params.extend(term_params)
+
+    return (
+        " AND ".join([_STATUS_CONDITIONS[status]] + conditions),
+        params,
+    )
+
+
+def _text_condition(word: str) -> Tuple[str, List[Any]]:
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", word) + "%"
+    return (
+        "(tasks.description LIKE ? ESCAPE '\\' OR IFNULL(tasks.notes, '') LIKE ? ESCAPE '\\')",
+        [pattern, pattern],
+    )
+
+
+def _field_condition(
+    field: str, operator: str, value: str, negated: bool, now: datetime
+) -> Tuple[str, List[Any]]:
+    if field in ("tag", "list"):
+        if operator != ":":
+            raise FilterError(f"Use {field}:NAME to filter by {field}")
+        if field == "tag":
+            subquery = "SELECT task_tags.task_id FROM task_tags JOIN tags ON tags.tag_id = task_tags.tag_id WHERE tags.name = ?"
+        else:
+            subquery = "SELECT task_lists.task_id FROM task_lists JOIN lists ON lists.list_id = task_lists.list_id WHERE lists.name = ?"
+        return (
+            f"tasks.task_id {'NOT IN' if negated else 'IN'} ({subquery})",
+            [value],
+        )
+
+    if field == "priority":
+        if operator == ":":
+            operator = "="
+        try:
+            priority = int(value)
+        except ValueError:
+            raise FilterError(f"Priorities must be integers, not '{value}'") from None
+        if negated:
+            operator = _INVERSE_OPERATORS[operator]
+        return f"tasks.priority {operator} ?", [priority]
+
+    if field in _TIME_COLUMNS:
+        if operator not in ("<", "<=", ">", ">="):
+            raise FilterError(f"Compare {field} times with <, <=, >, or >=")
+        column = _TIME_COLUMNS[field]
+        epoch = datetime_to_epoch(_parse_time(value, now))
+        if negated:
+            return (
+                f"({column} IS NULL OR {column} {_INVERSE_OPERATORS[operator]} ?)",
+                [epoch],
+            )
+        return f"{column} {operator} ?", [epoch]
+
+    raise FilterError(f"Unknown filter field '{field}'")
+
+
+def _parse_time(value: str, now: datetime) -> datetime:
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if value == "now":
+        return now
+    if value == "today":
+        return today
+    if value == "tomorrow":
+        return today + timedelta(days=1)
+
+    offset = _OFFSET.match(value)
+    if offset is not None:
+        return now + timedelta(
+            **{_OFFSET_UNITS[offset.group("unit")]: int(offset.group("amount"))}
+        )
+
+    try:
+        time = datetime.fromisoformat(value)
+    except ValueError:
+        raise FilterError(
+            f"Invalid time '{value}'. (Use an ISO date or time, now, today, tomorrow, or an offset like 7d)"
+        ) from None
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=now.tzinfo)
+    return time
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+import heapq
+import itertools
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .core import Journal, ReminderKind
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Timer:
+    """ A one-shot timer the scheduler arms for its next deadline """
+
+    def arm(self, delay: float, callback: Callable[[], None]) -> None:
+        """ Call back once after delay seconds, replacing any armed callback """
+        raise NotImplementedError
+
+    def cancel(self) -> None:
+        raise NotImplementedError
+
+
+class NotificationScheduler:
+    """
+    Fire task reminders at their due and notification times
+
+    Upcoming reminders are kept in a min-heap and a single timer is armed for
+    the earliest one, so an idle scheduler does no work no matter how many
+    reminders are waiting. Journal changes to a task replace its reminders;
+    superseded heap entries are skipped when they reach the top.
+    """
+
+    # longest single wait, so far-off deadlines never overflow timer intervals
+    max_delay = 24 * 60 * 60
+
+    def __init__(
+        self,
+        journal: Journal,
+        timer: Timer,
+        on_reminder: Callable[[int, ReminderKind], None],
+        clock: Callable[[], datetime] = utc_now,
+    ):
+        self._journal = journal
+        self._timer = timer
+        self._on_reminder = on_reminder
+        self._clock = clock
+        self._heap: List[Tuple[datetime, int, int, ReminderKind]] = []
+        # tie-breaker so heap entries never compare their reminder kinds
+        self._counter = itertools.count()
+        self._reminders: Dict[int, Set[Tuple[datetime, ReminderKind]]] = {}
+        self._armed_deadline: Optional[datetime] = None
+        self._running = False
+
+    def __len__(self) -> int:
+        return sum(len(reminders) for reminders in self._reminders.values())
+
+    def start(self) -> None:
+        """ Load every upcoming reminder and arm the timer for the first """
+        self._reminders = {}
+        self._heap = []
+        for time, task_id, kind in self._journal.get_reminders(self._clock()):
+            self._reminders.setdefault(task_id, set()).add((time, kind))
+            self._heap.append((time, next(self._counter), task_id, kind))
+        heapq.heapify(self._heap)
+
+        self._journal.observe_tasks(self.refresh_task)
+        self._running = True
+        self._arm()
+
+    def stop(self) -> None:
+        if self._running:
+            self._journal.unobserve_tasks(self.refresh_task)
+            self._timer.cancel()
+            self._armed_deadline = None
+            self._running = False
+
+    @property
+    def next_deadline(self) -> Optional[datetime]:
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def refresh_task(self, task_id: int) -> None:
+        """ Reload the reminders of a task after it changed in the journal """
+        reminders = {
+            (time, kind)
+            for time, _, kind in self._journal.get_reminders(self._clock(), [task_id])
+        }
+        for time, kind in reminders - self._reminders.get(task_id, set()):
+            heapq.heappush(self._heap, (time, next(self._counter), task_id, kind))
+        if reminders:
+            self._reminders[task_id] = reminders
+        else:
+            self._reminders.pop(task_id, None)
+
+        if self._running:
+            self._arm()
+
+    def _is_current(self, time: datetime, task_id: int, kind: ReminderKind) -> bool:
+        return (time, kind) in self._reminders.get(task_id, ())
+
+    def _discard_stale(self) -> None:
+        while self._heap and not self._is_current(
+            self._heap[0][0], self._heap[0][2], self._heap[0][3]
+        ):
+            heapq.heappop(self._heap)
+
+    def _arm(self) -> None:
+        deadline = self.next_deadline
+        if deadline == self._armed_deadline:
+            return
+
+        self._timer.cancel()
+        self._armed_deadline = deadline
+        if deadline is not None:
+            delay = (deadline - self._clock()).total_seconds()
+            self._timer.arm(min(max(delay, 0), self.max_delay), self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        self._armed_deadline = None
+        now = self._clock()
+        while self._heap and (self._heap[0][0] <= now):
+            time, _, task_id, kind = heapq.heappop(self._heap)
+            if self._is_current(time, task_id, kind):
+                self._reminders[task_id].discard((time, kind))
+                if not self._reminders[task_id]:
+                    del self._reminders[task_id]
+                self._on_reminder(task_id, kind)
+        self._arm()
@@ -0,0 +1,126 @@
+"""
+Searching several journals at once, e.g. the yearly files old tasks were split into
+
+Each journal is searched in a worker process of its own, and the hits are
+merged best first as the searches finish, so the first ones can be shown
+while the slower journals are still being searched:
+
+    for hits in search_journals(paths, "flour", limit=20):
+        show(hits)
+"""
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
+import heapq
+from itertools import islice
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import sqlite3
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .core import Journal, Task
+from .io.sqlite import get_schema_version, latest_schema_version
+
+
+# trashed last, then description matches before notes-only ones, then
+# pending before done, then newest first
+Rank = Tuple[bool, bool, bool, float]
+
+
+class SearchHit(NamedTuple):
+    rank: Rank
+    # index of the journal among those searched, its path, and the task in it
+    shard: int
+    path: Path
+    task: Task
+
+    @property
+    def key(self) -> Tuple[Rank, int, int]:
+        """ What hits are ordered by, best first, and unique among them """
+        return self.rank, self.shard, self.task.task_id
+
+
+def rank_task(task: Task, query: str) -> Rank:
+    """ How well a task matching a search for query matches, lowest best """
+    return (
+        task.is_trashed,
+        query.lower() not in task.description.lower(),
+        task.completion_time is not None or task.archived,
+        -task.creation_time.timestamp(),
+    )
+
+
+def search_journal(
+    path: Path, query: str, limit: int, shard: int = 0, include_archived: bool = False
+) -> List[SearchHit]:
+    """
+    The best limit hits of Journal.search_tasks on a journal file, best first
+
+    The file is opened read-only, so searching never locks or changes it.
+    Journals at another schema version raise a ValueError rather than
+    being upgraded.
+    """
+    if not path.is_file():
+        raise FileNotFoundError(f"No journal at '{path}'")
+    conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        version = get_schema_version(conn)
+        if version != latest_schema_version():
+            raise ValueError(
+                f"'{path}' is at schema version {version}, not {latest_schema_version()}"
+            )
+        tasks = Journal(conn).search_tasks(query, include_archived=include_archived)
+    finally:
+        conn.close()
+    return heapq.nsmallest(
+        limit,
+        (SearchHit(rank_task(task, query), shard, path, task) for task in tasks),
+        key=lambda hit: hit.key,
+    )
+
+
+def search_journals(
+    paths: Sequence[Path],
+    query: str,
+    limit: int = 50,
+    include_archived: bool = False,
+    executor: Optional[Executor] = None,
+) -> Iterator[List[SearchHit]]:
+    """
+    Search journals in parallel, yielding the best limit hits so far as each finishes
+
+    The last list yielded holds the best hits of them all. Journals that
+    can't be searched are logged and skipped. Searches run on the executor
+    if one is given, e.g. a pool kept for the search bar, and otherwise on
+    a new pool of processes, one per journal up to one per CPU. Searches
+    not yet started are cancelled if the caller stops iterating early.
+    """
+    own_executor = executor is None
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            max_workers=max(1, min(len(paths), os.cpu_count() or 1)),
+            # forking a process with GTK's threads running isn't safe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    futures: Dict[Future, Path] = {
+        executor.submit(
+            search_journal, path, query, limit, shard, include_archived
+        ): path
+        for shard, path in enumerate(paths)
+    }
+    try:
+        best: List[SearchHit] = []
+        for future in as_completed(futures):
+            try:
+                hits = future.result()
+            except Exception as error:
+                logging.error(f"Could not search '{futures[future]}': {error}")
+                continue
+            best = list(islice(heapq.merge(best, hits, key=lambda hit: hit.key), limit))
+            yield best
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
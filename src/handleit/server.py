@@ -0,0 +1,495 @@
+"""
+A journal server, speaking JSON-RPC 2.0 over a Unix domain socket
+
+    python3 -m handleit.server journal.db
+
+One process owns the journal, so its caches stay warm and tools sharing
+the journal don't each pay to open it or fight over the write lock.
+Requests and responses are JSON objects, one per line. Reads are answered
+right away, from the last commit. Writes are queued and committed in
+groups on a thread of their own: the writes that arrive while a group is
+being committed are all made in the next single transaction, so many
+clients writing at once cost one commit per group rather than one each.
+Undo and redo aren't served, as the journal's undo history is shared and
+one client's undo could take back another's writes.
+
+Methods take their parameters by name. Tasks are returned as the task
+records of Journal.export_records, and lists are given as a list ID or
+one of "pending", "completed", and "trash":
+
+- get_task(task_id), list_tasks(list, sort, limit, offset), count(list),
+  search(text, archived), filter(query), lists(), stats()
+- add_task(description, notes, priority, due, start, tags, lists),
+  update_task(task_id, description, notes, priority, due, start, trashed),
+  complete(task_ids), delete_tasks(task_ids), add_tag(task_id, tag),
+  remove_tag(task_id, tag), move_task(task_id, before, after),
+  empty_trash()
+"""
+
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import socket
+import sqlite3
+import sys
+import tempfile
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .core import CoreTaskList, Journal, Record, SortSpec, Task, TaskList
+
+
+Params = Dict[str, Any]
+Handler = Callable[[Journal, Params], Any]
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+JOURNAL_ERROR = -32000
+
+_CORE_LISTS = {
+    "pending": CoreTaskList.PENDING,
+    "completed": CoreTaskList.COMPLETED,
+    "trash": CoreTaskList.TRASH,
+}
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def default_socket_path(journal_path: Path) -> Path:
+    """ Where a journal is served unless told otherwise, in the user's runtime directory """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return Path(runtime_dir) / "handleit" / f"{journal_path.stem}.sock"
+
+
+def task_record(task: Task) -> Record:
+    """ A task as a JSON-compatible record, like the task records of Journal.export_records """
+    record: Record = {
+        "type": "task",
+        "id": task.task_id,
+        "description": task.description,
+        "notes": task.notes,
+        "priority": task.priority,
+    }
+    for key, time in (
+        ("created", task.creation_time),
+        ("completed", task.completion_time),
+        ("due", task.due_time),
+        ("start", task.start_time),
+    ):
+        record[key] = time.isoformat() if time is not None else None
+    record["trashed"] = bool(task.is_trashed)
+    record["lists"] = list(task.lists)
+    record["tags"] = sorted(task.tags)
+    record["attributes"] = task.attributes
+    record["archived"] = task.archived
+    return record
+
+
+def _list_record(task_list: TaskList) -> Record:
+    return {
+        "type": "list",
+        "id": task_list.list_id,
+        "name": task_list.name,
+        "icon": task_list.icon,
+    }
+
+
+def _list_id(value: Union[str, int]) -> Union[CoreTaskList, int]:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if value in _CORE_LISTS:
+        return _CORE_LISTS[value]
+    raise RPCError(INVALID_PARAMS, f"Invalid list {value!r}")
+
+
+def _time(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        raise RPCError(INVALID_PARAMS, f"Invalid time {value!r}") from None
+
+
+def _get_task(journal: Journal, params: Params) -> Optional[Record]:
+    task = journal.get_task(params["task_id"])
+    return task_record(task) if task is not None else None
+
+
+def _list_tasks(journal: Journal, params: Params) -> List[Record]:
+    sort = params.get("sort")
+    return [
+        task_record(task)
+        for task in journal.get_list_tasks(
+            _list_id(params.get("list", "pending")),
+            SortSpec.parse(sort) if sort is not None else None,
+            params.get("limit"),
+            params.get("offset", 0),
+        )
+    ]
+
+
+def _count(journal: Journal, params: Params) -> int:
+    return journal.get_list_count(_list_id(params.get("list", "pending")))
+
+
+def _search(journal: Journal, params: Params) -> List[Record]:
+    return [
+        task_record(task)
+        for task in journal.search_tasks(
+            params["text"], include_archived=params.get("archived", False)
+        )
+    ]
+
+
+def _filter(journal: Journal, params: Params) -> List[Record]:
+    return [task_record(task) for task in journal.get_filter_tasks(params["query"])]
+
+
+def _lists(journal: Journal, params: Params) -> List[Record]:
+    return [_list_record(task_list) for task_list in journal.lists]
+
+
+def _add_task(journal: Journal, params: Params) -> int:
+    task_id = journal.add_task(
+        params["description"],
+        notes=params.get("notes"),
+        priority=params.get("priority", 0),
+        due_time=_time(params.get("due")),
+        start_time=_time(params.get("start")),
+    )
+    for tag in params.get("tags", []):
+        journal.add_task_tag(task_id, tag)
+    for list_id in params.get("lists", []):
+        journal.add_task_to_list(task_id, list_id)
+    return task_id
+
+
+def _update_task(journal: Journal, params: Params) -> None:
+    task_id = params["task_id"]
+    if journal.get_task(task_id) is None:
+        raise RPCError(JOURNAL_ERROR, f"No task {task_id}")
+    kwargs: Dict[str, Any] = {}
+    if "notes" in params:
+        kwargs["new_notes"] = params["notes"]
+    for name in ("due", "start"):
+        if name in params:
+            kwargs[f"new_{name}_time"] = _time(params[name])
+    journal.update_task(
+        task_id,
+        new_description=params.get("description"),
+        new_priority=params.get("priority"),
+        is_trashed=params.get("trashed"),
+        **kwargs,
+    )
+
+
+def _complete(journal: Journal, params: Params) -> None:
+    now = datetime.now(timezone.utc)
+    for task_id in params["task_ids"]:
+        if journal.get_task(task_id) is None:
+            raise RPCError(JOURNAL_ERROR, f"No task {task_id}")
+        journal.update_task(task_id, new_completion_time=now)
+
+
+def _move_task(journal: Journal, params: Params) -> None:
+    journal.move_task(params["task_id"], params.get("before"), params.get("after"))
+
+
+# methods by name, with whether they write to the journal
+METHODS: Dict[str, Tuple[Handler, bool]] = {
+    "get_task": (_get_task, False),
+    "list_tasks": (_list_tasks, False),
+    "count": (_count, False),
+    "search": (_search, False),
+    "filter": (_filter, False),
+    "lists": (_lists, False),
+    "add_task": (_add_task, True),
+    "update_task": (_update_task, True),
+    "complete": (_complete, True),
+    "delete_tasks": (lambda j, p: j.delete_tasks(p["task_ids"]), True),
+    "add_tag": (lambda j, p: j.add_task_tag(p["task_id"], p["tag"]), True),
+    "remove_tag": (lambda j, p: j.delete_task_tag(p["task_id"], p["tag"]), True),
+    "move_task": (_move_task, True),
+    "empty_trash": (lambda j, p: j.empty_trash(), True),
+}
+
+
+class _Write(NamedTuple):
+    method: str
+    handler: Handler
+    params: Params
+    future: asyncio.Future
+
+
+# a write's result, or what went wrong making it
+_Outcome = Tuple[Any, Optional[Exception]]
+
+
+class JournalServer:
+    """
+    Serve a journal file to clients of a Unix domain socket
+
+    The journal is opened, written and closed on a writer thread of its
+    own, so waiting on its lock or retrying doesn't hold up the event loop.
+    Reads are made on the event loop thread, through the journal's
+    concurrent reader. Queued writes are committed by a single task, up to
+    max_group at a time.
+    """
+
+    def __init__(self, journal_path: Path, max_group: int = 500):
+        self.journal_path = journal_path
+        self.journal: Optional[Journal] = None
+        self.max_group = max_group
+        # writes made and the commits they took
+        self.writes = 0
+        self.commits = 0
+        self._writes: Deque[_Write] = deque()
+        self._has_writes: Optional[asyncio.Event] = None
+        self._committer: Optional[asyncio.Future] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._path: Optional[Path] = None
+
+    async def start(self, path: Path) -> None:
+        """
+        Open the journal and listen on a socket
+
+        A stale socket left by a server that's gone is replaced. The journal
+        is put in WAL mode, for reads not to wait on writes.
+        """
+        if path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                path.unlink()
+            else:
+                raise RuntimeError(f"The journal is already served at '{path}'")
+            finally:
+                probe.close()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="journal-writer"
+        )
+        self.journal = await asyncio.get_running_loop().run_in_executor(
+            self._writer, lambda: Journal(self.journal_path, concurrent_reads=True)
+        )
+        self._warm_up()
+        self._has_writes = asyncio.Event()
+        self._committer = asyncio.ensure_future(self._commit_writes())
+        self._server = await asyncio.start_unix_server(self._serve_client, str(path))
+        os.chmod(path, 0o600)
+        self._path = path
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._committer is not None:
+            self._committer.cancel()
+            try:
+                await self._committer
+            except asyncio.CancelledError:
+                pass
+            self._committer = None
+        if self._writer is not None:
+            if self.journal is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._writer, self.journal.close
+                )
+                self.journal = None
+            self._writer.shutdown()
+            self._writer = None
+        if self._path is not None and self._path.exists():
+            self._path.unlink()
+
+    def _warm_up(self) -> None:
+        """ Read what clients ask for first, so its pages are cached before they do """
+        for list_id in CoreTaskList:
+            self.journal.get_list_count(list_id)
+        self.journal.get_list_count(
+            [task_list.list_id for task_list in self.journal.lists]
+        )
+        self.journal.get_list_tasks(CoreTaskList.PENDING, limit=100)
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._respond(line)
+                if response is not None:
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes) -> Any:
+        """ The response to a line holding a request or a batch of them, None if all are notifications """
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return _error_response(None, RPCError(PARSE_ERROR, "Invalid JSON"))
+        if isinstance(message, list):
+            if not message:
+                return _error_response(None, RPCError(INVALID_REQUEST, "Empty batch"))
+            responses = [await self._respond_one(request) for request in message]
+            return [response for response in responses if response is not None] or None
+        return await self._respond_one(message)
+
+    async def _respond_one(self, request: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(request, dict) or request.get("jsonrpc") != "2.0":
+            return _error_response(None, RPCError(INVALID_REQUEST, "Invalid request"))
+        request_id = request.get("id")
+        try:
+            method = request.get("method")
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RPCError(INVALID_PARAMS, "Parameters must be given by name")
+            if method == "stats":
+                result: Any = {"writes": self.writes, "commits": self.commits}
+            elif method in METHODS:
+                handler, writes = METHODS[method]
+                if writes:
+                    future = asyncio.get_running_loop().create_future()
+                    self._writes.append(_Write(method, handler, params, future))
+                    self._has_writes.set()
+                    result = await future
+                else:
+                    result = _call(handler, self.journal, params)
+            else:
+                raise RPCError(METHOD_NOT_FOUND, f"No method {method!r}")
+        except RPCError as e:
+            return _error_response(request_id, e)
+        except Exception as e:
+            logging.exception(f"Could not answer {request!r}")
+            return _error_response(request_id, RPCError(INTERNAL_ERROR, str(e)))
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    async def _commit_writes(self) -> None:
+        while True:
+            await self._has_writes.wait()
+            # let the clients with requests already in hand queue theirs too
+            await asyncio.sleep(0)
+            group = [self._writes.popleft()]
+            while self._writes and len(group) < self.max_group:
+                group.append(self._writes.popleft())
+            if not self._writes:
+                self._has_writes.clear()
+            # the writes arriving meanwhile queue up for the next group
+            outcomes = await asyncio.get_running_loop().run_in_executor(
+                self._writer, self._commit, group
+            )
+            for write, (result, error) in zip(group, outcomes):
+                if write.future.done():
+                    continue
+                if error is None:
+                    write.future.set_result(result)
+                else:
+                    write.future.set_exception(error)
+
+    def _commit(self, group: List[_Write]) -> List[_Outcome]:
+        """ Make a group of writes in one transaction, or each in its own if any fails, on the writer thread """
+        try:
+            results = self.journal.retrying(self._commit_group, group)
+        except Exception as error:
+            if len(group) == 1:
+                return [(None, error)]
+            return [outcome for write in group for outcome in self._commit([write])]
+        self.writes += len(group)
+        self.commits += 1
+        return [(result, None) for result in results]
+
+    def _commit_group(self, group: List[_Write]) -> List[Any]:
+        with self.journal.transaction():
+            return [_call(write.handler, self.journal, write.params) for write in group]
+
+
+def _call(handler: Handler, journal: Journal, params: Params) -> Any:
+    """ Run a method, turning what goes wrong into RPC errors """
+    try:
+        return handler(journal, params)
+    except RPCError:
+        raise
+    except KeyError as e:
+        raise RPCError(INVALID_PARAMS, f"Missing parameter {e}") from None
+    except (TypeError, ValueError) as e:
+        raise RPCError(INVALID_PARAMS, str(e)) from None
+    except sqlite3.Error as e:
+        raise RPCError(JOURNAL_ERROR, str(e)) from None
+
+
+def _error_response(request_id: Any, error: RPCError) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": error.code, "message": error.message},
+    }
+
+
+async def serve(journal_path: Path, path: Path) -> None:
+    """ Serve a journal file until the process is interrupted or terminated """
+    server = JournalServer(journal_path)
+    await server.start(path)
+    logging.info(f"Serving '{journal_path}' at '{path}'")
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await server.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m handleit.server", description="Serve a HandleIt journal"
+    )
+    parser.add_argument("journal", type=Path)
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        help="socket path, by default named after the journal in $XDG_RUNTIME_DIR/handleit",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.environ.get("HANDLEIT_LOG_LEVEL", "WARNING"))
+    if not args.journal.is_file():
+        print(f"No journal at '{args.journal}'", file=sys.stderr)
+        return 2
+    try:
+        asyncio.run(
+            serve(args.journal, args.socket or default_socket_path(args.journal))
+        )
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import logging
+import time
+from typing import List, Tuple
+
+
+# reference point for startup timings, as close to process start as an import gets
+_start = time.perf_counter()
+
+_phases: List[Tuple[str, float]] = []
+
+
+def mark(phase: str) -> None:
+    """ Record and log how long after startup a phase was reached """
+    elapsed = time.perf_counter() - _start
+    _phases.append((phase, elapsed))
+    logging.debug(f"Startup phase '{phase}' reached after {elapsed * 1000:.1f} ms")
+
+
+def phases() -> List[Tuple[str, float]]:
+    """ Get the (phase, seconds since startup) pairs recorded so far """
+    return list(_phases)
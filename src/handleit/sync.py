@@ -0,0 +1,54 @@
+"""
+Two-way sync of journals through their change logs
+
+Each journal remembers how far it has read into the other's change log, so
+a sync only exchanges the changes made since the last one, and never sends
+a journal back its own changes. Wherever both journals changed the same
+column of a row, the one changed last wins (see Journal.apply_changes), so
+after a sync both hold the same tasks, lists, tags, and views, in the same
+order.
+"""
+
+from pathlib import Path
+from typing import Tuple
+
+from .core import Journal
+
+
+def pull_changes(source: Journal, target: Journal, chunk_size: int = 1000) -> int:
+    """ Apply the changes of source that target doesn't have yet, returning how many were """
+    if source.origin == target.origin:
+        raise ValueError(
+            "Journals with the same origin can't be synced, give one of them a new one with Journal.reset_origin"
+        )
+    until = source.change_seq
+    changes = source.changes_since(
+        target.get_sync_cursor(source.origin),
+        until,
+        exclude_origin=target.origin,
+        chunk_size=chunk_size,
+    )
+    return target.apply_changes(changes, (source.origin, until))
+
+
+def sync_journals(
+    first: Journal, second: Journal, chunk_size: int = 1000
+) -> Tuple[int, int]:
+    """ Exchange changes between two journals, returning how many each applied """
+    return (
+        pull_changes(second, first, chunk_size),
+        pull_changes(first, second, chunk_size),
+    )
+
+
+def sync_files(first: Path, second: Path) -> Tuple[int, int]:
+    """ Like sync_journals, for two journal files """
+    first_journal = Journal(first)
+    try:
+        second_journal = Journal(second)
+        try:
+            return sync_journals(first_journal, second_journal)
+        finally:
+            second_journal.close()
+    finally:
+        first_journal.close()
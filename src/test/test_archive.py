@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+
+from handleit.core import CoreTaskList, Journal, SortSpec, TaskSort
+from handleit.io.sqlite import create_new_database, datetime_to_epoch
+from handleit.sync import sync_journals
+
+from test.test_query_plans import populate_large_db
+from test.test_sync import new_journal
+
+
+def task_details(tasks) -> list:
+    return sorted(
+        (
+            task.description,
+            task.completion_time,
+            sorted(task.lists),
+            sorted(task.tags),
+            task.attributes,
+        )
+        for task in tasks
+    )
+
+
+class TestArchive(unittest.TestCase):
+    # archiving tasks completed more than 20 days before now leaves those
+    # completed since the 11th, i.e. tasks from 900 on
+    now = datetime(2020, 1, 31, tzinfo=timezone.utc)
+    older_than = timedelta(days=20)
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp_dir.name)
+        self.db_path = self.dir / "journal.db"
+        create_new_database(str(self.db_path))
+        conn = sqlite3.connect(str(self.db_path))
+        populate_large_db(conn, 2000, n_lists=5, n_tags=10)
+        conn.close()
+        self.journal = Journal(self.db_path)
+        self.journal.add_task_attribute(3, "estimate", 2.5)
+
+    def old_task_ids(self, journal: Journal) -> list:
+        cutoff = datetime_to_epoch(self.now - self.older_than)
+        return [
+            row[0]
+            for row in journal._conn.execute(
+                "SELECT task_id FROM tasks WHERE completion_ts < ? AND NOT is_trashed",
+                (cutoff,),
+            )
+        ]
+
+    def test_archive_tasks(self):
+        journal = self.journal
+        old = self.old_task_ids(journal)
+        pending = journal.get_list_count(CoreTaskList.PENDING)
+        relations = journal._conn.execute(
+            f"SELECT * FROM task_relations WHERE task_from_id IN ({','.join(map(str, old))})"
+        ).fetchall()
+        seq = journal.change_seq
+        changed = []
+        journal.observe_tasks(changed.append)
+
+        archived = journal.archive_tasks(self.older_than, batch_size=100, now=self.now)
+        self.assertEqual(len(old), archived)
+        self.assertGreater(archived, 300)
+        self.assertEqual(sorted(old), sorted(changed))
+        self.assertEqual([], self.old_task_ids(journal))
+        self.assertEqual(pending, journal.get_list_count(CoreTaskList.PENDING))
+        self.assertEqual(self.dir / "journal-archive.db", journal.archive_path)
+        # nothing to sync, and nothing before it left to undo
+        self.assertEqual(seq, journal.change_seq)
+        self.assertFalse(journal.can_undo)
+        for table in ("task_tags", "task_lists", "task_relations", "task_attributes"):
+            column = "task_from_id" if table == "task_relations" else "task_id"
+            self.assertIsNone(
+                journal._conn.execute(
+                    f"SELECT 1 FROM {table} WHERE {column} IN ({','.join(map(str, old))})"
+                ).fetchone()
+            )
+        self.assertEqual(
+            [tuple(row) for row in relations],
+            [
+                tuple(row)
+                for row in journal._conn.execute(
+                    f"SELECT * FROM archive.task_relations WHERE task_from_id IN ({','.join(map(str, old))})"
+                )
+            ],
+        )
+        self.assertEqual(0, journal.archive_tasks(self.older_than, now=self.now))
+
+    def test_completed_include_archived(self):
+        journal = self.journal
+        sort = SortSpec(TaskSort.COMPLETED)
+        before = journal.get_list_tasks(CoreTaskList.COMPLETED, sort)
+        found = journal.search_tasks("Task 3")
+        journal.archive_tasks(self.older_than, now=self.now)
+
+        remaining = len(journal.get_list_tasks(CoreTaskList.COMPLETED, sort))
+        self.assertLess(remaining, len(before))
+        after = journal.get_list_tasks(
+            CoreTaskList.COMPLETED, sort, include_archived=True
+        )
+        self.assertEqual(task_details(before), task_details(after))
+        self.assertEqual(
+            [task.completion_time for task in before],
+            [task.completion_time for task in after],
+        )
+        self.assertTrue(any(task.archived for task in after))
+        self.assertEqual(
+            {"estimate": 2.5}, [t for t in after if t.task_id == 3][0].attributes
+        )
+        self.assertEqual(
+            sorted(task.task_id for task in found),
+            sorted(
+                task.task_id
+                for task in journal.search_tasks("Task 3", include_archived=True)
+            ),
+        )
+
+        # the default archive is found again after reopening the journal
+        journal.close()
+        self.journal = journal = Journal(self.db_path)
+        self.assertEqual(
+            remaining,
+            len(journal.get_list_tasks(CoreTaskList.COMPLETED, include_archived=True)),
+        )
+        journal.attach_archive()
+        self.assertEqual(
+            len(before),
+            len(journal.get_list_tasks(CoreTaskList.COMPLETED, include_archived=True)),
+        )
+
+    def test_ids_not_reused(self):
+        journal = self.journal
+        journal.update_task(
+            2000, new_completion_time=datetime(2020, 1, 2, tzinfo=timezone.utc)
+        )
+        journal.archive_tasks(self.older_than, now=self.now)
+        self.assertIsNone(journal.get_task(2000))
+        self.assertEqual(2001, journal.add_task("New"))
+
+    def test_undo_after_archive(self):
+        journal = self.journal
+        task_id = journal.add_task("Paint shed")
+        journal.update_task(
+            task_id, new_completion_time=datetime(2020, 1, 2, tzinfo=timezone.utc)
+        )
+        journal.archive_tasks(self.older_than, now=self.now)
+        self.assertFalse(journal.can_undo)
+        self.assertFalse(journal.undo())
+        self.assertIsNone(journal.get_task(task_id))
+
+        # what's done afterwards can be undone as usual
+        journal.update_task(1999, new_description="Repainted")
+        self.assertTrue(journal.undo())
+        self.assertEqual("Task 1999", journal.get_task(1999).description)
+
+    def test_archive_within_transaction(self):
+        journal = self.journal
+        with journal.transaction():
+            task_id = journal.add_task("Paint shed")
+            with self.assertRaisesRegex(RuntimeError, "within a transaction"):
+                journal.archive_tasks(self.older_than, now=self.now)
+            # nothing was committed along the way
+            self.assertFalse(journal._has_archive())
+        self.assertTrue(journal.undo())
+        self.assertIsNone(journal.get_task(task_id))
+
+    def test_sync_keeps_archived_tasks(self):
+        journal = self.journal
+        phone = new_journal()
+        sync_journals(journal, phone)
+        uid = journal._conn.execute(
+            "SELECT uid FROM tasks WHERE task_id = 3"
+        ).fetchone()[0]
+        journal.archive_tasks(self.older_than, now=self.now)
+
+        # edits to archived tasks are skipped
+        phone_id = phone._conn.execute(
+            "SELECT task_id FROM tasks WHERE uid = ?", (uid,)
+        ).fetchone()[0]
+        phone.update_task(phone_id, new_description="Edited on the phone")
+        sync_journals(journal, phone)
+        self.assertEqual(2000, len(list(phone.iter_tasks())))
+        self.assertIsNone(journal.get_task(3))
+        phone.close()
+
+    def tearDown(self):
+        self.journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+
+from handleit.backup import BackupScheduler, backup_path, list_backups, prune_backups
+from handleit.core import CoreTaskList, Journal
+from handleit.io.sqlite import create_new_database
+
+from test.test_query_plans import populate_large_db
+from test.test_scheduler import FakeClock, FakeTimer
+
+
+class TestBackup(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp_dir.name)
+        self.db_path = self.dir / "journal.db"
+        create_new_database(str(self.db_path))
+        conn = sqlite3.connect(str(self.db_path))
+        populate_large_db(conn, 5000, n_lists=5, n_tags=5)
+        conn.close()
+
+    def pending_count(self, path: Path) -> int:
+        journal = Journal(path)
+        try:
+            return journal.get_list_count(CoreTaskList.PENDING)
+        finally:
+            journal.close()
+
+    def backup_while_writing(self, journal: Journal) -> Path:
+        dest = self.dir / "copy.db"
+        steps = []
+
+        def progress(copied, total):
+            steps.append((copied, total))
+            # write on the app's own connection between the first steps
+            if len(steps) <= 3:
+                journal.add_task(f"Written during backup {len(steps)}")
+
+        journal.backup(dest, pages_per_step=16, progress=progress, sleep=0)
+        self.assertGreater(len(steps), 5)
+        self.assertEqual(steps[-1][0], steps[-1][1])
+        return dest
+
+    def test_backup_while_writing(self):
+        journal = Journal(self.db_path)
+        before = journal.get_list_count(CoreTaskList.PENDING)
+        dest = self.backup_while_writing(journal)
+        # the copy restarted until no write landed mid-backup
+        self.assertGreater(self.pending_count(dest), before)
+        self.assertEqual(
+            ["copy.db", "journal.db"], sorted(p.name for p in self.dir.iterdir())
+        )
+        journal.close()
+
+    def test_wal_backup_is_a_snapshot(self):
+        journal = Journal(self.db_path)
+        journal._conn.execute("PRAGMA journal_mode = WAL")
+        before = journal.get_list_count(CoreTaskList.PENDING)
+        dest = self.backup_while_writing(journal)
+        self.assertEqual(before, self.pending_count(dest))
+        self.assertGreater(journal.get_list_count(CoreTaskList.PENDING), before)
+        journal.close()
+
+    def test_cancelled_backup(self):
+        journal = Journal(self.db_path)
+
+        def cancel(copied, total):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            journal.backup(self.dir / "copy.db", pages_per_step=16, progress=cancel)
+        self.assertEqual(["journal.db"], [p.name for p in self.dir.iterdir()])
+        journal.close()
+
+    def test_in_memory_backup(self):
+        conn = sqlite3.connect(":memory:")
+        create_new_database(conn)
+        journal = Journal(conn)
+        self.assertIsNone(journal.path)
+        journal.add_task("Remember me")
+        journal.backup(self.dir / "memory.db")
+        self.assertEqual(1, self.pending_count(self.dir / "memory.db"))
+        journal.close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+class TestBackupRotation(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp_dir.name)
+        self.db_path = self.dir / "journal.db"
+        create_new_database(str(self.db_path))
+
+    def test_prune_backups(self):
+        start = datetime(2020, 6, 1, tzinfo=timezone.utc)
+        # two backups a day for ten weeks
+        for half_days in range(140):
+            backup_path(
+                self.dir, self.db_path, start + timedelta(hours=12 * half_days)
+            ).touch()
+        (self.dir / "journal-notes.db").touch()
+
+        deleted = prune_backups(self.dir, self.db_path, keep_daily=7, keep_weekly=4)
+        kept = [time for time, _ in list_backups(self.dir, self.db_path)]
+        self.assertEqual(140, len(kept) + len(deleted))
+        newest = start + timedelta(hours=12 * 139)
+        # the newest of each of the last 7 days, then of 3 more weeks
+        self.assertEqual(
+            [newest - timedelta(days=d) for d in range(7)], kept[:7],
+        )
+        self.assertEqual(10, len(kept))
+        self.assertEqual(len({t.isocalendar()[:2] for t in kept}), 4)
+        self.assertTrue((self.dir / "journal-notes.db").exists())
+
+    def test_same_file_names(self):
+        other_path = self.dir / "other" / "journal.db"
+        other_path.parent.mkdir()
+        create_new_database(str(other_path))
+        start = datetime(2020, 6, 1, tzinfo=timezone.utc)
+        for days in range(10):
+            backup_path(self.dir, self.db_path, start + timedelta(days=days)).touch()
+        backup_path(self.dir, other_path, start).touch()
+
+        # neither journal sees or prunes the other's backups
+        self.assertEqual(1, len(list_backups(self.dir, other_path)))
+        prune_backups(self.dir, self.db_path, keep_daily=3, keep_weekly=0)
+        self.assertEqual(3, len(list_backups(self.dir, self.db_path)))
+        self.assertEqual(1, len(list_backups(self.dir, other_path)))
+
+    def test_scheduler(self):
+        clock = FakeClock(datetime(2020, 6, 20, 12, tzinfo=timezone.utc))
+        timer = FakeTimer(clock)
+        journal = Journal(self.db_path)
+        backups = self.dir / "backups"
+        scheduler = BackupScheduler(
+            journal, backups, timer, interval=timedelta(hours=6), clock=clock
+        )
+
+        # the first backup is due right away
+        scheduler.start()
+        self.assertEqual(clock.now, timer.deadline)
+        timer.advance(timedelta(days=2, hours=1))
+        # one backup every 6 hours, pruned to the newest of each day
+        self.assertEqual(3, len(list_backups(backups, self.db_path)))
+        scheduler.stop()
+        self.assertIsNone(timer.deadline)
+
+        # a restarted scheduler waits for the newest backup to age
+        scheduler.start()
+        self.assertEqual(clock.now + timedelta(hours=5), timer.deadline)
+        scheduler.stop()
+        journal.close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+from functools import partial
+import io
+import os
+from pathlib import Path
+import subprocess
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from handleit.cli import main
+from handleit.core import CoreTaskList, Journal
+from handleit.io.sqlite import create_new_database
+
+from test.test_core import populate_test_db
+from test.test_startup import SRC_DIR, benchmark
+
+
+# wall time budget for running a command in a fresh process, in seconds
+STARTUP_BUDGET = 0.1
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp_dir.name)
+        self.db_path = self.dir / "journal.db"
+        create_new_database(str(self.db_path))
+        populate_test_db(str(self.db_path))
+
+    def run_cli(self, *args: str, stdin: str = "") -> str:
+        stdout = io.StringIO()
+        self.assertEqual(
+            0, main(["-j", str(self.db_path), *args], io.StringIO(stdin), stdout)
+        )
+        return stdout.getvalue()
+
+    def open_journal(self) -> Journal:
+        journal = Journal(self.db_path)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_add_complete_list(self):
+        pending = int(self.run_cli("count"))
+        task_id = int(
+            self.run_cli(
+                "add",
+                "Paint shed",
+                "--priority",
+                "2",
+                "--tag",
+                "home",
+                "--due",
+                "2020-07-01",
+            )
+        )
+        self.assertEqual(pending + 1, int(self.run_cli("count")))
+        self.assertIn(f"{task_id}\t \tPaint shed\n", self.run_cli("list"))
+        self.assertEqual(f"{task_id}\t \tPaint shed\n", self.run_cli("search", "Paint"))
+
+        self.run_cli("complete", str(task_id))
+        self.assertEqual(pending, int(self.run_cli("count")))
+        task = self.open_journal().get_task(task_id)
+        self.assertEqual({"home"}, set(task.tags))
+        self.assertEqual(2, task.priority)
+        self.assertIsNotNone(task.completion_time)
+        self.assertIn(
+            f"{task_id}\tx\tPaint shed\n",
+            self.run_cli("list", "completed", "--sort=-completed"),
+        )
+
+    def test_errors(self):
+        stderr = io.StringIO()
+        sys.stderr, old_stderr = stderr, sys.stderr
+        try:
+            self.assertEqual(2, main(["-j", str(self.db_path), "complete", "999"]))
+            self.assertEqual(2, main(["-j", str(self.dir / "none.db"), "count"]))
+            self.assertEqual(2, main(["-j", str(self.db_path), "list", "Nowhere"]))
+            self.assertEqual(2, main(["-j", str(self.db_path), "frobnicate"]))
+        finally:
+            sys.stderr = old_stderr
+        self.assertIn("No task 999", stderr.getvalue())
+
+    def test_filter_sort(self):
+        for description, priority in [("Low", 1), ("High", 3), ("Middle", 2)]:
+            self.run_cli("add", description, "--priority", str(priority), "--tag", "x")
+        self.assertEqual(
+            ["High", "Middle"],
+            [
+                line.split("\t")[2]
+                for line in self.run_cli(
+                    "list", "--filter", "tag:x", "--sort=-priority", "--limit", "2"
+                ).splitlines()
+            ],
+        )
+
+    def test_locked_journal(self):
+        connection = sqlite3.connect(str(self.db_path))
+        self.addCleanup(connection.close)
+        connection.execute("BEGIN EXCLUSIVE")
+        stderr = io.StringIO()
+        sys.stderr, old_stderr = stderr, sys.stderr
+        try:
+            with mock.patch("handleit.cli.Journal", partial(Journal, busy_timeout=0.1)):
+                status = main(["-j", str(self.db_path), "add", "Locked out"])
+        finally:
+            sys.stderr = old_stderr
+        self.assertEqual(1, status)
+        self.assertIn("handleit-cli: database is locked", stderr.getvalue())
+
+    def test_batch(self):
+        journal = self.open_journal()
+        count = journal.get_list_count(CoreTaskList.PENDING)
+        commands = "\n".join(
+            ["# shopping", 'add "Buy flour" --tag baking', "", "add 'Buy eggs'"]
+        )
+        self.assertEqual("19\n20\n", self.run_cli("batch", stdin=commands))
+        self.assertEqual(count + 2, journal.get_list_count(CoreTaskList.PENDING))
+
+        # a bad line rolls back the lines before it
+        stderr = io.StringIO()
+        sys.stderr, old_stderr = stderr, sys.stderr
+        try:
+            status = main(
+                ["-j", str(self.db_path), "batch"],
+                io.StringIO("add 'Buy milk'\ncomplete 999\n"),
+                io.StringIO(),
+            )
+        finally:
+            sys.stderr = old_stderr
+        self.assertEqual(2, status)
+        self.assertIn("Line 2: No task 999", stderr.getvalue())
+        self.assertEqual(count + 2, journal.get_list_count(CoreTaskList.PENDING))
+
+    def test_export_import(self):
+        export_path = self.dir / "journal.jsonl"
+        self.run_cli("export", str(export_path))
+        other_path = self.dir / "other.db"
+        create_new_database(str(other_path))
+        self.db_path = other_path
+        self.assertIn(
+            "task\t18\n",
+            self.run_cli("import", "--format", "jsonl", stdin=export_path.read_text()),
+        )
+        self.assertEqual(18, len(list(self.open_journal().iter_tasks())))
+
+    @benchmark
+    def test_startup_time(self):
+        env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+        # timed with bytecode cached, as installed
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        command = [
+            sys.executable,
+            "-m",
+            "handleit.cli",
+            "-j",
+            str(self.db_path),
+            "count",
+        ]
+        best = float("inf")
+        for _ in range(6):
+            start = time.perf_counter()
+            subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+            best = min(best, time.perf_counter() - start)
+        self.assertLess(best, STARTUP_BUDGET)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
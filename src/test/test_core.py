@@ -1,10 +1,23 @@
 import datetime
+import os
+from pathlib import Path
 import sqlite3
+import tempfile
+import time
 from typing import Union
 import unittest
+from unittest import mock
 
-from handleit.core import Journal, TaskRelationship
-from handleit.io.sqlite import create_new_database
+from handleit.core import (
+    AgendaField,
+    CoreTaskList,
+    Journal,
+    SortSpec,
+    TaskRelationship,
+    TaskSort,
+    prefetch_overview,
+)
+from handleit.io.sqlite import create_new_database, datetime_to_epoch
 
 
 class TestJournal(unittest.TestCase):
@@ -18,6 +31,53 @@ class TestJournal(unittest.TestCase):
         tasks = self.journal.get_list_tasks(6)
         self.assertEqual(tasks[1].description, "Learn Spanish")
 
+    def test_get_list_tasks_sorted(self):
+        by_priority = self.journal.get_list_tasks(
+            CoreTaskList.PENDING, SortSpec(TaskSort.PRIORITY, descending=True)
+        )
+        self.assertEqual([1, 11, 2], [t.task_id for t in by_priority[:3]])
+        # ties keep a stable order, so pages never overlap or skip tasks
+        pages = [
+            self.journal.get_list_tasks(
+                CoreTaskList.PENDING,
+                SortSpec(TaskSort.PRIORITY, descending=True),
+                limit=4,
+                offset=offset,
+            )
+            for offset in range(0, len(by_priority), 4)
+        ]
+        self.assertEqual(
+            [t.task_id for t in by_priority],
+            [t.task_id for page in pages for t in page],
+        )
+
+        # tasks without the sorted-by time come last
+        by_start = self.journal.get_list_tasks(
+            CoreTaskList.PENDING, SortSpec(TaskSort.START)
+        )
+        self.assertEqual([3, 1, 2], [t.task_id for t in by_start[:3]])
+        by_description = self.journal.get_list_tasks(
+            6, SortSpec(TaskSort.DESCRIPTION, descending=True)
+        )
+        self.assertEqual(
+            ["Purchase lawnmower", "Learn Spanish"],
+            [t.description for t in by_description],
+        )
+
+    def test_list_sort(self):
+        self.assertEqual(SortSpec(), self.journal.get_list_sort(3))
+        self.journal.set_list_sort(3, SortSpec(TaskSort.DUE, descending=True))
+        self.journal.set_list_sort(CoreTaskList.PENDING, SortSpec(TaskSort.DUE))
+        self.assertEqual(
+            SortSpec(TaskSort.DUE, descending=True), self.journal.get_list_sort(3)
+        )
+        self.assertEqual(
+            SortSpec(TaskSort.DUE), self.journal.get_list_sort(CoreTaskList.PENDING)
+        )
+        self.assertEqual(SortSpec.parse("-due"), self.journal.get_list_sort(3))
+        self.journal.delete_list(3)
+        self.assertEqual(SortSpec(), self.journal.get_list_sort(3))
+
     def test_get_list_count(self):
         self.assertEqual(self.journal.get_list_count(6), 2)
         self.assertEqual(
@@ -31,6 +91,27 @@ class TestJournal(unittest.TestCase):
         self.assertEqual(list_counts[3], 2)
         self.assertEqual(list_counts[500], 0)
 
+    def test_get_overview(self):
+        overview = self.journal.get_overview(6)
+        self.assertEqual(6, overview.list_id)
+        self.assertEqual(
+            ["Purchase lawnmower", "Learn Spanish"],
+            [t.description for t in overview.tasks],
+        )
+        self.assertEqual(6, len(overview.lists))
+        self.assertEqual(1, overview.counts[CoreTaskList.COMPLETED])
+        self.assertEqual(1, overview.counts[CoreTaskList.TRASH])
+        self.assertEqual(2, overview.counts[6])
+
+    def test_prefetch_overview(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / "journal.db"
+            create_new_database(str(db_path))
+            populate_test_db(str(db_path))
+            overview = prefetch_overview(db_path)
+        self.assertEqual(CoreTaskList.PENDING, overview.list_id)
+        self.assertNotIn("Measure yard", {task.description for task in overview.tasks})
+
     def test_lists(self):
         journal_lists = [l.name for l in self.journal.lists]
         self.assertIn("Scheduled", journal_lists)
@@ -66,6 +147,13 @@ class TestJournal(unittest.TestCase):
         self.assertEqual(self.journal.get_list(3).position, list5_old_pos)
         self.assertEqual(self.journal.get_list(5).position, list3_old_pos)
 
+    def test_move_list(self):
+        self.journal.move_list(6, before=2)
+        self.journal.move_list(1, after=5)
+        self.assertEqual([6, 2, 3, 4, 5, 1], [l.list_id for l in self.journal.lists])
+        with self.assertRaises(ValueError):
+            self.journal.move_list(1, before=2, after=3)
+
     def test_delete_list(self):
         self.journal.delete_list(3)
         deleted_list = self.journal.get_list(3)
@@ -168,6 +256,81 @@ class TestJournal(unittest.TestCase):
         self.assertIsNone(updated_task.due_time)
         self.assertIsNone(updated_task.start_time)
 
+    def test_task_times_are_utc(self):
+        new_time = datetime.datetime.fromisoformat("2020-06-20T09:15:30.000123+02:00")
+        task_id = self.journal.add_task("Testing", due_time=new_time)
+        due_time = self.journal.get_task(task_id).due_time
+        self.assertEqual(due_time, new_time)
+        self.assertEqual(due_time.utcoffset(), datetime.timedelta(0))
+
+    def test_naive_times_are_local(self):
+        try:
+            with mock.patch.dict(os.environ, {"TZ": "America/New_York"}):
+                time.tzset()
+                conn = sqlite3.connect(":memory:")
+                create_new_database(conn)
+                populate_test_db(conn)
+                journal = Journal(conn)
+                # the fixture's start date stays on its day wherever it's shown
+                start_time = journal.get_task(3).start_time
+                self.assertEqual(10, start_time.astimezone().day)
+                new_york_midnight = datetime.datetime(
+                    2020, 6, 10, 4, tzinfo=datetime.timezone.utc
+                )
+                self.assertEqual(
+                    datetime_to_epoch(new_york_midnight),
+                    conn.execute(
+                        "SELECT start_ts FROM tasks WHERE task_id = 3"
+                    ).fetchone()[0],
+                )
+                self.assertEqual(
+                    [3],
+                    [
+                        task.task_id
+                        for task in journal.get_filter_tasks(
+                            "start<2020-06-11 start>=2020-06-10"
+                        )
+                    ],
+                )
+                journal.close()
+        finally:
+            time.tzset()
+
+    def test_epoch_columns_synced(self):
+        # rows written without epoch columns, e.g. by the fixture, get them by trigger
+        row = self.temp_db.execute(
+            "SELECT creation_ts, start_ts, due_ts, completion_ts FROM tasks WHERE task_id = 3"
+        ).fetchone()
+        self.assertEqual(
+            row[0],
+            datetime_to_epoch(
+                datetime.datetime.fromisoformat("2020-06-01T17:35:00-04:00")
+            ),
+        )
+        # date-only times are local midnight
+        self.assertEqual(
+            row[1], datetime_to_epoch(datetime.datetime(2020, 6, 10).astimezone())
+        )
+        self.assertIsNotNone(row[2])
+        self.assertIsNone(row[3])
+
+        with self.temp_db:
+            self.temp_db.execute(
+                "UPDATE tasks SET due_dtm = '2020-07-01T00:00:00.250+00:00', start_dtm = NULL WHERE task_id = 3"
+            )
+        row = self.temp_db.execute(
+            "SELECT due_ts, start_ts FROM tasks WHERE task_id = 3"
+        ).fetchone()
+        self.assertEqual(
+            row[0],
+            datetime_to_epoch(
+                datetime.datetime(
+                    2020, 7, 1, 0, 0, 0, 250000, tzinfo=datetime.timezone.utc
+                )
+            ),
+        )
+        self.assertIsNone(row[1])
+
     def test_delete_task(self):
         self.journal.delete_task(1)
         self.assertIsNone(self.journal.get_task(1))
@@ -207,6 +370,33 @@ class TestJournal(unittest.TestCase):
         self.journal.delete_task_tag(2, "@errands")
         self.assertNotIn("@errands", self.journal.get_task(2).tags)
 
+    def test_get_tasks_by_tags(self):
+        def tag_ids(**tags):
+            return {t.task_id for t in self.journal.get_tasks_by_tags(**tags)}
+
+        self.assertEqual({3, 11, 12}, tag_ids(all_of=["@home"]))
+        self.assertEqual({3}, tag_ids(all_of=["@home", "project"]))
+        self.assertEqual(
+            {1, 2, 6, 7, 13, 14, 17},
+            tag_ids(any_of=["@errands", "@phone"], none_of=["@home"]),
+        )
+        self.assertEqual({11, 12}, tag_ids(all_of=["@home"], none_of=["project"]))
+        self.assertEqual({11}, tag_ids(all_of=["@home"], list_id=1))
+        self.assertEqual(set(), tag_ids(all_of=["@home", "missing"]))
+        self.assertEqual(set(), tag_ids(any_of=["missing"]))
+
+    def test_get_tag_counts(self):
+        counts = self.journal.get_tag_counts()
+        # completed and trashed tasks aren't counted
+        self.assertEqual(3, counts["@home"])
+        self.assertEqual(5, counts["@errands"])
+        self.assertEqual(1, counts["work"])
+        self.assertEqual(6, len(counts))
+        self.assertEqual(
+            {"@home": 1, "@phone": 1},
+            {t: c for t, c in self.journal.get_tag_counts(1).items() if c},
+        )
+
     def test_get_tag(self):
         self.assertEqual(self.journal.get_tag(1).name, "@errands")
         self.assertIsNone(self.journal.get_tag(1000))
@@ -264,6 +454,42 @@ class TestJournal(unittest.TestCase):
         self.assertEqual(task1.attributes["time-needed-minutes"], 22)
         self.assertIs(int, type(task1.attributes["time-needed-minutes"]))
 
+    def test_boolean_attributes(self):
+        self.journal.add_task_attribute(1, "waiting", False)
+        self.journal.add_task_attribute(2, "waiting", True)
+        self.assertIs(False, self.journal.get_task(1).attributes["waiting"])
+        self.assertIs(True, self.journal.get_task(2).attributes["waiting"])
+
+        # rows written as text only are parsed into typed columns
+        with self.temp_db:
+            self.temp_db.execute(
+                "INSERT INTO task_attributes (task_id, attr_key, attr_type, attr_value) VALUES (3, 'waiting', 'bool', 'False')"
+            )
+            self.temp_db.execute(
+                "UPDATE task_attributes SET attr_value = '1' WHERE task_id = 1 AND attr_key = 'waiting'"
+            )
+        self.assertIs(False, self.journal.get_task(3).attributes["waiting"])
+        self.assertIs(True, self.journal.get_task(1).attributes["waiting"])
+
+    def test_find_tasks_by_attribute(self):
+        def find_ids(key, op, value):
+            return {
+                t.task_id for t in self.journal.find_tasks_by_attribute(key, op, value)
+            }
+
+        self.journal.add_task_attribute(2, "energy-level", 1)
+        self.journal.add_task_attribute(3, "energy-level", 4.5)
+        self.journal.add_task_attribute(4, "energy-level", True)
+        self.journal.add_task_attribute(6, "context", "garage")
+        self.assertEqual({3, 5}, find_ids("energy-level", ">=", 3))
+        self.assertEqual({2}, find_ids("energy-level", "<", 2.5))
+        self.assertEqual({4}, find_ids("energy-level", "=", True))
+        self.assertEqual({1}, find_ids("time-needed-minutes", ">", 30))
+        self.assertEqual({6}, find_ids("context", "=", "garage"))
+        self.assertEqual(set(), find_ids("context", "<", "basement"))
+        with self.assertRaises(ValueError):
+            self.journal.find_tasks_by_attribute("context", "~", "garage")
+
     def test_swap_task_positions(self):
         task3_old_pos = self.journal.get_task(3).position
         task5_old_pos = self.journal.get_task(5).position
@@ -271,6 +497,18 @@ class TestJournal(unittest.TestCase):
         self.assertEqual(self.journal.get_task(3).position, task5_old_pos)
         self.assertEqual(self.journal.get_task(5).position, task3_old_pos)
 
+    def test_move_task(self):
+        # the fixture's adjacent positions leave no room, so every task is renumbered
+        self.journal.move_task(16, before=9)
+        self.assertEqual([16, 9], [t.task_id for t in self.journal.get_list_tasks(6)])
+        positions = [t.position for t in self.journal.get_tasks(list(range(1, 16)))]
+        self.assertTrue(all(p % self.journal.position_gap == 0 for p in positions))
+
+        self.journal.move_task(1, after=2)
+        self.journal.move_task(18, before=1)
+        pending = self.journal.get_list_tasks(CoreTaskList.PENDING)
+        self.assertEqual([2, 18, 1, 3], [t.task_id for t in pending[:4]])
+
     def test_get_task_relationships(self):
         self.assertEqual(
             {TaskRelationship.PARENT}, self.journal.get_task_relationships(3, 4)
@@ -341,6 +579,50 @@ class TestJournal(unittest.TestCase):
         self.assertIn(9, dependents[3])
         self.assertIn(14, dependents[15])
 
+    def test_get_agenda(self):
+        utc = datetime.timezone.utc
+        start = datetime.datetime(2020, 6, 24, tzinfo=utc)
+        end = datetime.datetime(2020, 6, 27, 12, tzinfo=utc)
+        today = self.journal.add_task(
+            "Mow lawn", due_time=datetime.datetime(2020, 6, 24, 8, tzinfo=utc)
+        )
+        self.journal.add_task(
+            "Pay rent",
+            due_time=datetime.datetime(2020, 6, 24, 9, tzinfo=utc),
+            completion_time=datetime.datetime(2020, 6, 23, tzinfo=utc),
+        )
+        overdue = self.journal.add_task(
+            "Return books", due_time=datetime.datetime(2020, 5, 1, tzinfo=utc)
+        )
+        last = self.journal.add_task(
+            "Water plants", due_time=datetime.datetime(2020, 6, 27, 6, tzinfo=utc)
+        )
+        self.journal.add_task(
+            "Too late", due_time=datetime.datetime(2020, 6, 27, 12, tzinfo=utc)
+        )
+
+        agenda = self.journal.get_agenda(start, end)
+        self.assertEqual(
+            [None, start] + [start + datetime.timedelta(days=d) for d in range(1, 4)],
+            [bucket.start for bucket in agenda],
+        )
+        self.assertEqual(end, agenda[-1].end)
+        self.assertEqual(
+            [[overdue], [today], [3], [], [last]],
+            [[task.task_id for task in bucket.tasks] for bucket in agenda],
+        )
+        self.assertEqual(
+            [bucket.count for bucket in agenda],
+            [bucket.count for bucket in self.journal.get_agenda_counts(start, end)],
+        )
+
+        weeks = self.journal.get_agenda_counts(
+            start, end, bucket="week", field=AgendaField.START
+        )
+        self.assertEqual([2, 0], [bucket.count for bucket in weeks])
+        with self.assertRaises(ValueError):
+            self.journal.get_agenda(start, end, bucket="fortnight")
+
     def test_search_tasks(self):
         self.assertEqual(
             {3, 5, 8}, {t.task_id for t in self.journal.search_tasks("shed")}
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+import sqlite3
+import time
+import unittest
+
+from handleit.core import ChangeOperation, CoreTaskList, Journal, TaskRelationship
+from handleit.io.sqlite import CASCADING_TABLES, create_new_database
+from handleit.sync import sync_journals
+
+from test.test_query_plans import populate_large_db
+from test.test_sync import journal_state, new_journal
+
+
+class TestDelete(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_large_db(self.temp_db, 5000, n_lists=5, n_tags=10)
+        self.journal = Journal(self.temp_db)
+
+    def count_links(self, task_ids: list) -> int:
+        ids = ",".join(map(str, task_ids))
+        return sum(
+            self.journal._conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE "
+                + (
+                    f"task_from_id IN ({ids}) OR task_to_id IN ({ids})"
+                    if table == "task_relations"
+                    else f"task_id IN ({ids})"
+                )
+            ).fetchone()[0]
+            for table in CASCADING_TABLES
+        )
+
+    def test_foreign_keys(self):
+        conn = self.journal._conn
+        self.assertEqual(1, conn.execute("PRAGMA foreign_keys").fetchone()[0])
+        for table in CASCADING_TABLES:
+            self.assertEqual(
+                {"CASCADE"},
+                {row[6] for row in conn.execute(f"PRAGMA foreign_key_list({table})")},
+            )
+        with self.assertRaises(sqlite3.IntegrityError):
+            with conn:
+                conn.execute("INSERT INTO task_tags (task_id, tag_id) VALUES (1, 999)")
+
+    def test_delete_tasks(self):
+        journal = self.journal
+        before = journal_state(journal)
+        task_ids = list(range(1, 5001, 2))
+        journal.add_task_relationship(2, 1, TaskRelationship.DEPENDENCY)
+        self.assertGreater(self.count_links(task_ids), len(task_ids))
+        changed = []
+        journal.observe_tasks(changed.append)
+
+        self.assertEqual(len(task_ids), journal.delete_tasks(task_ids + [99999]))
+        self.assertEqual(task_ids, sorted(changed))
+        self.assertEqual(0, self.count_links(task_ids))
+        self.assertIsNone(journal.get_task(1))
+        self.assertEqual([], journal.get_task(2).dependencies)
+
+        # one step to undo, reinserting each table's rows at once
+        self.assertTrue(journal.undo())
+        self.assertTrue(journal.undo())
+        self.assertFalse(journal.can_undo)
+        self.assertEqual(before, journal_state(journal))
+
+    def test_cascades_logged(self):
+        journal = self.journal
+        other = new_journal()
+        sync_journals(journal, other)
+        seq = journal.change_seq
+        list_id = journal.lists[0].list_id
+        journal.delete_list(list_id)
+        journal.delete_tag("tag-3")
+        # deleted outside the Journal, the links cascade all the same
+        with journal._conn:
+            journal._conn.execute("DELETE FROM tasks WHERE task_id <= 10")
+
+        changes = list(journal.changes_since(seq))
+        self.assertLessEqual(
+            {"lists", "tags", "tasks", "task_lists", "task_tags", "task_relations"},
+            {change.table for change in changes},
+        )
+        for change in changes:
+            self.assertEqual(ChangeOperation.DELETE, change.operation)
+            self.assertNotIn(None, change.key)
+        self.assertEqual(
+            [], journal._conn.execute("SELECT * FROM deleted_uids").fetchall()
+        )
+        sync_journals(journal, other)
+        self.assertEqual(journal_state(journal), journal_state(other))
+        other.close()
+
+    def test_empty_trash(self):
+        journal = self.journal
+        trashed = journal.get_list_count(CoreTaskList.TRASH)
+        self.assertGreater(trashed, 0)
+        pending = journal.get_list_count(CoreTaskList.PENDING)
+        self.assertEqual(trashed, journal.empty_trash())
+        self.assertEqual(0, journal.get_list_count(CoreTaskList.TRASH))
+        self.assertEqual(pending, journal.get_list_count(CoreTaskList.PENDING))
+        self.assertEqual(0, journal.empty_trash())
+
+    def test_purge_trash(self):
+        journal = self.journal
+        pending = journal.get_list_tasks(CoreTaskList.PENDING)
+        journal.update_task(pending[0].task_id, is_trashed=True)
+        time.sleep(0.01)
+        cutoff = datetime.now(timezone.utc)
+        time.sleep(0.01)
+        journal.update_task(pending[1].task_id, is_trashed=True)
+        trashed = journal.get_list_count(CoreTaskList.TRASH)
+
+        # the fixture's trashed tasks were logged as such when added
+        purged = journal.purge_trash(timedelta(days=1), now=cutoff + timedelta(days=1))
+        self.assertEqual(trashed - 1, purged)
+        self.assertEqual(
+            [pending[1].task_id],
+            [task.task_id for task in journal.get_list_tasks(CoreTaskList.TRASH)],
+        )
+        self.assertEqual(0, journal.purge_trash(timedelta(days=1)))
+
+    def tearDown(self):
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
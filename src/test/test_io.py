@@ -0,0 +1,503 @@
+from datetime import datetime, timedelta, timezone
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from handleit.core import CoreTaskList, Journal
+from handleit.io.csv import export_csv, import_csv
+from handleit.io.ical import export_ical, import_ical
+from handleit.io.jsonl import export_jsonl, import_jsonl
+from handleit.io.sqlite import create_new_database
+from handleit.io.taskwarrior import import_taskwarrior, read_taskwarrior
+from handleit.io.todotxt import import_todotxt
+
+from test.test_core import populate_test_db
+from test.test_query_plans import populate_large_db
+from test.test_startup import benchmark
+
+
+def new_journal() -> Journal:
+    conn = sqlite3.connect(":memory:")
+    create_new_database(conn)
+    return Journal(conn)
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+        self.journal.add_task_attribute(3, "energy", 2)
+        self.journal.add_task_attribute(3, "outside", True)
+        self.journal.add_task_attribute(11, "context", "garage")
+        self.journal.add_notification(
+            3, datetime(2020, 6, 14, 9, 30, tzinfo=timezone.utc)
+        )
+        self.journal.add_view("Home", "tag:@home")
+        self.records = list(self.journal.export_records(chunk_size=4))
+
+    def test_export_records(self):
+        kinds = [record["type"] for record in self.records]
+        # lists, tags, and views before the tasks that refer to them
+        self.assertEqual(sorted(kinds, key=kinds.index), kinds)
+        tasks = {r["id"]: r for r in self.records if r["type"] == "task"}
+        self.assertEqual(set(range(1, 19)), set(tasks))
+        self.assertEqual(
+            {"energy": 2, "outside": True}, tasks[3]["attributes"],
+        )
+        self.assertEqual(["2020-06-14T09:30:00+00:00"], tasks[3]["notifications"])
+        self.assertIn(
+            {"type": "relation", "from": 9, "to": 3, "relationship": "blocked_by"},
+            self.records,
+        )
+
+    def test_round_trips(self):
+        for export, import_ in ((export_jsonl, import_jsonl), (export_csv, import_csv)):
+            with self.subTest(export.__name__):
+                fp = io.StringIO(newline="")
+                self.assertEqual(len(self.records), export(self.journal, fp))
+                fp.seek(0)
+
+                journal = new_journal()
+                counts = import_(journal, fp, chunk_size=3)
+                self.assertEqual(18, counts["task"])
+                self.assertEqual(self.records, list(journal.export_records()))
+                self.assertEqual(
+                    [t.task_id for t in self.journal.get_list_tasks(2)],
+                    [t.task_id for t in journal.get_list_tasks(2)],
+                )
+                journal.close()
+
+    def test_import_into_existing(self):
+        lists_before = len(self.journal.lists)
+        self.journal.import_records(self.records)
+        # lists and tags are merged by name, tasks are added after the others
+        self.assertEqual(lists_before, len(self.journal.lists))
+        self.assertEqual({3, 4, 10, 11, 12, 21, 22, 28, 29, 30}, self._tagged("@home"))
+        copy = self.journal.get_task(21)
+        self.assertEqual(self.journal.get_task(3).description, copy.description)
+        self.assertEqual([18 + 9], copy.dependents)
+        self.assertGreater(copy.position, self.journal.get_task(18).position)
+
+    def _tagged(self, tag):
+        return {
+            row[0]
+            for row in self.temp_db.execute(
+                "SELECT task_id FROM task_tags JOIN tags USING (tag_id) WHERE name = ?",
+                (tag,),
+            )
+        }
+
+    def test_invalid_import_changes_nothing(self):
+        before = list(self.journal.export_records())
+        for bad in (
+            {"type": "task", "id": 0},
+            {"type": "task", "id": 1, "lists": [1000]},
+            {"type": "task", "id": 1, "attributes": {"size": [1, 2]}},
+            {"type": "relation", "from": 1, "to": 2, "relationship": "cousin_of"},
+            {"type": "sticker"},
+        ):
+            with self.assertRaises((ValueError, TypeError), msg=str(bad)):
+                self.journal.import_records(self.records + [bad])
+        self.assertEqual(before, list(self.journal.export_records()))
+
+    def test_invalid_files(self):
+        with self.assertRaisesRegex(ValueError, "Line 2"):
+            import_jsonl(self.journal, io.StringIO('{"type": "tag", "name": "a"}\n{\n'))
+        with self.assertRaises(ValueError):
+            import_csv(self.journal, io.StringIO("name,color\na,b\n"))
+
+    def tearDown(self):
+        self.journal.close()
+
+
+CALENDAR = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//Example//Example//EN\r
+BEGIN:VEVENT\r
+UID:event-1\r
+SUMMARY:Not a to-do\r
+END:VEVENT\r
+BEGIN:VTODO\r
+UID:paint\r
+SUMMARY:Paint the fence\\, twice\r
+DESCRIPTION:White paint\\nfrom the \r
+ shed\r
+PRIORITY:1\r
+DTSTART;TZID=Europe/Berlin:20200620T090000\r
+DUE;VALUE=DATE:20200627\r
+CATEGORIES:@home,outside\\, sunny\r
+RELATED-TO;RELTYPE=DEPENDS-ON:brushes\r
+RELATED-TO;RELTYPE=CHILD:sand\r
+BEGIN:VALARM\r
+ACTION:DISPLAY\r
+TRIGGER:-PT30M\r
+END:VALARM\r
+END:VTODO\r
+BEGIN:VTODO\r
+UID:brushes\r
+SUMMARY:Buy brushes\r
+STATUS:COMPLETED\r
+COMPLETED:20200619T150000Z\r
+END:VTODO\r
+BEGIN:VTODO\r
+UID:sand\r
+SUMMARY:Sand the fence\r
+RELATED-TO:paint\r
+RELATED-TO;RELTYPE=DEPENDS-ON:missing\r
+END:VTODO\r
+BEGIN:VTODO\r
+UID:paint\r
+RECURRENCE-ID:20200701T090000Z\r
+SUMMARY:Paint the fence again\r
+END:VTODO\r
+END:VCALENDAR\r
+"""
+
+
+class TestICalendar(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+        self.journal.add_notification(
+            3, datetime(2020, 6, 14, 9, 30, tzinfo=timezone.utc)
+        )
+
+    def export(self, journal: Journal) -> str:
+        fp = io.StringIO(newline="")
+        export_ical(journal, fp, chunk_size=4)
+        return fp.getvalue()
+
+    def test_round_trip(self):
+        statements = []
+        self.temp_db.set_trace_callback(statements.append)
+        calendar = self.export(self.journal)
+        self.temp_db.set_trace_callback(None)
+        # notifications are read a chunk of tasks at a time
+        self.assertEqual(
+            5, sum("FROM notifications" in statement for statement in statements)
+        )
+        self.assertTrue(
+            all(len(line.encode()) <= 75 for line in calendar.split("\r\n"))
+        )
+        journal = new_journal()
+        counts = import_ical(journal, io.StringIO(calendar, newline=""))
+        self.assertEqual(18, counts["task"])
+
+        for original, copy in zip(self.journal.iter_tasks(), journal.iter_tasks()):
+            for attr in (
+                "description",
+                "notes",
+                "priority",
+                "completion_time",
+                "due_time",
+                "start_time",
+                "is_trashed",
+                "tags",
+                "parent",
+                "dependencies",
+            ):
+                self.assertEqual(getattr(original, attr), getattr(copy, attr), msg=attr)
+            self.assertEqual(
+                [l.name for l in self.journal.get_lists(original.lists)],
+                [l.name for l in journal.get_lists(copy.lists)],
+            )
+        self.assertEqual(
+            [datetime(2020, 6, 14, 9, 30, tzinfo=timezone.utc)],
+            journal.get_notifications(3),
+        )
+
+        # UIDs are kept, so a second export only differs in its time stamps
+        def without_stamps(text):
+            return [l for l in text.split("\r\n") if not l.startswith("DTSTAMP")]
+
+        self.assertEqual(without_stamps(calendar), without_stamps(self.export(journal)))
+        journal.close()
+
+    def test_import(self):
+        journal = new_journal()
+        counts = import_ical(journal, io.StringIO(CALENDAR, newline=""))
+        self.assertEqual(3, counts["task"])
+        paint, brushes, sand = journal.get_tasks([1, 2, 3])
+
+        self.assertEqual("Paint the fence, twice", paint.description)
+        self.assertEqual("White paint\nfrom the shed", paint.notes)
+        self.assertEqual(5, paint.priority)
+        self.assertEqual({"@home", "outside, sunny"}, paint.tags)
+        self.assertEqual(datetime(2020, 6, 27), paint.due_time)
+        # dates are local, and times in other zones are converted
+        start = datetime(2020, 6, 20, 7, tzinfo=timezone.utc)
+        self.assertEqual(start, paint.start_time)
+        self.assertEqual(
+            [start - timedelta(minutes=30)], journal.get_notifications(1),
+        )
+        self.assertEqual({"ical_uid": "paint"}, paint.attributes)
+
+        self.assertEqual(
+            datetime(2020, 6, 19, 15, tzinfo=timezone.utc), brushes.completion_time
+        )
+        self.assertEqual([2], paint.dependencies)
+        self.assertEqual([3], paint.subtasks)
+        # relations to unknown to-dos are dropped
+        self.assertEqual(1, sand.parent)
+        self.assertEqual([], sand.dependencies)
+        journal.close()
+
+    def test_invalid_calendars(self):
+        before = list(self.journal.export_records())
+        for calendar in (
+            "BEGIN:VTODO\nUID:a\nEND:VTODO\nBEGIN:VTODO\nUID:a\nEND:VTODO\n",
+            "BEGIN:VTODO\nDUE:tomorrow\nEND:VTODO\n",
+            "BEGIN:VTODO\nSUMMARY\nEND:VTODO\n",
+        ):
+            with self.assertRaises(ValueError, msg=calendar):
+                import_ical(self.journal, io.StringIO(calendar))
+        self.assertEqual(before, list(self.journal.export_records()))
+
+    def tearDown(self):
+        self.journal.close()
+
+
+TODO_TXT = """(A) Call Mom @phone +Family due:2020-06-10
+x 2020-06-03 2020-06-01 Measure yard +Shed @home pri:B
+
+2020-06-02 Buy lumber +Shed @errands t:2020-06-08 estimate:2h https://example.com/wood
+(F) Someday learn Spanish
+"""
+
+TASKWARRIOR_LINES = [
+    {
+        "id": 1,
+        "uuid": "a0000000-0000-0000-0000-000000000001",
+        "description": "Paint the fence",
+        "status": "pending",
+        "entry": "20200601T080000Z",
+        "modified": "20200601T080000Z",
+        "due": "20200627T000000Z",
+        "wait": "20200620T000000Z",
+        "project": "Home.Garden",
+        "tags": ["outside"],
+        "priority": "H",
+        "depends": "a0000000-0000-0000-0000-000000000002,a0000000-0000-0000-0000-000000000009",
+        "annotations": [{"entry": "20200602T080000Z", "description": "white paint"}],
+        "estimate": 3,
+        "urgency": 9.1,
+    },
+    {
+        "id": 0,
+        "uuid": "a0000000-0000-0000-0000-000000000002",
+        "description": "Buy brushes",
+        "status": "completed",
+        "entry": "20200601T080000Z",
+        "end": "20200619T150000Z",
+        "project": "Home.Garden",
+    },
+    {
+        "id": 0,
+        "uuid": "a0000000-0000-0000-0000-000000000003",
+        "description": "Old idea",
+        "status": "deleted",
+        "entry": "20200601T080000Z",
+        "end": "20200602T080000Z",
+        "depends": ["a0000000-0000-0000-0000-000000000001"],
+    },
+    {
+        "uuid": "a0000000-0000-0000-0000-000000000004",
+        "description": "Water plants",
+        "status": "recurring",
+        "entry": "20200601T080000Z",
+        "recur": "daily",
+    },
+]
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.journal = new_journal()
+
+    def test_todotxt(self):
+        counts = import_todotxt(self.journal, io.StringIO(TODO_TXT))
+        self.assertEqual({"list": 2, "task": 4}, {k: v for k, v in counts.items() if v})
+        call, measure, lumber, spanish = self.journal.get_tasks([1, 2, 3, 4])
+
+        self.assertEqual("Call Mom", call.description)
+        self.assertEqual(3, call.priority)
+        self.assertEqual({"@phone"}, call.tags)
+        self.assertEqual(datetime(2020, 6, 10), call.due_time)
+        self.assertEqual(datetime(2020, 6, 3), measure.completion_time)
+        self.assertEqual(datetime(2020, 6, 1), measure.creation_time)
+        self.assertEqual(2, measure.priority)
+        self.assertEqual(
+            "Buy lumber https://example.com/wood", lumber.description,
+        )
+        self.assertEqual(datetime(2020, 6, 8), lumber.start_time)
+        self.assertEqual({"estimate": "2h"}, lumber.attributes)
+        self.assertEqual(-1, spanish.priority)
+        self.assertEqual(
+            ["Family", "Shed"], [task_list.name for task_list in self.journal.lists]
+        )
+        self.assertEqual(measure.lists, lumber.lists)
+
+        # tasks completed at no given date are completed now, in local time too
+        before = datetime.now()
+        import_todotxt(self.journal, io.StringIO("x Sweep the porch\n"))
+        completion_time = self.journal.get_tasks([5])[0].completion_time
+        self.assertIsNone(completion_time.tzinfo)
+        self.assertLessEqual(before, completion_time)
+
+        with self.assertRaisesRegex(ValueError, "Line 2"):
+            import_todotxt(self.journal, io.StringIO("Fine\nBad due:2020-13-01\n"))
+
+    def test_indexes_rebuilt(self):
+        def indexes():
+            return self.journal._conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name"
+            ).fetchall()
+
+        statements = []
+        self.journal._conn.set_trace_callback(statements.append)
+
+        def rebuilt() -> bool:
+            dropped = any(s.startswith("DROP INDEX") for s in statements)
+            created = any(s.startswith("CREATE INDEX") for s in statements)
+            statements.clear()
+            return dropped and created
+
+        before = indexes()
+        # imports into an empty journal drop its indexes and insert triggers
+        # until they're done
+        with self.assertRaises(ValueError):
+            import_todotxt(self.journal, io.StringIO("Fine\nBad due:tomorrow\n"))
+        self.assertEqual(before, indexes())
+        self.assertEqual(0, self.journal.get_list_count(CoreTaskList.PENDING))
+        statements.clear()
+        import_todotxt(self.journal, io.StringIO(TODO_TXT))
+        self.assertTrue(rebuilt())
+        self.assertEqual(before, indexes())
+        # but not into one with tasks
+        import_todotxt(self.journal, io.StringIO(TODO_TXT))
+        self.assertFalse(rebuilt())
+        self.assertEqual(before, indexes())
+        self.journal._conn.set_trace_callback(None)
+
+    def test_taskwarrior(self):
+        array = json.dumps(TASKWARRIOR_LINES, indent=2)
+        # older versions write one task per line without an enclosing array
+        lines = "\n".join(json.dumps(task) for task in TASKWARRIOR_LINES)
+        for export in (array, lines):
+            journal = new_journal()
+            counts = import_taskwarrior(journal, io.StringIO(export))
+            self.assertEqual(3, counts["task"])
+            paint, brushes, old = journal.iter_tasks()
+
+            self.assertEqual("white paint", paint.notes)
+            self.assertEqual(3, paint.priority)
+            self.assertEqual(
+                datetime(2020, 6, 20, tzinfo=timezone.utc), paint.start_time
+            )
+            self.assertEqual(["Home.Garden"], [l.name for l in journal.lists])
+            self.assertEqual({"outside"}, paint.tags)
+            self.assertEqual(
+                {
+                    "estimate": 3,
+                    "taskwarrior_uuid": "a0000000-0000-0000-0000-000000000001",
+                },
+                paint.attributes,
+            )
+            # dependencies on tasks missing from the export are dropped
+            self.assertEqual([brushes.task_id], paint.dependencies)
+            self.assertEqual([paint.task_id], old.dependencies)
+            self.assertEqual(
+                datetime(2020, 6, 19, 15, tzinfo=timezone.utc), brushes.completion_time
+            )
+            self.assertTrue(old.is_trashed)
+            self.assertIsNone(old.completion_time)
+            journal.close()
+
+    def test_taskwarrior_streams(self):
+        export = json.dumps(
+            [
+                dict(task, uuid=f"{task['uuid']}-{copy}", depends=[])
+                for copy in range(50)
+                for task in TASKWARRIOR_LINES
+            ]
+        )
+        tasks = [
+            record
+            for record in read_taskwarrior(io.StringIO(export), buffer_size=7)
+            if record["type"] == "task"
+        ]
+        self.assertEqual(150, len(tasks))
+        with self.assertRaises(ValueError):
+            list(read_taskwarrior(io.StringIO(export[:-30]), buffer_size=7))
+
+    def tearDown(self):
+        self.journal.close()
+
+
+# how many tasks the benchmarks export and import
+BENCHMARK_TASKS = int(os.environ.get("HANDLEIT_BENCHMARK_TASKS", "100000"))
+
+# time budget for exporting or importing a task, in microseconds
+RECORD_BUDGET_US = 500
+
+
+@benchmark
+class BenchmarkRecords(unittest.TestCase):
+    def test_round_trip(self):
+        n_tasks = BENCHMARK_TASKS
+        conn = sqlite3.connect(":memory:")
+        create_new_database(conn)
+        populate_large_db(conn, n_tasks, n_lists=50, n_tags=200)
+        journal = Journal(conn)
+
+        for export, import_ in (
+            (export_jsonl, import_jsonl),
+            (export_csv, import_csv),
+            (export_ical, import_ical),
+        ):
+            with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as fp:
+                start = time.perf_counter()
+                export(journal, fp)
+                exported = time.perf_counter()
+                fp.seek(0)
+                copy = new_journal()
+                counts = import_(copy, fp)
+                imported = time.perf_counter()
+            self.assertEqual(n_tasks, counts["task"])
+            report = f"{export.__name__}: {exported - start:.1f}s, {import_.__name__}: {imported - exported:.1f}s for {n_tasks} tasks"
+            for seconds in (exported - start, imported - exported):
+                self.assertLess(seconds / n_tasks, RECORD_BUDGET_US / 1e6, msg=report)
+            copy.close()
+        journal.close()
+
+    def test_todotxt(self):
+        n_tasks = BENCHMARK_TASKS
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as fp:
+            for i in range(n_tasks):
+                fp.write(
+                    f"(B) 2020-06-01 Task {i} +project-{i % 50} @context-{i % 200} due:2020-07-{i % 28 + 1:02}\n"
+                )
+            fp.seek(0)
+            journal = new_journal()
+            start = time.perf_counter()
+            counts = import_todotxt(journal, fp)
+            seconds = time.perf_counter() - start
+            self.assertEqual(n_tasks, counts["task"])
+            self.assertLess(
+                seconds / n_tasks,
+                RECORD_BUDGET_US / 1e6,
+                msg=f"import_todotxt: {seconds:.1f}s for {n_tasks} lines",
+            )
+            journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import sqlite3
+import unittest
+
+from handleit.core import Journal
+from handleit.io.sqlite import create_new_database
+
+from test.test_query_plans import RecordingConnection, populate_large_db
+
+
+class TestGapOrdering(unittest.TestCase):
+    n_tasks = 10000
+    n_moves = 10000
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", factory=RecordingConnection)
+        create_new_database(self.conn)
+        populate_large_db(self.conn, self.n_tasks, n_lists=5, n_tags=5)
+        self.journal = Journal(self.conn)
+
+    def test_random_moves(self):
+        rng = random.Random(0)
+        order = list(range(1, self.n_tasks + 1))
+        self.conn.statements.clear()
+
+        for _ in range(self.n_moves):
+            task_id, anchor_id = rng.sample(order, 2)
+            order.remove(task_id)
+            if rng.random() < 0.5:
+                self.journal.move_task(task_id, before=anchor_id)
+                order.insert(order.index(anchor_id), task_id)
+            else:
+                self.journal.move_task(task_id, after=anchor_id)
+                order.insert(order.index(anchor_id) + 1, task_id)
+
+        self.assertEqual(
+            order,
+            [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT task_id FROM tasks ORDER BY position"
+                )
+            ],
+        )
+
+        updates = [
+            sql for sql, _ in self.conn.statements if sql.startswith("UPDATE tasks")
+        ]
+        rebalances = sum(1 for sql in updates if "- position" in sql)
+        # the fixture starts out densely packed, so the first move rebalances
+        self.assertGreaterEqual(rebalances, 1)
+        self.assertLessEqual(rebalances, 5)
+        # otherwise each move is a single UPDATE of the moved task
+        self.assertLessEqual(len(updates) - rebalances, self.n_moves)
+
+    def tearDown(self):
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+import os
+import sqlite3
+import time
+import unittest
+from unittest import mock
+
+from handleit.core import Journal
+from handleit.io.sqlite import create_new_database, datetime_to_epoch
+from handleit.query import FilterError, compile_filter
+
+from test.test_core import populate_test_db
+
+
+NOW = datetime(2020, 6, 20, 12, tzinfo=timezone.utc)
+
+
+class TestFilters(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+
+    def filter_ids(self, query: str):
+        return {task.task_id for task in self.journal.get_filter_tasks(query, NOW)}
+
+    def test_tags_and_lists(self):
+        self.assertEqual({3, 11, 12}, self.filter_ids("tag:@home"))
+        self.assertEqual({3}, self.filter_ids('tag:"home remodel 2020"'))
+        self.assertEqual({1, 2}, self.filter_ids("list:Next"))
+        self.assertEqual({2}, self.filter_ids("list:Next -tag:@phone"))
+
+    def test_times(self):
+        self.assertEqual({3}, self.filter_ids("due<7d"))
+        self.assertEqual(set(), self.filter_ids("due<today"))
+        self.assertEqual({3}, self.filter_ids("start<2020-06-12"))
+        # negated comparisons keep tasks without that time
+        self.assertNotIn(3, self.filter_ids("-due<7d"))
+        self.assertIn(2, self.filter_ids("-due<7d"))
+
+    def test_time_zones(self):
+        # an hour into the 20th ten hours east of UTC, still the 19th in UTC
+        east = datetime(2020, 6, 20, 1, tzinfo=timezone(timedelta(hours=10)))
+        midnight = datetime_to_epoch(datetime(2020, 6, 19, 14, tzinfo=timezone.utc))
+        for query in ("due<today", "due<2020-06-20", "due<2020-06-20T00:00"):
+            self.assertIn(midnight, compile_filter(query, east)[1], msg=query)
+        self.assertIn(
+            midnight + 86400 * 10 ** 6, compile_filter("due<tomorrow", east)[1]
+        )
+
+        # without a time given, days start at local midnight
+        try:
+            with mock.patch.dict(os.environ, {"TZ": "Etc/GMT-10"}):
+                time.tzset()
+                today = (
+                    datetime.now()
+                    .astimezone()
+                    .replace(hour=0, minute=0, second=0, microsecond=0)
+                )
+                self.assertEqual(timedelta(hours=10), today.utcoffset())
+                self.assertIn(datetime_to_epoch(today), compile_filter("due<today")[1])
+        finally:
+            time.tzset()
+
+    def test_priority_and_keywords(self):
+        self.assertEqual({1, 2, 11}, self.filter_ids("priority>=1"))
+        self.assertEqual({1}, self.filter_ids("priority=5"))
+        self.assertEqual({9, 14}, self.filter_ids("blocked"))
+        self.assertNotIn(9, self.filter_ids("priority<=0 -blocked"))
+        self.assertEqual({5, 6, 7, 8, 13, 14}, self.filter_ids("subtask"))
+
+    def test_status_and_text(self):
+        self.assertEqual({4}, self.filter_ids("is:completed"))
+        self.assertEqual({10}, self.filter_ids("is:trashed"))
+        self.assertEqual({3, 5, 8}, self.filter_ids("shed"))
+        self.assertEqual({2}, self.filter_ids("text:flour"))
+        self.assertEqual(set(), self.filter_ids("100%"))
+
+    def test_invalid_filters(self):
+        for query in (
+            "priority>high",
+            "due=7d",
+            "due<someday",
+            "colour:red",
+            "is:done",
+            'tag:"open',
+        ):
+            with self.assertRaises(FilterError, msg=query):
+                compile_filter(query, NOW)
+
+    def test_saved_views(self):
+        view_id = self.journal.add_view("Home", "tag:@home priority>=0")
+        other_id = self.journal.add_view("Next", "list:Next")
+        self.assertEqual(["Home", "Next"], [v.name for v in self.journal.views])
+        self.assertEqual(
+            {11}, {t.task_id for t in self.journal.get_view_tasks(view_id, NOW)}
+        )
+        self.assertEqual(
+            {view_id: 1, other_id: 2},
+            self.journal.get_view_count([view_id, other_id, 1000], NOW),
+        )
+
+        self.journal.update_view(view_id, new_query="tag:@home")
+        self.assertEqual(3, self.journal.get_view_count([view_id], NOW)[view_id])
+        with self.assertRaises(FilterError):
+            self.journal.update_view(view_id, new_query="due=today")
+        with self.assertRaises(FilterError):
+            self.journal.add_view("Broken", "priority>")
+
+        self.journal.delete_view(view_id)
+        self.assertIsNone(self.journal.get_view(view_id))
+
+    def tearDown(self):
+        self.journal.close()
+        self.temp_db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
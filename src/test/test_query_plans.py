@@ -0,0 +1,252 @@
+from datetime import datetime, timedelta, timezone
+import random
+import re
+import sqlite3
+from typing import List, Tuple
+import unittest
+
+from handleit.core import (
+    AgendaField,
+    CoreTaskList,
+    Journal,
+    SortSpec,
+    TaskRelationship,
+    TaskSort,
+)
+from handleit.io.sqlite import create_new_database
+
+
+# tables that must never be scanned in full on a hot path
+WATCHED_TABLES = (
+    "tasks",
+    "task_relations",
+    "task_lists",
+    "task_tags",
+    "task_attributes",
+)
+
+# statements that are allowed to scan, with the reason why
+SCAN_ALLOWED = (
+    # substring search has no index to use until full-text search exists
+    re.compile(r"LIKE \?"),
+)
+
+SCAN_PATTERN = re.compile(
+    r"^SCAN (?:TABLE )?(?P<table>\w+)(?: USING (?:COVERING )?INDEX (?P<index>\w+))?"
+)
+
+
+class RecordingConnection(sqlite3.Connection):
+    """ A connection that remembers every statement executed through it """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: List[Tuple[str, tuple]] = []
+
+    def execute(self, sql, parameters=()):
+        self.statements.append((sql, tuple(parameters)))
+        return super().execute(sql, parameters)
+
+
+class TestQueryPlans(unittest.TestCase):
+    n_tasks = 5000
+    n_lists = 20
+    n_tags = 50
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", factory=RecordingConnection)
+        create_new_database(self.conn)
+        populate_large_db(self.conn, self.n_tasks, self.n_lists, self.n_tags)
+        self.journal = Journal(self.conn)
+        self.partial_indexes = {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'"
+            )
+        }
+        self.conn.statements.clear()
+
+    def _exercise_journal(self):
+        journal = self.journal
+        for core_list in CoreTaskList:
+            journal.get_list_tasks(core_list)
+            journal.get_list_count(core_list)
+        journal.get_list_tasks(3)
+        journal.get_list_tasks(3, SortSpec(TaskSort.DUE), limit=10)
+        journal.get_list_tasks(
+            CoreTaskList.PENDING, SortSpec(TaskSort.PRIORITY, True), 50, 100
+        )
+        journal.get_list_count(3)
+        journal.get_list_count(list(range(1, self.n_lists + 1)))
+        journal.lists
+        journal.get_list(2)
+        journal.get_lists([1, 2])
+        journal.get_task(42)
+        journal.get_tasks([1, 2, 3])
+        journal.search_tasks("task 12")
+        journal.get_tasks_by_tags(all_of=["tag-1", "tag-2"], none_of=["tag-3"])
+        journal.get_tasks_by_tags(any_of=["tag-4", "tag-5"], list_id=2)
+        journal.get_tag_counts()
+        journal.get_tag_counts(2)
+        journal.get_filter_tasks("tag:tag-3 due<30d priority>=2 list:List -blocked")
+        journal.get_filter_count(["is:completed completed>2020-03-01", "subtask"])
+        journal.get_agenda(
+            datetime(2020, 6, 1, tzinfo=timezone.utc),
+            datetime(2020, 6, 8, tzinfo=timezone.utc),
+        )
+        journal.get_agenda_counts(
+            datetime(2020, 6, 1, tzinfo=timezone.utc),
+            datetime(2020, 9, 1, tzinfo=timezone.utc),
+            bucket="week",
+            field=AgendaField.START,
+        )
+
+        task_id = journal.add_task("Plan me")
+        journal.update_task(task_id, new_description="Planned", new_due_time=None)
+        journal.add_task_to_list(task_id, 1)
+        journal.delete_task_from_list(task_id, 1)
+        journal.add_task_tag(task_id, "tag-1")
+        journal.delete_task_tag(task_id, "tag-1")
+        journal.add_task_attribute(task_id, "energy", 2)
+        journal.update_task_attribute(task_id, "energy", 3)
+        journal.delete_task_attribute(task_id, "energy")
+        journal.find_tasks_by_attribute("energy", ">=", 2)
+        journal.find_tasks_by_attribute("context", "=", "home")
+        journal.add_task_relationship(1, task_id, TaskRelationship.DEPENDENCY)
+        journal.get_task_relationships(1, task_id)
+        journal.update_task_relationship(1, task_id, TaskRelationship.PARENT)
+        journal.delete_task_relationship(1, task_id, TaskRelationship.PARENT)
+        journal.swap_task_positions(1, 2)
+        journal.add_notification(task_id, datetime(2020, 7, 1, tzinfo=timezone.utc))
+        journal.get_notifications(task_id)
+        journal.get_reminders(datetime(2020, 6, 1, tzinfo=timezone.utc))
+        journal.get_reminders(datetime(2020, 6, 1, tzinfo=timezone.utc), [task_id])
+        journal.delete_task(task_id)
+
+        list_id = journal.add_list("Planned")
+        journal.update_list(list_id, new_name="Still planned")
+        journal.swap_list_positions(1, list_id)
+        journal.delete_list(list_id)
+
+    def test_no_full_scans(self):
+        self._exercise_journal()
+        self.assertTrue(self.conn.statements)
+
+        offenders = []
+        for sql, params in set(self.conn.statements):
+            if any(allowed.search(sql) for allowed in SCAN_ALLOWED):
+                continue
+            for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                match = SCAN_PATTERN.match(row["detail"])
+                if match is None or match.group("table") not in WATCHED_TABLES:
+                    continue
+                if match.group("index") not in self.partial_indexes:
+                    offenders.append(f"{row['detail']}: {sql}")
+
+        self.assertEqual([], offenders)
+
+    def _plan(self, list_id, sort: SortSpec) -> List[str]:
+        self.conn.statements.clear()
+        self.journal.get_list_tasks(list_id, sort, limit=50)
+        sql, params = self.conn.statements[0]
+        return [
+            row["detail"]
+            for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+
+    def test_sorted_pages_use_indexes(self):
+        # pending tasks have no completion time to sort by
+        sorted_lists = [
+            (CoreTaskList.PENDING, key) for key in TaskSort if key != TaskSort.COMPLETED
+        ] + [(CoreTaskList.COMPLETED, TaskSort.COMPLETED)]
+        for list_id, key in sorted_lists:
+            for descending in (False, True):
+                self.assertNotIn(
+                    "USE TEMP B-TREE FOR ORDER BY",
+                    self._plan(list_id, SortSpec(key, descending)),
+                    msg=f"{list_id} by {key}",
+                )
+
+    def test_pending_excludes_subtasks_once(self):
+        pending = self.journal.get_list_tasks(CoreTaskList.PENDING)
+        pending_ids = [task.task_id for task in pending]
+        # no duplicated rows from tasks with several relationships
+        self.assertEqual(len(pending_ids), len(set(pending_ids)))
+        self.assertTrue(all(task.parent is None for task in pending))
+
+    def tearDown(self):
+        self.journal.close()
+
+
+def populate_large_db(
+    conn: sqlite3.Connection, n_tasks: int, n_lists: int, n_tags: int, seed: int = 0
+) -> None:
+    """ Fill an empty journal with a reproducible, randomly-shaped set of tasks """
+    rng = random.Random(seed)
+    epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    def timestamp(days: float) -> str:
+        return (epoch + timedelta(days=days)).isoformat()
+
+    tasks = []
+    for task_id in range(1, n_tasks + 1):
+        roll = rng.random()
+        tasks.append(
+            (
+                task_id,
+                task_id,
+                f"Task {task_id}",
+                None,
+                rng.randint(-1, 5),
+                timestamp(task_id / 100),
+                timestamp(task_id / 100 + 1) if roll < 0.4 else None,
+                timestamp(rng.uniform(0, 365)) if rng.random() < 0.3 else None,
+                timestamp(rng.uniform(0, 365)) if rng.random() < 0.2 else None,
+                roll > 0.95,
+            )
+        )
+
+    relations = set()
+    for task_id in range(2, n_tasks + 1):
+        if rng.random() < 0.2:
+            relations.add((rng.randint(1, task_id - 1), task_id, "parent_of"))
+        if rng.random() < 0.1:
+            relations.add((task_id, rng.randint(1, task_id - 1), "blocked_by"))
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO lists (list_id, name, icon, position) VALUES (?, ?, NULL, ?)",
+            [(l, f"List {l}", l) for l in range(1, n_lists + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO tags (tag_id, name, color) VALUES (?, ?, NULL)",
+            [(t, f"tag-{t}") for t in range(1, n_tags + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO tasks (task_id, position, description, notes, priority, creation_dtm, completion_dtm, due_dtm, start_dtm, is_trashed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            tasks,
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO task_lists (list_id, task_id) VALUES (?, ?)",
+            [
+                (rng.randint(1, n_lists), task_id)
+                for task_id in range(1, n_tasks + 1)
+                if rng.random() < 0.7
+            ],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO task_tags (task_id, tag_id) VALUES (?, ?)",
+            [
+                (task_id, rng.randint(1, n_tags))
+                for task_id in range(1, n_tasks + 1)
+                for _ in range(rng.randint(0, 3))
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO task_relations (task_from_id, task_to_id, relationship) VALUES (?, ?, ?)",
+            sorted(relations),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
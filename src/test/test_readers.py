@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import os
+import shutil
+from pathlib import Path
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from handleit.core import CoreTaskList, Journal
+from handleit.io.sqlite import create_new_database
+
+from test.test_query_plans import populate_large_db
+from test.test_startup import benchmark
+
+
+class TestConcurrentReads(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.class_dir = tempfile.TemporaryDirectory()
+        cls.template = Path(cls.class_dir.name) / "template.db"
+        create_new_database(str(cls.template))
+        conn = sqlite3.connect(str(cls.template))
+        populate_large_db(conn, 20000, n_lists=20, n_tags=50)
+        conn.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.class_dir.cleanup()
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.temp_dir.name) / "journal.db"
+        shutil.copyfile(self.template, self.db_path)
+        self.journal = Journal(self.db_path, concurrent_reads=True)
+        self.pool = ThreadPoolExecutor(max_workers=4)
+
+    def in_thread(self, f, *args):
+        return self.pool.submit(f, *args).result()
+
+    def test_snapshots(self):
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+        self.assertEqual(
+            pending, self.in_thread(self.journal.get_list_count, CoreTaskList.PENDING)
+        )
+        with self.journal.transaction():
+            task_id = self.journal.add_task("Paint shed")
+            # readers only see what's committed, and aren't held up meanwhile
+            self.assertEqual(
+                pending + 1, self.journal.get_list_count(CoreTaskList.PENDING)
+            )
+            self.assertIsNone(self.in_thread(self.journal.get_task, task_id))
+        self.assertEqual(
+            "Paint shed", self.in_thread(self.journal.get_task, task_id).description
+        )
+        # writing is left to the journal's thread
+        with self.assertRaises(sqlite3.OperationalError):
+            self.in_thread(self.journal.add_task, "Elsewhere")
+
+    def test_archive(self):
+        self.in_thread(self.journal.search_tasks, "Task")
+        self.journal.archive_tasks(timedelta(days=0))
+        archived = self.journal.search_tasks("Task 1", include_archived=True)
+        self.assertGreater(
+            len(archived), len(self.in_thread(self.journal.search_tasks, "Task 1"))
+        )
+        self.assertEqual(
+            [task.task_id for task in archived],
+            [
+                task.task_id
+                for task in self.in_thread(
+                    lambda: self.journal.search_tasks("Task 1", include_archived=True)
+                )
+            ],
+        )
+
+    def read(self, i: int):
+        """ A mix of the reads the window makes, varying with i """
+        lists = [task_list.list_id for task_list in self.journal.lists]
+        return (
+            self.journal.get_list_count(lists),
+            len(self.journal.search_tasks(f"Task {i % 10}")),
+            len(self.journal.get_list_tasks(lists[i % len(lists)], limit=200)),
+        )
+
+    def test_reader_threads(self):
+        expected = [self.read(i) for i in range(40)]
+        for n_threads in (1, 2, 4):
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                self.assertEqual(expected, list(pool.map(self.read, range(40))))
+
+    @benchmark
+    def test_read_scaling(self):
+        rates = {}
+        for n_threads in (1, 2, 4):
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                # connect every thread before timing
+                list(pool.map(self.read, range(n_threads)))
+                start = time.perf_counter()
+                list(pool.map(self.read, range(80)))
+                rates[n_threads] = 80 / (time.perf_counter() - start)
+
+        report = (
+            f"Read {', '.join(f'{rate:.0f}' for rate in rates.values())} times/s "
+            f"from 1, 2 and 4 threads on {os.cpu_count()} CPUs"
+        )
+        # readers don't wait on each other, so they go as far as the CPUs do
+        for n_threads, rate in rates.items():
+            speedup = min(n_threads, os.cpu_count() or 1)
+            self.assertGreater(rate, rates[1] * speedup * 0.5, msg=report)
+
+    def test_in_memory(self):
+        conn = sqlite3.connect(":memory:")
+        create_new_database(conn)
+        with self.assertRaises(ValueError):
+            Journal(conn, concurrent_reads=True)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+import unittest
+
+from handleit.core import Journal, ReminderKind
+from handleit.io.sqlite import create_new_database
+from handleit.scheduler import NotificationScheduler, Timer
+
+from test.test_core import populate_test_db
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+class FakeTimer(Timer):
+    """ Records arming instead of waiting, and fires when the test says so """
+
+    def __init__(self, clock: FakeClock):
+        self._clock = clock
+        self.deadline: Optional[datetime] = None
+        self.times_armed = 0
+        self._callback: Optional[Callable[[], None]] = None
+
+    def arm(self, delay: float, callback: Callable[[], None]) -> None:
+        self.deadline = self._clock.now + timedelta(seconds=delay)
+        self._callback = callback
+        self.times_armed += 1
+
+    def cancel(self) -> None:
+        self.deadline = None
+        self._callback = None
+
+    def advance(self, delta: timedelta) -> None:
+        """ Move the clock forward, firing the timer as often as it comes due """
+        end = self._clock.now + delta
+        while (self.deadline is not None) and (self.deadline <= end):
+            self._clock.now = self.deadline
+            callback = self._callback
+            self.cancel()
+            callback()
+        self._clock.now = end
+
+
+class TestNotificationScheduler(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+
+        self.clock = FakeClock(datetime(2020, 6, 20, tzinfo=timezone.utc))
+        self.timer = FakeTimer(self.clock)
+        self.fired: List[Tuple[int, ReminderKind]] = []
+        self.scheduler = NotificationScheduler(
+            self.journal,
+            self.timer,
+            lambda task_id, kind: self.fired.append((task_id, kind)),
+            clock=self.clock,
+        )
+
+    def test_fires_due_time(self):
+        self.scheduler.start()
+        # task 3 is due 2020-06-25T17:00:00-04:00
+        self.assertEqual(
+            datetime(2020, 6, 25, 21, tzinfo=timezone.utc), self.scheduler.next_deadline
+        )
+        # long waits are split so they fit a timer interval
+        self.assertEqual(self.clock.now + timedelta(days=1), self.timer.deadline)
+        self.timer.advance(timedelta(days=4))
+        self.assertEqual([], self.fired)
+        self.timer.advance(timedelta(days=2))
+        self.assertEqual([(3, ReminderKind.DUE)], self.fired)
+        self.assertIsNone(self.timer.deadline)
+
+    def test_journal_changes_update_schedule(self):
+        self.scheduler.start()
+        reminder = self.clock.now + timedelta(hours=1)
+        self.journal.add_notification(1, reminder)
+        self.assertEqual(reminder, self.timer.deadline)
+
+        # completing the due task drops its reminder without firing it
+        self.journal.update_task(3, new_completion_time=self.clock.now)
+        self.journal.delete_notification(1, reminder)
+        self.assertIsNone(self.timer.deadline)
+
+        new_task = self.journal.add_task("Remind me")
+        self.journal.update_task(new_task, new_due_time=reminder)
+        self.timer.advance(timedelta(hours=2))
+        self.assertEqual([(new_task, ReminderKind.DUE)], self.fired)
+
+    def test_stop(self):
+        self.scheduler.start()
+        self.scheduler.stop()
+        self.assertIsNone(self.timer.deadline)
+        self.journal.add_notification(1, self.clock.now + timedelta(minutes=5))
+        self.assertIsNone(self.timer.deadline)
+
+    def test_many_reminders_arm_one_timer(self):
+        n_reminders = 100000
+        start = self.clock.now
+        with self.temp_db:
+            self.temp_db.executemany(
+                "INSERT INTO notifications (task_id, dtm) VALUES (?, ?)",
+                (
+                    (1, (start + timedelta(minutes=i + 1)).isoformat())
+                    for i in range(n_reminders)
+                ),
+            )
+        self.scheduler.start()
+        self.assertEqual(n_reminders + 1, len(self.scheduler))
+        # idle cost is one armed timer, however many reminders are waiting
+        self.assertEqual(1, self.timer.times_armed)
+
+        self.timer.advance(timedelta(minutes=10))
+        self.assertEqual(10, len(self.fired))
+        self.timer.advance(timedelta(days=2))
+        self.assertEqual(2 * 24 * 60 + 10, len(self.fired))
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+
+from handleit.core import Journal
+from handleit.io.sqlite import create_new_database, latest_schema_version
+from handleit.search import search_journal, search_journals
+
+from test.test_query_plans import populate_large_db
+
+
+class TestSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        directory = Path(cls.temp_dir.name)
+        cls.paths = []
+        for year in range(2017, 2021):
+            path = directory / f"journal-{year}.db"
+            create_new_database(str(path))
+            conn = sqlite3.connect(str(path))
+            populate_large_db(
+                conn, 5000 * (year - 2016), n_lists=5, n_tags=10, seed=year
+            )
+            conn.close()
+            cls.paths.append(path)
+        journal = Journal(cls.paths[0])
+        cls.notes_task_id = journal.add_task("Bake bread", notes="Task 12 is flour")
+        journal.close()
+
+    def test_ranking(self):
+        hits = search_journal(self.paths[0], "task 12", limit=10000)
+        self.assertEqual(sorted(hits, key=lambda hit: hit.key), hits)
+        self.assertEqual([False, False], [hit.task.is_trashed for hit in hits[:2]])
+        self.assertTrue(hits[-1].task.is_trashed)
+        # matching notes only ranks below every live description match
+        notes_hit = next(hit for hit in hits if hit.task.task_id == self.notes_task_id)
+        self.assertTrue(
+            all(
+                hit.task.is_trashed
+                for hit in hits[hits.index(notes_hit) + 1 :]
+                if "12" in hit.task.description
+            )
+        )
+
+    def test_progressive(self):
+        limit = 100
+        # a journal gone missing is skipped
+        paths = (
+            self.paths[:2] + [self.paths[0].with_name("missing.db")] + self.paths[2:]
+        )
+        sequential = sorted(
+            (
+                hit
+                for shard, path in enumerate(paths)
+                if path.exists()
+                for hit in search_journal(path, "Task 1", limit, shard)
+            ),
+            key=lambda hit: hit.key,
+        )[:limit]
+        with self.assertLogs(level="ERROR"):
+            snapshots = list(search_journals(paths, "Task 1", limit))
+
+        # one snapshot per journal searched, each the best so far
+        self.assertEqual(len(self.paths), len(snapshots))
+        for hits in snapshots:
+            self.assertLessEqual(len(hits), limit)
+            self.assertEqual(sorted(hits, key=lambda hit: hit.key), hits)
+        self.assertEqual(
+            [hit.key for hit in sequential], [hit.key for hit in snapshots[-1]]
+        )
+
+    def test_read_only(self):
+        # searching waits on no writer
+        other = sqlite3.connect(str(self.paths[1]))
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            self.assertEqual(5, len(search_journal(self.paths[1], "Task 3", 5)))
+        finally:
+            other.close()
+
+        # and leaves journals of other versions as they were
+        other_path = self.paths[0].with_name("other.db")
+        create_new_database(str(other_path))
+        conn = sqlite3.connect(str(other_path))
+        conn.execute(f"PRAGMA user_version = {latest_schema_version() + 1}")
+        conn.close()
+        contents = other_path.read_bytes()
+        with self.assertRaisesRegex(ValueError, "schema version"):
+            search_journal(other_path, "Task", 5)
+        with self.assertLogs(level="ERROR"):
+            results = list(search_journals([other_path, self.paths[0]], "Task 3", 5))
+        self.assertEqual(1, len(results))
+        self.assertEqual(contents, other_path.read_bytes())
+        other_path.unlink()
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = search_journals(self.paths, "Task 7", 5, executor=executor)
+            first = next(results)
+            self.assertEqual(5, len(first))
+            # stopping early cancels what hasn't started
+            results.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
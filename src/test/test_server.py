@@ -0,0 +1,172 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+
+from handleit.client import JournalClient, RemoteError, load_test
+from handleit.core import CoreTaskList, Journal
+from handleit.io.sqlite import create_new_database
+from handleit.server import INVALID_PARAMS, METHOD_NOT_FOUND, JournalServer
+
+from test.test_query_plans import populate_large_db
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        directory = Path(self.temp_dir.name)
+        self.socket_path = directory / "journal.sock"
+        self.db_path = directory / "journal.db"
+        create_new_database(str(self.db_path))
+        conn = sqlite3.connect(str(self.db_path))
+        populate_large_db(conn, 1000, n_lists=5, n_tags=10)
+        conn.close()
+        self.journal = Journal(self.db_path)
+
+    def serve(self, scenario) -> None:
+        """ Run a blocking scenario against the server on the event loop's thread pool """
+
+        async def run():
+            server = JournalServer(self.db_path)
+            await server.start(self.socket_path)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(None, scenario)
+            finally:
+                await server.stop()
+
+        return asyncio.run(run())
+
+    def test_calls(self):
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+
+        def scenario():
+            with JournalClient(self.socket_path) as client:
+                task_id = client.call(
+                    "add_task",
+                    description="Paint shed",
+                    tags=["home"],
+                    due="2020-07-01",
+                )
+                task = client.call("get_task", task_id=task_id)
+                self.assertEqual("Paint shed", task["description"])
+                self.assertEqual(["home"], task["tags"])
+                self.assertEqual(pending + 1, client.call("count", list="pending"))
+                client.call("complete", task_ids=[task_id])
+                self.assertIn(
+                    task_id,
+                    [t["id"] for t in client.call("search", text="Paint shed")],
+                )
+                self.assertEqual(pending, client.call("count"))
+
+                with self.assertRaises(RemoteError) as raised:
+                    client.call("frobnicate")
+                self.assertEqual(METHOD_NOT_FOUND, raised.exception.code)
+                # the undo history is shared, so it isn't served
+                with self.assertRaises(RemoteError) as raised:
+                    client.call("undo")
+                self.assertEqual(METHOD_NOT_FOUND, raised.exception.code)
+                with self.assertRaises(RemoteError) as raised:
+                    client.call("count", list="elsewhere")
+                self.assertEqual(INVALID_PARAMS, raised.exception.code)
+                with self.assertRaises(RemoteError):
+                    client.call("complete", task_ids=[99999])
+                # the connection is still good
+                self.assertEqual(5, len(client.call("lists")))
+
+        self.serve(scenario)
+        self.assertFalse(self.socket_path.exists())
+
+    def test_batch_request(self):
+        def scenario():
+            with JournalClient(self.socket_path) as client:
+                requests = [
+                    {"jsonrpc": "2.0", "id": 1, "method": "count"},
+                    {
+                        "jsonrpc": "2.0",
+                        "method": "add_task",
+                        "params": {"description": "Quietly"},
+                    },
+                    {"jsonrpc": "2.0", "id": 2, "method": "nothing"},
+                ]
+                client._file.write(json.dumps(requests).encode() + b"\n")
+                client._file.flush()
+                responses = json.loads(client._file.readline())
+                self.assertEqual([1, 2], [response["id"] for response in responses])
+                self.assertIn("result", responses[0])
+                self.assertEqual(METHOD_NOT_FOUND, responses[1]["error"]["code"])
+                self.assertEqual(1, len(client.call("search", text="Quietly")))
+
+        self.serve(scenario)
+
+    def test_reads_while_locked(self):
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+        other = sqlite3.connect(str(self.db_path), check_same_thread=False)
+
+        def scenario():
+            with JournalClient(self.socket_path) as reader, JournalClient(
+                self.socket_path
+            ) as writer, ThreadPoolExecutor(max_workers=1) as pool:
+                other.execute("BEGIN IMMEDIATE")
+                added = pool.submit(writer.call, "add_task", description="Patiently")
+                # reads are answered while the write waits for the lock
+                self.assertEqual(pending, reader.call("count"))
+                self.assertFalse(added.done())
+                other.commit()
+                task_id = added.result(timeout=10)
+                self.assertEqual(
+                    "Patiently", reader.call("get_task", task_id=task_id)["description"]
+                )
+
+        try:
+            self.serve(scenario)
+        finally:
+            other.close()
+
+    def test_group_commits(self):
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+        n_clients, n_requests = 16, 100
+
+        async def run():
+            server = JournalServer(self.db_path)
+            await server.start(self.socket_path)
+            try:
+                return await load_test(
+                    self.socket_path, n_clients, n_requests, write_ratio=0.5
+                )
+            finally:
+                await server.stop()
+
+        results = asyncio.run(run())
+        # concurrent writes share commits, and none are lost
+        self.assertGreater(results["writes_per_commit"], 1)
+        added = self.journal.get_list_count(CoreTaskList.PENDING) - pending
+        self.assertGreater(added, n_clients * n_requests * 0.4)
+        self.assertEqual(
+            added,
+            self.journal._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE description LIKE 'Load test %'"
+            ).fetchone()[0],
+        )
+
+    def test_one_server_per_socket(self):
+        async def run():
+            server = JournalServer(self.db_path)
+            await server.start(self.socket_path)
+            try:
+                with self.assertRaisesRegex(RuntimeError, "already served"):
+                    await JournalServer(self.db_path).start(self.socket_path)
+            finally:
+                await server.stop()
+
+        asyncio.run(run())
+
+    def tearDown(self):
+        self.journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
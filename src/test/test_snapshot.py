@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+from handleit.core import CoreTaskList, Journal
+from handleit.io import snapshot
+from handleit.io.sqlite import create_new_database
+
+from test.test_core import populate_test_db
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.temp_dir.name) / "journal.db"
+        create_new_database(str(self.db_path))
+        populate_test_db(str(self.db_path))
+        self.journal = Journal(self.db_path)
+
+    def test_round_trip(self):
+        overview = self.journal.get_overview(CoreTaskList.PENDING)
+        snapshot.write_snapshot(self.db_path, overview)
+        loaded = snapshot.read_snapshot(self.db_path)
+
+        self.assertIsNotNone(loaded)
+        self.assertEqual(CoreTaskList.PENDING, loaded.list_id)
+        self.assertEqual(overview.counts, loaded.counts)
+        self.assertEqual(
+            [(l.list_id, l.name, l.icon, l.position) for l in overview.lists],
+            [(l.list_id, l.name, l.icon, l.position) for l in loaded.lists],
+        )
+        for expected, task in zip(overview.tasks, loaded.tasks):
+            self.assertEqual(expected.task_id, task.task_id)
+            self.assertEqual(expected.description, task.description)
+            self.assertEqual(expected.notes, task.notes)
+            self.assertEqual(expected.priority, task.priority)
+            self.assertEqual(expected.creation_time, task.creation_time)
+            self.assertEqual(expected.start_time, task.start_time)
+            self.assertEqual(expected.due_time, task.due_time)
+            self.assertEqual(set(expected.tags), task.tags)
+            self.assertEqual(expected.lists, task.lists)
+        self.assertEqual(
+            min(len(overview.tasks), snapshot.PAGE_SIZE), len(loaded.tasks)
+        )
+
+    def test_stale_snapshot_is_ignored(self):
+        snapshot.write_snapshot(self.db_path, self.journal.get_overview())
+        self.journal.add_task("Invalidate the snapshot")
+        # make sure the modification time moves even on coarse clocks
+        stat = self.db_path.stat()
+        os.utime(self.db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertIsNone(snapshot.read_snapshot(self.db_path))
+
+    def test_missing_or_corrupt_snapshot(self):
+        self.assertIsNone(snapshot.read_snapshot(self.db_path))
+        snapshot.snapshot_path(self.db_path).write_bytes(b"HISN\x01")
+        self.assertIsNone(snapshot.read_snapshot(self.db_path))
+        snapshot.snapshot_path(self.db_path).write_bytes(b"")
+        self.assertIsNone(snapshot.read_snapshot(self.db_path))
+
+    def tearDown(self):
+        self.journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import Dict
+import unittest
+
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+# for slow tests timing the code, e.g. against wall clock budgets that only
+# hold on an idle machine, so left out unless HANDLEIT_BENCHMARKS is set
+benchmark = unittest.skipUnless(
+    os.environ.get("HANDLEIT_BENCHMARKS"), "set HANDLEIT_BENCHMARKS to run benchmarks"
+)
+
+# modules that must stay importable on a headless system without PyGObject
+HEADLESS_MODULES = (
+    "handleit.cli",
+    "handleit.core",
+    "handleit.io.sqlite",
+    "handleit.search",
+    "handleit.startup",
+)
+
+# cumulative import budget per headless module, in microseconds
+IMPORT_BUDGET_US = 250_000
+
+
+def import_times(*modules: str) -> Dict[str, int]:
+    """ Import modules in a fresh interpreter and return cumulative import times """
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.times = import_times(*HEADLESS_MODULES)
+
+    def test_headless_import_skips_gi(self):
+        self.assertNotIn("gi", self.times)
+        self.assertFalse(any(name.startswith("gi.") for name in self.times))
+
+    def test_headless_import_budget(self):
+        for module in HEADLESS_MODULES:
+            self.assertLess(
+                self.times[module],
+                IMPORT_BUDGET_US,
+                msg=f"Importing {module} took {self.times[module] / 1000:.1f} ms",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
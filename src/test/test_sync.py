@@ -0,0 +1,367 @@
+from datetime import datetime, timedelta, timezone
+import io
+from pathlib import Path
+import random
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from handleit.core import ChangeOperation, Journal, TaskRelationship
+from handleit.io.jsonl import export_jsonl, import_jsonl
+from handleit.io.sqlite import create_new_database
+from handleit.sync import pull_changes, sync_files, sync_journals
+
+from test.test_core import populate_test_db
+from test.test_query_plans import populate_large_db
+
+
+def journal_state(journal: Journal) -> dict:
+    """ Everything sync keeps the same across journals, by uid rather than ID """
+    conn = journal._conn
+    queries = {
+        "tasks": "SELECT uid, description, notes, priority, creation_ts, completion_ts, due_ts, start_ts, is_trashed FROM tasks",
+        "lists": "SELECT uid, name, icon FROM lists",
+        "tags": "SELECT uid, name, color FROM tags",
+        "task_lists": "SELECT lists.uid, tasks.uid FROM task_lists JOIN lists USING (list_id) JOIN tasks USING (task_id)",
+        "task_tags": "SELECT tasks.uid, tags.uid FROM task_tags JOIN tasks USING (task_id) JOIN tags USING (tag_id)",
+        "task_attributes": "SELECT tasks.uid, attr_key, attr_type, attr_value FROM task_attributes JOIN tasks USING (task_id)",
+        "task_relations": "SELECT a.uid, b.uid, relationship FROM task_relations JOIN tasks a ON a.task_id = task_from_id JOIN tasks b ON b.task_id = task_to_id",
+        "notifications": "SELECT tasks.uid, dtm FROM notifications JOIN tasks USING (task_id)",
+    }
+    state = {
+        name: sorted(tuple(row) for row in conn.execute(sql))
+        for name, sql in queries.items()
+    }
+    state["order"] = [
+        row[0] for row in conn.execute("SELECT uid FROM tasks ORDER BY position")
+    ]
+    return state
+
+
+def new_journal() -> Journal:
+    conn = sqlite3.connect(":memory:")
+    create_new_database(conn)
+    return Journal(conn)
+
+
+class TestChangeLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+
+    def test_changes_since(self):
+        journal = self.journal
+        seq = journal.change_seq
+        task_id = journal.add_task("Paint shed", priority=1)
+        journal.update_task(task_id, new_priority=3, new_description="Paint shed")
+        journal.update_task(task_id, new_priority=3)
+        journal.add_task_tag(task_id, "work")
+        journal.delete_task(task_id)
+
+        changes = list(journal.changes_since(seq))
+        self.assertEqual(
+            [
+                ("tasks", ChangeOperation.INSERT),
+                ("tasks", ChangeOperation.UPDATE),
+                ("task_tags", ChangeOperation.INSERT),
+                ("task_tags", ChangeOperation.DELETE),
+                ("tasks", ChangeOperation.DELETE),
+            ],
+            [(change.table, change.operation) for change in changes],
+        )
+        insert, update, tag, _, delete = changes
+        uid = insert.key[0]
+        self.assertEqual("Paint shed", insert.data["description"])
+        # only the columns that changed
+        self.assertEqual({"priority": 3}, update.data)
+        self.assertEqual({"priority": 1}, update.old)
+        self.assertEqual((uid, "tag:work"), tag.key)
+        self.assertEqual("Paint shed", delete.old["description"])
+        self.assertEqual({journal.origin}, {change.origin for change in changes})
+        self.assertEqual(
+            sorted(change.seq for change in changes), [c.seq for c in changes]
+        )
+        self.assertEqual(
+            sorted(change.timestamp for change in changes),
+            [c.timestamp for c in changes],
+        )
+        self.assertEqual(changes[3:], list(journal.changes_since(changes[2].seq)))
+        self.assertEqual([], list(journal.changes_since(journal.change_seq)))
+
+    def test_existing_rows_logged(self):
+        journal = new_journal()
+        self.assertEqual([], list(journal.changes_since()))
+        # the fixture's rows, every one logged as inserted
+        tables = {}
+        for change in self.journal.changes_since():
+            if change.operation == ChangeOperation.INSERT:
+                tables[change.table] = tables.get(change.table, 0) + 1
+        self.assertEqual(18, tables["tasks"])
+        self.assertEqual(6, tables["lists"])
+        self.assertEqual(15, tables["task_tags"])
+
+    def test_compact_changes(self):
+        journal = self.journal
+        seq = journal.change_seq
+        task_id = journal.add_task("Paint", priority=1)
+        journal.update_task(task_id, new_priority=2)
+        journal.update_task(task_id, new_priority=3, new_description="Paint shed")
+        gone_id = journal.add_task("Gone")
+        journal.add_task_tag(gone_id, "work")
+        journal.delete_task(gone_id)
+        later = datetime.now(timezone.utc) + timedelta(minutes=1)
+
+        # changes that can still be undone are kept
+        self.assertEqual(0, journal.compact_changes(timedelta(0), later))
+        # and so are recent ones
+        fresh = Journal(self.temp_db)
+        self.assertEqual(0, fresh.compact_changes(timedelta(days=1)))
+
+        self.assertEqual(3, fresh.compact_changes(timedelta(0), later))
+        changes = list(fresh.changes_since(seq))
+        self.assertEqual(
+            [
+                ("tasks", ChangeOperation.INSERT),
+                ("tasks", ChangeOperation.UPDATE),
+                ("task_tags", ChangeOperation.DELETE),
+                ("tasks", ChangeOperation.DELETE),
+            ],
+            [(change.table, change.operation) for change in changes],
+        )
+        self.assertEqual({"priority": 3, "description": "Paint shed"}, changes[1].data)
+        # the journal catches up from the compacted log all the same
+        copy = new_journal()
+        pull_changes(journal, copy)
+        self.assertEqual(journal_state(journal), journal_state(copy))
+        self.assertTrue(journal.undo())
+        with journal.transaction():
+            with self.assertRaises(RuntimeError):
+                journal.compact_changes(timedelta(0))
+        copy.close()
+
+    def test_bulk_import_logged(self):
+        export = io.StringIO()
+        export_jsonl(self.journal, export)
+        journal = new_journal()
+        # imports into an empty journal log their rows a table at a time
+        import_jsonl(journal, io.StringIO(export.getvalue()))
+        self.assertEqual(
+            0,
+            journal._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE uid IS NULL"
+            ).fetchone()[0],
+        )
+        copy = new_journal()
+        pull_changes(journal, copy)
+        self.assertEqual(journal_state(journal), journal_state(copy))
+        # and every row added after is logged as it is
+        journal.add_task_tag(journal.add_task("Paint shed"), "home")
+        self.assertEqual(3, pull_changes(journal, copy))
+        self.assertEqual(journal_state(journal), journal_state(copy))
+        # the import is undone like any other change
+        while journal.undo():
+            pass
+        self.assertEqual([], list(journal.iter_tasks()))
+        copy.close()
+        journal.close()
+
+    def test_reset_origin(self):
+        origin = self.journal.origin
+        self.journal.reset_origin()
+        self.assertNotEqual(origin, self.journal.origin)
+        task_id = self.journal.add_task("New")
+        self.assertEqual(
+            self.journal.origin, list(self.journal.changes_since())[-1].origin
+        )
+        self.journal.delete_task(task_id)
+
+    def tearDown(self):
+        self.journal.close()
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        directory = Path(self.temp_dir.name)
+        self.paths = [directory / "desktop.db", directory / "phone.db"]
+        for path in self.paths:
+            create_new_database(str(path))
+        populate_test_db(str(self.paths[0]))
+        sync_files(*self.paths)
+        self.desktop, self.phone = (Journal(path) for path in self.paths)
+
+    def uid_task(self, journal: Journal, uid: str) -> int:
+        return journal._conn.execute(
+            "SELECT task_id FROM tasks WHERE uid = ?", (uid,)
+        ).fetchone()[0]
+
+    def counterpart(self, task_id: int) -> int:
+        """ The phone's ID of a desktop task """
+        uid = self.desktop._conn.execute(
+            "SELECT uid FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()[0]
+        return self.uid_task(self.phone, uid)
+
+    def test_initial_sync(self):
+        self.assertEqual(journal_state(self.desktop), journal_state(self.phone))
+        self.assertEqual(18, len(list(self.phone.iter_tasks())))
+        # nothing changed since
+        self.assertEqual((0, 0), sync_journals(self.desktop, self.phone))
+
+    def test_only_deltas(self):
+        seq = self.phone.change_seq
+        self.desktop.update_task(1, new_description="Call mom back")
+        self.assertEqual((1, 0), sync_journals(self.phone, self.desktop))
+        self.assertEqual(
+            "Call mom back", self.phone.get_task(self.counterpart(1)).description
+        )
+        self.assertEqual(1, len(list(self.phone.changes_since(seq))))
+        # the phone doesn't send the change back
+        self.assertEqual(0, pull_changes(self.phone, self.desktop))
+
+    def test_last_writer_wins_per_field(self):
+        phone_id = self.counterpart(2)
+        self.desktop.update_task(2, new_description="Buy food")
+        self.phone.update_task(phone_id, new_priority=3)
+        time.sleep(0.01)
+        self.phone.update_task(phone_id, new_description="Buy groceries today")
+        sync_journals(self.desktop, self.phone)
+
+        for journal, task_id in ((self.desktop, 2), (self.phone, phone_id)):
+            task = journal.get_task(task_id)
+            self.assertEqual("Buy groceries today", task.description)
+            self.assertEqual(3, task.priority)
+        self.assertEqual(journal_state(self.desktop), journal_state(self.phone))
+
+    def test_delete_wins_over_edits(self):
+        phone_id = self.counterpart(16)
+        self.phone.update_task(phone_id, new_priority=2)
+        self.phone.add_task_tag(phone_id, "@phone")
+        time.sleep(0.01)
+        self.desktop.delete_task(16)
+        sync_journals(self.desktop, self.phone)
+
+        self.assertIsNone(self.phone.get_task(phone_id))
+        self.assertEqual(journal_state(self.desktop), journal_state(self.phone))
+
+    def test_same_tag_added_to_both(self):
+        self.desktop.add_task_tag(1, "urgent")
+        self.phone.add_task_tag(self.counterpart(2), "urgent")
+        sync_journals(self.desktop, self.phone)
+
+        # tags are named after their name, so they're one and the same
+        for journal in (self.desktop, self.phone):
+            self.assertEqual(2, len(journal.get_tasks_by_tags(all_of=["urgent"])))
+        self.assertEqual(journal_state(self.desktop), journal_state(self.phone))
+
+    def test_same_origin(self):
+        with self.assertRaisesRegex(ValueError, "reset_origin"):
+            sync_journals(self.desktop, self.desktop)
+
+    def tearDown(self):
+        self.desktop.close()
+        self.phone.close()
+        self.temp_dir.cleanup()
+
+
+class TestConcurrentEdits(unittest.TestCase):
+    n_rounds = 3
+    n_edits = 700
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        directory = Path(self.temp_dir.name)
+        paths = [directory / "desktop.db", directory / "phone.db"]
+        for path in paths:
+            create_new_database(str(path))
+        conn = sqlite3.connect(str(paths[0]))
+        populate_large_db(conn, 300, n_lists=5, n_tags=10)
+        conn.close()
+        self.journals = [Journal(path) for path in paths]
+        for journal in self.journals:
+            journal._conn.execute("PRAGMA synchronous = OFF")
+
+    def edit(self, journal: Journal, rng: random.Random) -> None:
+        """ Make one random change through the Journal API """
+        conn = journal._conn
+        task_ids = [row[0] for row in conn.execute("SELECT task_id FROM tasks")]
+        list_ids = [row[0] for row in conn.execute("SELECT list_id FROM lists")]
+        task_id = rng.choice(task_ids)
+        other_id = rng.choice(task_ids)
+        roll = rng.randrange(12)
+        if roll == 0:
+            journal.add_task(f"New task {rng.random()}", priority=rng.randint(-1, 3))
+        elif roll == 1:
+            journal.update_task(task_id, new_description=f"Edited {rng.random()}")
+        elif roll == 2:
+            journal.update_task(
+                task_id,
+                new_priority=rng.randint(-1, 5),
+                new_due_time=datetime(2020, 7, 1, tzinfo=timezone.utc)
+                + timedelta(hours=rng.randrange(1000)),
+            )
+        elif roll == 3:
+            journal.update_task(task_id, new_completion_time=datetime.now(timezone.utc))
+        elif roll == 4:
+            journal.update_task(task_id, is_trashed=rng.random() < 0.5)
+        elif roll == 5 and rng.random() < 0.3:
+            journal.delete_task(task_id)
+        elif roll == 6:
+            tag = f"tag-{rng.randrange(15)}"
+            if tag in journal.get_task(task_id).tags:
+                journal.delete_task_tag(task_id, tag)
+            else:
+                journal.add_task_tag(task_id, tag)
+        elif roll == 7 and list_ids:
+            list_id = rng.choice(list_ids)
+            if list_id in journal.get_task(task_id).lists:
+                journal.delete_task_from_list(task_id, list_id)
+            else:
+                journal.add_task_to_list(task_id, list_id)
+        elif roll == 8:
+            value = rng.choice([rng.randrange(10), rng.random(), "text", True])
+            if "estimate" in journal.get_task(task_id).attributes:
+                journal.update_task_attribute(task_id, "estimate", value)
+            else:
+                journal.add_task_attribute(task_id, "estimate", value)
+        elif roll == 9 and task_id != other_id:
+            relationship = rng.choice(list(TaskRelationship))
+            if relationship in journal.get_task_relationships(task_id, other_id):
+                journal.delete_task_relationship(task_id, other_id, relationship)
+            else:
+                journal.add_task_relationship(task_id, other_id, relationship)
+        elif roll == 10:
+            journal.move_task(task_id, after=other_id)
+        elif roll == 11:
+            if rng.random() < 0.1:
+                journal.add_list(f"List {rng.random()}")
+            elif rng.random() < 0.5:
+                journal.add_notification(
+                    task_id,
+                    datetime(2020, 7, 1, tzinfo=timezone.utc)
+                    + timedelta(minutes=rng.randrange(100)),
+                )
+
+    def test_concurrent_edits(self):
+        desktop, phone = self.journals
+        sync_journals(desktop, phone)
+        self.assertEqual(journal_state(desktop), journal_state(phone))
+        rng = random.Random(0)
+        for _ in range(self.n_rounds):
+            for _ in range(self.n_edits):
+                self.edit(rng.choice(self.journals), rng)
+            sync_journals(desktop, phone)
+            self.assertEqual(journal_state(desktop), journal_state(phone))
+            self.assertEqual((0, 0), sync_journals(desktop, phone))
+
+    def tearDown(self):
+        for journal in self.journals:
+            journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+from datetime import datetime, timezone
+import sqlite3
+import unittest
+
+from handleit.core import CoreTaskList, Journal, TaskRelationship
+from handleit.io.sqlite import create_new_database
+
+from test.test_core import populate_test_db
+from test.test_query_plans import populate_large_db
+from test.test_sync import journal_state, new_journal
+
+
+class TestUndo(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = sqlite3.connect(":memory:")
+        create_new_database(self.temp_db)
+        populate_test_db(self.temp_db)
+        self.journal = Journal(self.temp_db)
+
+    def find_task(self, description: str) -> int:
+        return self.journal._conn.execute(
+            "SELECT task_id FROM tasks WHERE description = ?", (description,)
+        ).fetchone()[0]
+
+    def test_undo_and_redo(self):
+        journal = self.journal
+        self.assertFalse(journal.can_undo)
+        self.assertFalse(journal.undo())
+        before = journal_state(journal)
+
+        task_id = journal.add_task("Paint shed", priority=1)
+        journal.update_task(task_id, new_priority=3)
+        self.assertTrue(journal.undo())
+        self.assertEqual(1, journal.get_task(task_id).priority)
+        self.assertTrue(journal.undo())
+        self.assertIsNone(journal.get_task(task_id))
+        self.assertEqual(before, journal_state(journal))
+
+        self.assertTrue(journal.redo())
+        self.assertTrue(journal.redo())
+        self.assertFalse(journal.can_redo)
+        self.assertEqual(3, journal.get_task(self.find_task("Paint shed")).priority)
+
+    def test_undo_within_transaction(self):
+        journal = self.journal
+        before = journal_state(journal)
+        journal.add_task("Paint shed")
+        after = journal_state(journal)
+        with self.assertRaises(ZeroDivisionError):
+            with journal.transaction():
+                journal.add_task("Sand shed")
+                with self.assertRaises(RuntimeError):
+                    journal.undo()
+                with self.assertRaises(RuntimeError):
+                    journal.redo()
+                1 / 0
+        self.assertEqual(after, journal_state(journal))
+        self.assertTrue(journal.undo())
+        self.assertEqual(before, journal_state(journal))
+
+    def test_undo_delete_task(self):
+        journal = self.journal
+        task_id = self.find_task("Learn Spanish")
+        journal.add_task_attribute(task_id, "estimate", 2.5)
+        journal.add_task_relationship(task_id, 1, TaskRelationship.DEPENDENCY)
+        journal.add_notification(task_id, journal.get_task(1).creation_time)
+        before = journal_state(journal)
+
+        journal.delete_task(task_id)
+        # the task, its lists, tags, attributes, relations, and notifications
+        self.assertTrue(journal.undo())
+        self.assertEqual(before, journal_state(journal))
+        task = journal.get_task(self.find_task("Learn Spanish"))
+        self.assertEqual({"estimate": 2.5}, task.attributes)
+
+    def test_undo_move_task(self):
+        journal = self.journal
+        before = journal_state(journal)
+        journal.move_task(2, after=5)
+        journal.move_task(5, before=1)
+        journal.undo()
+        journal.undo()
+        self.assertEqual(before, journal_state(journal))
+
+    def test_undo_bulk_update(self):
+        journal = self.journal
+        before = journal_state(journal)
+        pending = [task for task in journal.iter_tasks() if not task.completion_time]
+        with journal._transaction():
+            # changed twice within one transaction
+            journal.update_task(pending[0].task_id, new_description="Renamed")
+            journal.update_task(pending[0].task_id, new_description="Renamed again")
+            journal.add_task_tag(pending[0].task_id, "renamed")
+            for task in pending:
+                journal.update_task(
+                    task.task_id, new_completion_time=datetime.now(timezone.utc)
+                )
+        self.assertEqual(0, journal.get_list_count(CoreTaskList.PENDING))
+
+        self.assertTrue(journal.undo())
+        self.assertEqual(before, journal_state(journal))
+        self.assertFalse(journal.can_undo)
+
+    def test_new_change_clears_redo(self):
+        journal = self.journal
+        journal.add_task("First")
+        journal.undo()
+        self.assertTrue(journal.can_redo)
+        journal.add_task("Second")
+        self.assertFalse(journal.can_redo)
+        # reading doesn't count as a change
+        journal.get_list_tasks(CoreTaskList.PENDING)
+        journal.undo()
+        self.assertFalse(journal.can_undo)
+
+    def test_undo_limit(self):
+        journal = self.journal
+        for n in range(journal.undo_limit + 10):
+            journal.add_task(f"Task {n}")
+        undone = 0
+        while journal.undo():
+            undone += 1
+        self.assertEqual(journal.undo_limit, undone)
+        self.assertIsNotNone(self.find_task("Task 9"))
+
+    def test_sync_clears_history(self):
+        self.journal.add_task("Local")
+        other = new_journal()
+        other.add_task("Remote")
+        self.journal.apply_changes(other.changes_since())
+        self.assertFalse(self.journal.can_undo)
+        other.close()
+
+    def test_undo_import(self):
+        source = new_journal()
+        populate_large_db(source._conn, 5000, n_lists=5, n_tags=10)
+        journal = self.journal
+        before = journal_state(journal)
+        journal.import_records(source.export_records())
+        imported = journal_state(journal)
+
+        self.assertTrue(journal.undo())
+        self.assertEqual(before, journal_state(journal))
+        self.assertTrue(journal.redo())
+        self.assertEqual(imported, journal_state(journal))
+        source.close()
+
+    def tearDown(self):
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
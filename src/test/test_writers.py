@@ -0,0 +1,205 @@
+import multiprocessing
+from pathlib import Path
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Tuple
+import unittest
+
+from handleit.core import CoreTaskList, Journal
+from handleit.io.sqlite import create_new_database
+
+from test.test_query_plans import populate_large_db
+from test.test_startup import benchmark
+
+
+def _increment(journal: Journal, counter_id: int, description: str) -> None:
+    """ Read-modify-write the counter task's priority, adding a task alongside """
+    with journal.transaction():
+        priority = journal.get_task(counter_id).priority
+        journal.update_task(counter_id, new_priority=priority + 1)
+        journal.add_task(description)
+
+
+def _write(path, writer, n_updates, counter_id, start, results) -> None:
+    journal = Journal(Path(path))
+    start.wait()
+    for i in range(n_updates):
+        journal.retrying(_increment, journal, counter_id, f"Writer {writer} task {i}")
+    journal.close()
+    results.put(("writes", n_updates))
+
+
+def _add(path, writer, n_tasks, start, results) -> None:
+    journal = Journal(Path(path))
+    start.wait()
+    task_ids = [
+        journal.retrying(journal.add_task, f"Writer {writer} task {i}")
+        for i in range(n_tasks)
+    ]
+    journal.close()
+    results.put(task_ids)
+
+
+def _read(path, start, stop, results) -> None:
+    journal = Journal(Path(path))
+    start.wait()
+    reads = 0
+    while not stop.is_set():
+        journal.get_list_count(CoreTaskList.PENDING)
+        journal.get_list_tasks(CoreTaskList.PENDING, limit=50)
+        journal.search_tasks("Writer 1")
+        reads += 3
+    journal.close()
+    results.put(("reads", reads))
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.temp_dir.name) / "journal.db"
+        create_new_database(str(self.db_path))
+        conn = sqlite3.connect(str(self.db_path))
+        populate_large_db(conn, 1000, n_lists=5, n_tags=10)
+        conn.close()
+        self.journal = Journal(self.db_path)
+
+    def test_retrying(self):
+        self.journal.close()
+        self.journal = Journal(self.db_path, busy_timeout=0.05)
+        other = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        other.execute("BEGIN IMMEDIATE")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+            self.journal.add_task("Too soon")
+        self.assertFalse(self.journal.can_undo)
+
+        # the lock is let go while retrying waits
+        threading.Timer(0.1, other.commit).start()
+        task_id = self.journal.retrying(self.journal.add_task, "Eventually")
+        other.close()
+        self.assertEqual("Eventually", self.journal.get_task(task_id).description)
+        self.assertTrue(self.journal.undo())
+        self.assertIsNone(self.journal.get_task(task_id))
+
+        calls = []
+
+        def locked():
+            calls.append(None)
+            raise sqlite3.OperationalError("database is locked")
+
+        self.journal.retry_delay = 0.001
+        with self.assertRaises(sqlite3.OperationalError):
+            self.journal.retrying(locked)
+        self.assertEqual(self.journal.busy_retries, len(calls))
+        # nested in a transaction, it's the transaction to retry
+        calls.clear()
+        with self.journal.transaction():
+            with self.assertRaises(sqlite3.OperationalError):
+                self.journal.retrying(locked)
+        self.assertEqual(1, len(calls))
+
+    def run_processes(
+        self, n_writers: int, n_readers: int, n_updates: int, counter_id: int
+    ) -> Tuple[Dict[str, int], float]:
+        """ Update a counter from writer processes with readers alongside, returning their totals and how long the writers took """
+        context = multiprocessing.get_context("spawn")
+        # let everyone go at once, when all are ready
+        start = context.Barrier(n_writers + n_readers + 1)
+        stop, results = context.Event(), context.Queue()
+        writers = [
+            context.Process(
+                target=_write,
+                args=(str(self.db_path), i, n_updates, counter_id, start, results),
+            )
+            for i in range(n_writers)
+        ]
+        readers = [
+            context.Process(
+                target=_read, args=(str(self.db_path), start, stop, results)
+            )
+            for _ in range(n_readers)
+        ]
+        for process in writers + readers:
+            process.start()
+        start.wait()
+        started = time.perf_counter()
+        for process in writers:
+            process.join()
+        seconds = time.perf_counter() - started
+        stop.set()
+        for process in readers:
+            process.join()
+        totals = {"writes": 0, "reads": 0}
+        for _ in range(n_writers + n_readers):
+            kind, count = results.get(timeout=10)
+            totals[kind] += count
+
+        for process in writers + readers:
+            self.assertEqual(0, process.exitcode)
+        return totals, seconds
+
+    def test_processes(self):
+        n_writers, n_updates = 4, 50
+        counter_id = self.journal.add_task("Counter")
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+        totals, _ = self.run_processes(n_writers, 4, n_updates, counter_id)
+
+        # no update was lost to another writer's
+        self.assertEqual(n_writers * n_updates, totals["writes"])
+        self.assertEqual(
+            n_writers * n_updates, self.journal.get_task(counter_id).priority
+        )
+        self.assertEqual(
+            pending + n_writers * n_updates,
+            self.journal.get_list_count(CoreTaskList.PENDING),
+        )
+
+    @benchmark
+    def test_throughput(self):
+        counter_id = self.journal.add_task("Counter")
+        totals, seconds = self.run_processes(4, 4, 100, counter_id)
+        writes, reads = totals["writes"] / seconds, totals["reads"] / seconds
+        report = (
+            f"Made {writes:.0f} writes/s from 4 processes "
+            f"while 4 others made {reads:.0f} reads/s"
+        )
+        # each write is a read-modify-write transaction of its own
+        self.assertGreater(writes, 20, msg=report)
+        # and readers aren't starved by the writers
+        self.assertGreater(reads, writes, msg=report)
+
+    def test_adding_tasks(self):
+        n_writers, n_tasks = 4, 50
+        pending = self.journal.get_list_count(CoreTaskList.PENDING)
+
+        context = multiprocessing.get_context("spawn")
+        start, results = context.Event(), context.Queue()
+        writers = [
+            context.Process(
+                target=_add, args=(str(self.db_path), i, n_tasks, start, results)
+            )
+            for i in range(n_writers)
+        ]
+        for process in writers:
+            process.start()
+        start.set()
+        task_ids = [task_id for _ in writers for task_id in results.get(timeout=60)]
+        for process in writers:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+
+        # every task got an ID of its own
+        self.assertEqual(n_writers * n_tasks, len(set(task_ids)))
+        self.assertEqual(
+            pending + n_writers * n_tasks,
+            self.journal.get_list_count(CoreTaskList.PENDING),
+        )
+
+    def tearDown(self):
+        self.journal.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()